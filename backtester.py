@@ -1,8 +1,33 @@
 # backtester.py
+import time
 from backtesting import Backtest
 import pandas as pd
 
-def run_backtest(data_df: pd.DataFrame, strategy_class, cash=100000, commission=0.001, plot_results=True):
+def print_profile_report(profile):
+    """以易讀的格式打印 run_backtest(..., profile=True) 返回的 stats['_profile']。"""
+    phases = profile['phases_seconds']
+    total = phases.get('total') or sum(phases.values())
+    print("階段耗時:")
+    for phase, seconds in phases.items():
+        print(f"  {phase:<10} {seconds:9.4f} 秒 ({seconds / total:6.1%})")
+    latency = profile['next_latency_us']
+    if latency['count']:
+        print(f"next() 延遲 (微秒, {latency['count']} 次): p50 {latency['p50']:.1f}, p90 {latency['p90']:.1f}, "
+              f"p99 {latency['p99']:.1f}, 最大 {latency['max']:.1f}")
+    histogram = profile['next_latency_histogram']
+    edges = histogram['bin_edges_us']
+    for low, high, count in zip(edges[:-1], edges[1:], histogram['counts']):
+        if count:
+            print(f"  [{low:g}, {high:g}) 微秒: {count}")
+    print("指標計算耗時:")
+    for label, seconds in profile['indicators_seconds'].items():
+        print(f"  {label:<20} {seconds:.4f} 秒")
+    print("調用統計:")
+    for name, call in profile['calls'].items():
+        print(f"  {name:<10} {call['count']:>8} 次, {call['seconds']:.4f} 秒")
+
+def run_backtest(data_df: pd.DataFrame, strategy_class, cash=100000, commission=0.001, plot_results=False,
+                 result_store=None, symbol=None, timeframe=None, **strategy_params):
     """
     運行回測並返回統計數據。
 
@@ -12,10 +37,14 @@ def run_backtest(data_df: pd.DataFrame, strategy_class, cash=100000, commission=
     - strategy_class (Strategy): 要回測的策略類 (例如 MaCrossStrategy)。
     - cash (float): 初始資金。
     - commission (float): 手續費率 (例如 0.001 代表 0.1%)。
-    - plot_results (bool): 是否繪製回測結果圖表。
+    - plot_results (bool): 是否繪製回測結果圖表。預設不繪製；需要時可用 ResultStore.plot 為選中的運行按需繪圖。
+    - result_store (ResultStore, optional): 傳入時把統計量、權益曲線和交易列表追加到該存儲 (由調用方 flush)。
+    - symbol, timeframe (str, optional): 寫入存儲時記錄的交易對與週期，供之後查詢。
+    - **strategy_params: 覆蓋策略類屬性的參數 (例如 n1=5, n2=30)，會傳給 Backtest.run()。
+                         繼承 BaseStrategy 的策略可傳入 profile=True 開啟計時。
 
     返回:
-    - pd.Series: 回測的統計數據。如果出錯則返回 None。
+    - pd.Series: 回測的統計數據。開啟 profile 時 '_profile' 項為計時報告 (dict)。如果出錯則返回 None。
     """
     if not isinstance(data_df.index, pd.DatetimeIndex):
         print("錯誤: 數據的索引必須是 DatetimeIndex。")
@@ -40,7 +69,18 @@ def run_backtest(data_df: pd.DataFrame, strategy_class, cash=100000, commission=
 
     try:
         bt = Backtest(data_df, strategy_class, cash=cash, commission=commission, exclusive_orders=True)
-        stats = bt.run()
+        start = time.perf_counter()
+        stats = bt.run(**strategy_params)
+        run_seconds = time.perf_counter() - start
+
+        profile_report = getattr(stats['_strategy'], 'profile_report', None)
+        profile = profile_report() if profile_report is not None else None
+        if profile is not None:
+            phases = profile['phases_seconds']
+            phases['total'] = run_seconds
+            # 其餘時間花在 backtesting.py 的逐根數據/指標切片和最後的統計計算上
+            phases['framework'] = run_seconds - phases['init'] - phases['next'] - phases['broker']
+            stats['_profile'] = profile
         
         if plot_results:
             try:
@@ -49,6 +89,9 @@ def run_backtest(data_df: pd.DataFrame, strategy_class, cash=100000, commission=
                 print(f"繪製圖表時發生錯誤 (可能是由於缺少數據點或環境問題): {e}")
                 print("回測統計數據仍會返回。")
 
+        if result_store is not None:
+            result_store.add(stats, strategy_class, strategy_params, data_df, symbol, timeframe, cash, commission)
+
         return stats
     except Exception as e:
         print(f"回測過程中發生錯誤: {e}")
@@ -79,4 +122,12 @@ if __name__ == '__main__':
         print("\nBacktester 測試統計:")
         print(test_stats)
     else:
-        print("Backtester 測試失敗。")
\ No newline at end of file
+        print("Backtester 測試失敗。")
+
+    # 開啟計時，查看時間花在哪個階段
+    from synthetic_data import generate_ohlcv
+    profile_df = generate_ohlcv(20000, 'h', start='2023-01-01', start_price=100.0, volatility=0.01)
+    profiled_stats = run_backtest(profile_df, MaCrossStrategy, plot_results=False, profile=True)
+    if profiled_stats is not None:
+        print("\nBacktester 計時報告:")
+        print_profile_report(profiled_stats['_profile'])
\ No newline at end of file
@@ -0,0 +1,197 @@
+# batch_runner.py
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+import pandas as pd
+
+from config import API_KEY, API_SECRET, EXCHANGE_ID, STRATEGY_PARAMS, BACKTEST_CONFIG, BATCH_CONFIG, DATA_STORE_DIR, \
+    RESAMPLE_BASE_TIMEFRAME, COMPACT_STORE_DIR
+from data_handler import fetch_ohlcv_data, load_data_from_csv, sync_ohlcv_data, load_ohlcv_from_store, \
+    load_resampled_ohlcv
+from data_quality import check_loaded_data
+from compact_store import load_compact, update_compact_from_store
+from exchange_client import get_exchange_client
+from backtester import run_backtest
+from result_store import ResultStore, build_record
+from strategies import STRATEGY_REGISTRY, get_strategy
+
+def resolve_symbols(symbols, exchange_id=EXCHANGE_ID):
+    """
+    展開交易對設定。symbols 為列表時原樣返回；為 '*/USDT' 這樣的字串時，
+    返回交易所上所有活躍的、以該貨幣計價的現貨交易對。
+    """
+    if not isinstance(symbols, str):
+        return list(symbols)
+    quote = symbols.split('/', 1)[1]
+    markets = get_exchange_client(exchange_id, API_KEY, API_SECRET).load_markets()
+    return sorted(symbol for symbol, market in markets.items()
+                  if market.get('quote') == quote and market.get('spot') and market.get('active', True))
+
+# 同一交易對的多個週期共用一個本地分區，同步和重採樣時按交易對加鎖
+_store_locks = {}
+_store_locks_guard = threading.Lock()
+
+def _store_lock(symbol):
+    with _store_locks_guard:
+        return _store_locks.setdefault(symbol, threading.Lock())
+
+def _load_dataset(symbol, timeframe, config):
+    """在加載線程中讀取一個 (交易對, 週期) 的數據，返回 (DataFrame 或 None, 耗時秒數)。"""
+    start = time.perf_counter()
+    data_source = config['data_source']
+    if data_source in ('store', 'compact'):
+        resample = RESAMPLE_BASE_TIMEFRAME and RESAMPLE_BASE_TIMEFRAME != timeframe
+        with _store_lock(symbol):
+            sync_ohlcv_data(symbol, RESAMPLE_BASE_TIMEFRAME if resample else timeframe, exchange_id=EXCHANGE_ID,
+                            api_key=API_KEY, secret_key=API_SECRET, store_dir=DATA_STORE_DIR)
+            if data_source == 'compact':
+                update_compact_from_store(symbol, timeframe, DATA_STORE_DIR, COMPACT_STORE_DIR, EXCHANGE_ID,
+                                          base_timeframe=RESAMPLE_BASE_TIMEFRAME if resample else None)
+                df = load_compact(symbol, timeframe, COMPACT_STORE_DIR, EXCHANGE_ID)
+            elif resample:
+                df = load_resampled_ohlcv(symbol, timeframe, base_timeframe=RESAMPLE_BASE_TIMEFRAME,
+                                          store_dir=DATA_STORE_DIR, exchange_id=EXCHANGE_ID)
+            else:
+                df = load_ohlcv_from_store(symbol, timeframe, store_dir=DATA_STORE_DIR, exchange_id=EXCHANGE_ID)
+    elif data_source == 'api':
+        df = fetch_ohlcv_data(api_key=API_KEY, secret_key=API_SECRET, symbol=symbol, timeframe=timeframe,
+                              limit=config['api_limit'], exchange_id=EXCHANGE_ID)
+        df = check_loaded_data(df, timeframe, label=f'{symbol} {timeframe} ')
+    elif data_source == 'csv':
+        csv_path = config['csv_path_template'].format(symbol=symbol.replace('/', '-'), timeframe=timeframe)
+        df = check_loaded_data(load_data_from_csv(csv_path, use_cache=True), timeframe, label=f'{symbol} {timeframe} ')
+    else:
+        raise ValueError(f"未知的數據來源: {data_source}")
+    return df, time.perf_counter() - start
+
+def _backtest_dataset(symbol, timeframe, data_df, strategy_names, cash, commission, keep_records=False):
+    """
+    在回測進程中對同一份數據依次運行多個策略，返回 (結果行列表, 結果存儲記錄列表)。
+    keep_records 為 True 時才生成包含權益曲線和交易列表的記錄 (見 result_store.build_record)。
+    data_df 為 (交易對, 週期) 時從緊湊存儲映射數據，只傳遞位置而不序列化整份數據。
+    """
+    if isinstance(data_df, tuple):
+        data_df = load_compact(*data_df, root=COMPACT_STORE_DIR, exchange_id=EXCHANGE_ID)
+    rows = []
+    records = []
+    for name in strategy_names:
+        params = STRATEGY_PARAMS.get(name, {})
+        start = time.perf_counter()
+        stats = run_backtest(data_df, get_strategy(name), cash=cash, commission=commission, **params)
+        row = {'symbol': symbol, 'timeframe': timeframe, 'strategy': name, 'bars': len(data_df),
+               'backtest_seconds': time.perf_counter() - start}
+        row.update({f'param_{key}': value for key, value in params.items()})
+        if stats is not None:
+            row.update(stats.filter(regex='^[^_]').to_dict())
+            if keep_records:
+                records.append(build_record(stats, get_strategy(name), params, data_df, symbol, timeframe,
+                                            cash, commission))
+        else:
+            row['error'] = '回測失敗'
+        rows.append(row)
+    return rows, records
+
+def run_batch(symbols=None, timeframes=None, strategies=None, **overrides):
+    """
+    對 交易對 × 週期 × 策略 的組合批量回測，並輸出一張匯總結果表。
+    數據加載 (I/O) 在線程池中進行，回測 (CPU) 在進程池中進行，兩者同時推進；
+    同一份數據的所有策略在一個進程任務中運行，完成後數據立即從內存釋放。
+
+    參數:
+    - symbols (list[str] | str, optional): 交易對列表或 '*/USDT' 形式的篩選。預設取 BATCH_CONFIG。
+    - timeframes (list[str], optional): K線週期列表。預設取 BATCH_CONFIG。
+    - strategies (list[str], optional): 策略名稱列表 (strategies.STRATEGY_REGISTRY 的鍵)。預設取 BATCH_CONFIG。
+    - **overrides: 覆蓋 BATCH_CONFIG 中的其他設定，例如 data_source、max_workers、output_path。
+
+    返回:
+    - pd.DataFrame: 每個 (交易對, 週期, 策略) 一行，包含加載/回測耗時和公開統計量。
+    """
+    config = {**BATCH_CONFIG, **overrides}
+    symbols = resolve_symbols(symbols if symbols is not None else config['symbols'])
+    timeframes = timeframes or config['timeframes']
+    strategy_names = strategies or config['strategies']
+    unknown = [name for name in strategy_names if name not in STRATEGY_REGISTRY]
+    if unknown:
+        raise ValueError(f"未知的策略: {', '.join(unknown)}")
+
+    datasets = list(itertools.product(symbols, timeframes))
+    n_jobs = len(datasets) * len(strategy_names)
+    print(f"批量回測: {len(symbols)} 個交易對 × {len(timeframes)} 個週期 × {len(strategy_names)} 個策略 = {n_jobs} 個任務")
+
+    # 加載線程在開始讀取前先取得名額，數據集的回測完成後歸還，以此限制同時駐留內存的數據量
+    memory_slots = threading.BoundedSemaphore(config['max_datasets_in_memory'])
+
+    def load_with_slot(symbol, timeframe):
+        memory_slots.acquire()
+        try:
+            return _load_dataset(symbol, timeframe, config)
+        except Exception as e:
+            print(f"加載 {symbol} {timeframe} 時發生錯誤: {e}")
+            return None, 0.0
+
+    rows = []
+    done_jobs = 0
+    batch_start = time.perf_counter()
+    store = ResultStore(config['result_store_dir']) if config.get('result_store_dir') else None
+    with ThreadPoolExecutor(max_workers=config['max_loaders']) as loaders, \
+            ProcessPoolExecutor(max_workers=config['max_workers']) as workers:
+        pending = {loaders.submit(load_with_slot, symbol, timeframe): ('load', symbol, timeframe)
+                   for symbol, timeframe in datasets}
+        load_seconds = {}
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, symbol, timeframe = pending.pop(future)
+                if stage == 'load':
+                    data_df, seconds = future.result()
+                    load_seconds[(symbol, timeframe)] = seconds
+                    if data_df is None or data_df.empty:
+                        memory_slots.release()
+                        for name in strategy_names:
+                            rows.append({'symbol': symbol, 'timeframe': timeframe, 'strategy': name,
+                                         'load_seconds': seconds, 'error': '數據加載失敗'})
+                        done_jobs += len(strategy_names)
+                        print(f"[{done_jobs}/{n_jobs}] {symbol} {timeframe}: 數據加載失敗")
+                        continue
+                    if config['data_source'] == 'compact':
+                        # 回測進程自己映射同一份緊湊存儲檔案，與加載線程共享頁面
+                        data_df = (symbol, timeframe)
+                    backtest = workers.submit(_backtest_dataset, symbol, timeframe, data_df, strategy_names,
+                                              BACKTEST_CONFIG['initial_cash'], BACKTEST_CONFIG['commission_rate'],
+                                              store is not None)
+                    pending[backtest] = ('backtest', symbol, timeframe)
+                    del data_df
+                else:
+                    memory_slots.release()
+                    try:
+                        results, records = future.result()
+                    except Exception as e:
+                        results = [{'symbol': symbol, 'timeframe': timeframe, 'strategy': name, 'error': str(e)}
+                                   for name in strategy_names]
+                        records = []
+                    for record in records:
+                        store.append(record)
+                    for row in results:
+                        row['load_seconds'] = load_seconds[(symbol, timeframe)]
+                        rows.append(row)
+                        done_jobs += 1
+                        print(f"[{done_jobs}/{n_jobs}] {symbol} {timeframe} {row['strategy']}: "
+                              f"加載 {row['load_seconds']:.2f}s, 回測 {row.get('backtest_seconds', float('nan')):.2f}s, "
+                              f"回報 {row.get('Return [%]', float('nan')):.2f}%")
+
+    if store is not None:
+        store.flush()
+        print(f"權益曲線與交易列表已寫入結果存儲 {config['result_store_dir']}")
+    results = pd.DataFrame(rows)
+    print(f"批量回測完成，共 {len(results)} 行，總耗時 {time.perf_counter() - batch_start:.1f} 秒。")
+    output_path = config.get('output_path')
+    if output_path:
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        results.to_csv(output_path, index=False)
+        print(f"結果已寫入 {output_path}")
+    return results
+
+if __name__ == '__main__':
+    run_batch()
@@ -0,0 +1,398 @@
+# benchmark.py
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+import numpy as np
+import pandas as pd
+from backtesting.test import SMA
+
+from config import STRATEGY_PARAMS
+from data_handler import OHLCV_COLUMNS, load_data_from_csv, sync_ohlcv_data, load_ohlcv_from_store
+from backtester import run_backtest
+from fast_backtest import run_fast_backtest
+from data_quality import validate_ohlcv
+from compact_store import load_compact, write_compact
+from synthetic_data import generate_ohlcv
+from trade_bars import TradeBarAggregator
+from utils import rsi_indicator
+from strategies.simple_ma_strategy import MaCrossStrategy
+from strategies.simple_rsi_strategy import RsiStrategy
+import indicator_cache
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+STAGES = ['csv_load', 'api_sync', 'store_load', 'rsi_indicator', 'sma', 'backtest_ma', 'backtest_rsi',
+          'fast_backtest_ma', 'fast_backtest_rsi', 'validate', 'compact_load', 'trade_bars']
+DEFAULT_OUTPUT_PATH = 'benchmarks/latest.json'
+DEFAULT_BASELINE_PATH = 'benchmarks/baseline.json'
+MAIN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+STARTUP_BUDGET_SECONDS = 0.3
+HEAVY_MODULES = ['ccxt', 'backtesting', 'bokeh']
+# 在全新子進程中運行 main.py (argv: main.py 路徑, 待檢查模組的 JSON, CLI 參數...)，結束後在最後一行打印已導入的模組
+_STARTUP_PROBE = '''
+import json, runpy, sys
+main_path, modules = sys.argv[1], json.loads(sys.argv[2])
+sys.argv = [main_path] + sys.argv[3:]
+try:
+    runpy.run_path(main_path, run_name='__main__')
+except SystemExit:
+    pass
+print()
+print(json.dumps([m for m in modules if m in sys.modules]))
+'''
+
+class FakeExchange:
+    """
+    模擬 ccxt 交易所的 fetch_ohlcv 分頁接口，從內存中的 DataFrame 返回與 ccxt 相同形狀的列表。
+    每頁按需從 numpy 數組切出，不會預先生成千萬級的 Python 列表。
+    """
+    has = {'fetchOHLCV': True}
+
+    def __init__(self, data_df, latency=0.0):
+        """
+        參數:
+        - data_df (pd.DataFrame): 要回放的 OHLCV 數據。
+        - latency (float): 每次請求模擬的網路延遲 (秒)。
+        """
+        self._timestamps = data_df.index.values.astype('datetime64[ms]').astype('int64')
+        self._values = data_df[OHLCV_COLUMNS].to_numpy(dtype=float)
+        self.latency = latency
+        self.n_requests = 0
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        self.n_requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        start = 0 if since is None else int(np.searchsorted(self._timestamps, since))
+        stop = len(self._timestamps) if limit is None else start + limit
+        return [[ts, *values] for ts, values in zip(self._timestamps[start:stop].tolist(),
+                                                     self._values[start:stop].tolist())]
+
+def _build_stages(data_df, workdir):
+    """返回 階段名 -> (準備函數或 None, 被計時的函數)。準備函數在每次計時前運行，不計入耗時。"""
+    csv_path = os.path.join(workdir, 'ohlcv.csv')
+    store_dir = os.path.join(workdir, 'store')
+    exchange = FakeExchange(data_df)
+    close = data_df['Close']
+
+    def prepare_csv():
+        if not os.path.exists(csv_path):
+            timestamps_ms = data_df.index.values.astype('datetime64[ms]').astype('int64')
+            data_df.reset_index(drop=True).assign(timestamp=timestamps_ms)[['timestamp'] + OHLCV_COLUMNS].to_csv(
+                csv_path, index=False)
+
+    def sync_store():
+        return sync_ohlcv_data('BTC/USDT', '1m', exchange=exchange, store_dir=store_dir)
+
+    def prepare_sync():
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+    def prepare_store():
+        if not os.path.isdir(store_dir):
+            sync_store()
+
+    compact_dir = os.path.join(workdir, 'compact')
+
+    def prepare_compact():
+        if not os.path.isdir(compact_dir):
+            write_compact(data_df, 'BTC/USDT', '1m', root=compact_dir)
+
+    # 把每根 K 線當作一筆成交 (收盤價、成交量)，測量聚合為 volume K 線 (平均每 100 筆成交一根) 的耗時
+    trade_timestamps = data_df.index.values.astype('datetime64[ms]').astype('int64')
+    trade_prices = close.to_numpy(dtype=float)
+    trade_amounts = data_df['Volume'].to_numpy(dtype=float)
+    bar_volume = float(trade_amounts.mean()) * 100
+
+    def clear_indicator_cache():
+        # 每次都從冷緩存開始，測量的是首次回測的耗時
+        if indicator_cache.default_cache is not None:
+            indicator_cache.default_cache.clear()
+
+    return {
+        'csv_load': (prepare_csv, lambda: load_data_from_csv(csv_path)),
+        'api_sync': (prepare_sync, sync_store),
+        'store_load': (prepare_store, lambda: load_ohlcv_from_store('BTC/USDT', '1m', store_dir=store_dir)),
+        'rsi_indicator': (None, lambda: rsi_indicator(close, STRATEGY_PARAMS['RSI']['rsi_period'])),
+        'sma': (None, lambda: SMA(close, STRATEGY_PARAMS['MA_Cross']['n2'])),
+        'backtest_ma': (clear_indicator_cache,
+                        lambda: run_backtest(data_df, MaCrossStrategy, plot_results=False, **STRATEGY_PARAMS['MA_Cross'])),
+        'backtest_rsi': (clear_indicator_cache,
+                         lambda: run_backtest(data_df, RsiStrategy, plot_results=False, **STRATEGY_PARAMS['RSI'])),
+        'fast_backtest_ma': (None, lambda: run_fast_backtest(data_df, MaCrossStrategy, **STRATEGY_PARAMS['MA_Cross'])),
+        'fast_backtest_rsi': (None, lambda: run_fast_backtest(data_df, RsiStrategy, **STRATEGY_PARAMS['RSI'])),
+        'validate': (None, lambda: validate_ohlcv(data_df, '1m')),
+        'compact_load': (prepare_compact, lambda: load_compact('BTC/USDT', '1m', root=compact_dir)),
+        'trade_bars': (None, lambda: TradeBarAggregator('volume', bar_volume).update(
+            trade_timestamps, trade_prices, trade_amounts)),
+    }
+
+def _run_stage(prepare, func, measure_memory=False):
+    """運行一次階段，返回 (耗時秒數, 峰值內存位元組或 None, 結果)。階段內的打印輸出會被丟棄。"""
+    if prepare is not None:
+        with contextlib.redirect_stdout(io.StringIO()):
+            prepare()
+    if measure_memory:
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = func()
+            seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] - baseline if measure_memory else None
+    finally:
+        if measure_memory:
+            tracemalloc.stop()
+    return seconds, peak, result
+
+def run_benchmarks(sizes=None, stages=None, repeat=3, measure_memory=True, workdir=None):
+    """
+    對每個數據規模依次運行各階段的基準測試。
+
+    參數:
+    - sizes (list[int], optional): K 線數量列表 (1000 至 10000000)。預設為 DEFAULT_SIZES。
+    - stages (list[str], optional): 要運行的階段 (STAGES 的子集)。預設為全部。
+    - repeat (int): 每個階段計時的次數，記錄最短耗時。
+    - measure_memory (bool): 是否額外以 tracemalloc 運行一次以測量峰值內存 (不影響計時結果)。
+    - workdir (str, optional): 存放臨時 CSV 和 Parquet 存儲的目錄。預設使用系統臨時目錄並在結束後刪除。
+
+    返回:
+    - list[dict]: 每個 (階段, 規模) 一條記錄，包含 seconds、bars_per_second、peak_memory_mb，失敗時包含 error。
+    """
+    sizes = sizes or DEFAULT_SIZES
+    stages = stages or STAGES
+    unknown = [name for name in stages if name not in STAGES]
+    if unknown:
+        raise ValueError(f"未知的基準測試階段: {', '.join(unknown)}")
+
+    records = []
+    for n_bars in sizes:
+        data_df = generate_ohlcv(n_bars)
+        size_dir = tempfile.mkdtemp(prefix=f'benchmark_{n_bars}_', dir=workdir)
+        try:
+            stage_functions = _build_stages(data_df, size_dir)
+            for name in stages:
+                prepare, func = stage_functions[name]
+                record = {'stage': name, 'bars': n_bars}
+                try:
+                    timings = []
+                    for _ in range(repeat):
+                        seconds, _, result = _run_stage(prepare, func)
+                        timings.append(seconds)
+                    if result is None:
+                        raise RuntimeError('階段返回 None')
+                    record['seconds'] = min(timings)
+                    record['bars_per_second'] = n_bars / record['seconds'] if record['seconds'] > 0 else None
+                    if measure_memory:
+                        _, peak, _ = _run_stage(prepare, func, measure_memory=True)
+                        record['peak_memory_mb'] = peak / 2**20
+                except Exception as e:
+                    record['error'] = str(e)
+                records.append(record)
+                if 'error' in record:
+                    print(f"{name:<14} {n_bars:>10} 根: 失敗 ({record['error']})")
+                else:
+                    memory = f", 峰值內存 {record['peak_memory_mb']:.1f} MB" if measure_memory else ''
+                    print(f"{name:<14} {n_bars:>10} 根: {record['seconds']:.4f} 秒, "
+                          f"{record['bars_per_second']:,.0f} 根/秒{memory}")
+        finally:
+            shutil.rmtree(size_dir, ignore_errors=True)
+    return records
+
+def save_results(records, path=DEFAULT_OUTPUT_PATH):
+    """把基準測試記錄連同運行環境寫入 JSON 檔案。"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    payload = {
+        'created': pd.Timestamp.now().isoformat(timespec='seconds'),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'processor': platform.processor(), 'cpu_count': os.cpu_count(),
+                        'numpy': np.__version__, 'pandas': pd.__version__},
+        'results': records,
+    }
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=2, ensure_ascii=False)
+    print(f"基準測試結果已寫入 {path}")
+
+def load_results(path):
+    """讀取 save_results 寫出的檔案，返回記錄列表。"""
+    with open(path) as f:
+        return json.load(f)['results']
+
+def compare_with_baseline(records, baseline_path=DEFAULT_BASELINE_PATH, tolerance=0.25, min_seconds=0.005):
+    """
+    與基準檔案逐項對比耗時和峰值內存。
+
+    參數:
+    - records (list[dict]): run_benchmarks 的結果。
+    - baseline_path (str): 基準檔案路徑 (由 save_results 寫出)。
+    - tolerance (float): 允許的變慢/變大比例，超過即視為退化。預設 25%。
+    - min_seconds (float): 低於此耗時的階段只比較內存，避免計時噪聲造成誤報。
+
+    返回:
+    - pd.DataFrame: 每個 (階段, 規模) 一行，含 time_ratio、memory_ratio 和 regression 列。找不到基準檔案時返回 None。
+    """
+    if not os.path.exists(baseline_path):
+        print(f"找不到基準檔案 {baseline_path}，跳過對比。")
+        return None
+    baseline = {(r['stage'], r['bars']): r for r in load_results(baseline_path)}
+    rows = []
+    for record in records:
+        base = baseline.get((record['stage'], record['bars']))
+        if base is None or 'seconds' not in base or 'seconds' not in record:
+            continue
+        row = {'stage': record['stage'], 'bars': record['bars'], 'seconds': record['seconds'],
+               'baseline_seconds': base['seconds'], 'time_ratio': record['seconds'] / base['seconds']}
+        slower = row['time_ratio'] > 1 + tolerance and record['seconds'] >= min_seconds
+        larger = False
+        if record.get('peak_memory_mb') is not None and base.get('peak_memory_mb'):
+            row['peak_memory_mb'] = record['peak_memory_mb']
+            row['baseline_memory_mb'] = base['peak_memory_mb']
+            row['memory_ratio'] = record['peak_memory_mb'] / base['peak_memory_mb']
+            larger = row['memory_ratio'] > 1 + tolerance
+        row['regression'] = slower or larger
+        rows.append(row)
+    comparison = pd.DataFrame(rows)
+    if not comparison.empty:
+        with pd.option_context('display.width', 200, 'display.max_columns', None):
+            print(comparison.to_string(index=False, float_format=lambda x: f'{x:.4g}'))
+        n_regressions = int(comparison['regression'].sum())
+        print(f"與基準對比: {n_regressions} 項退化 (容許 {tolerance:.0%})。")
+    return comparison
+
+class PerBarMaCross(MaCrossStrategy):
+    """MaCrossStrategy 移植到 set_signals() 之前的寫法：每根 K 線在 next() 中調用兩次 crossover()。"""
+    def next(self):
+        if self.crossover(self.sma1, self.sma2):
+            if not self.position:
+                self.buy()
+        elif self.crossover(self.sma2, self.sma1):
+            if self.position.is_long:
+                self.position.close()
+
+class PerBarRsi(RsiStrategy):
+    """RsiStrategy 移植到 set_signals() 之前的寫法。"""
+    def next(self):
+        if self.crossover(self.rsi, self.oversold_threshold):
+            if not self.position:
+                self.buy()
+        elif self.crossover(self.overbought_threshold, self.rsi):
+            if self.position.is_long:
+                self.position.close()
+
+def compare_next_cost(n_bars=1000000):
+    """
+    比較內建策略 (init() 中預先計算信號，next() 只查表) 與逐根調用 crossover() 的舊寫法的每根 K 線開銷。
+    兩種寫法的統計結果必須完全相同；next() 的耗時由 run_backtest(..., profile=True) 的計時報告得到。
+
+    返回:
+    - pd.DataFrame: 每個策略/寫法一行，含 next() 平均耗時 (微秒)、next() 與整次回測的總耗時和結果是否一致。
+    """
+    data_df = generate_ohlcv(n_bars)
+    rows = []
+    for name, signals_class, per_bar_class in [('MA_Cross', MaCrossStrategy, PerBarMaCross),
+                                               ('RSI', RsiStrategy, PerBarRsi)]:
+        results = {}
+        for variant, strategy_class in [('signals', signals_class), ('per_bar', per_bar_class)]:
+            clear = indicator_cache.default_cache.clear if indicator_cache.default_cache is not None else None
+            if clear:
+                clear()
+            start = time.perf_counter()
+            stats = run_backtest(data_df, strategy_class, plot_results=False, profile=True, **STRATEGY_PARAMS[name])
+            seconds = time.perf_counter() - start
+            results[variant] = stats
+            profile = stats['_profile']
+            rows.append({'strategy': name, 'variant': variant, 'bars': n_bars,
+                         'next_us_per_bar': profile['next_latency_us']['mean'],
+                         'next_seconds': profile['phases_seconds']['next'], 'backtest_seconds': seconds})
+        same = results['signals']['_trades'][['EntryBar', 'ExitBar', 'PnL']].equals(
+            results['per_bar']['_trades'][['EntryBar', 'ExitBar', 'PnL']])
+        rows[-1]['identical'] = rows[-2]['identical'] = same
+    report = pd.DataFrame(rows)
+    print(report.to_string(index=False, float_format=lambda x: f'{x:.3f}'))
+    return report
+
+def check_cli_startup(budget_seconds=STARTUP_BUDGET_SECONDS, repeat=3):
+    """
+    檢查輕量 CLI 命令的冷啟動時間與導入預算。
+
+    每個命令都在全新的 Python 進程中運行 (包含解釋器啟動)，取多次中的最短耗時；
+    同時檢查命令結束後沒有導入 ccxt、backtesting、Bokeh 或 pandas (report 在存儲為空時不讀取任何分片)。
+    解釋器本身啟動約需 0.05 秒，這三個命令目前約 0.1 秒；只要有一個命令開始在頂層導入 pandas (約 0.4 秒)
+    就會超出預算。
+
+    參數:
+    - budget_seconds (float): 每個命令允許的最長耗時 (秒)。
+    - repeat (int): 每個命令運行的次數。
+
+    返回:
+    - pd.DataFrame: 每個命令一行，含 seconds、unexpected_modules 和 ok 列。
+    """
+    store_dir = tempfile.mkdtemp(prefix='startup_store_')
+    commands = [
+        (['--help'], HEAVY_MODULES + ['pandas']),
+        (['strategies'], HEAVY_MODULES + ['pandas']),
+        (['report', '--store-dir', store_dir], HEAVY_MODULES + ['pandas']),
+    ]
+    rows = []
+    try:
+        for args, forbidden in commands:
+            timings = []
+            loaded = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                completed = subprocess.run([sys.executable, '-c', _STARTUP_PROBE, MAIN_PATH, json.dumps(forbidden), *args],
+                                           cwd=os.path.dirname(MAIN_PATH), capture_output=True, text=True)
+                timings.append(time.perf_counter() - start)
+                lines = completed.stdout.strip().splitlines()
+                loaded = json.loads(lines[-1]) if completed.returncode == 0 and lines else ['<進程失敗>']
+            seconds = min(timings)
+            rows.append({'command': ' '.join(args), 'seconds': seconds, 'unexpected_modules': ', '.join(loaded),
+                         'ok': seconds <= budget_seconds and not loaded})
+    finally:
+        shutil.rmtree(store_dir, ignore_errors=True)
+    report = pd.DataFrame(rows)
+    print(report.to_string(index=False, float_format=lambda x: f'{x:.3f}'))
+    print(f"啟動預算 {budget_seconds:.2f} 秒: {'通過' if report['ok'].all() else '未通過'}")
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='數據加載、指標和回測的基準測試')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='K 線數量，最多 10000000')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true', help='不測量峰值內存')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT_PATH)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='把本次結果同時保存為新的基準')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--startup', action='store_true', help='只檢查 main.py 輕量命令的冷啟動時間與導入預算')
+    parser.add_argument('--startup-budget', type=float, default=STARTUP_BUDGET_SECONDS)
+    parser.add_argument('--next-cost', action='store_true',
+                        help='只比較預先計算信號與逐根 crossover() 的每根 K 線開銷 (K 線數取 --sizes 的最大值)')
+    args = parser.parse_args()
+
+    if args.startup:
+        startup_report = check_cli_startup(args.startup_budget, repeat=args.repeat)
+        sys.exit(0 if startup_report['ok'].all() else 1)
+
+    warnings.filterwarnings('ignore')
+    if args.next_cost:
+        compare_next_cost(max(args.sizes))
+        sys.exit(0)
+    benchmark_records = run_benchmarks(args.sizes, args.stages, repeat=args.repeat, measure_memory=not args.no_memory)
+    save_results(benchmark_records, args.output)
+    if args.save_baseline:
+        save_results(benchmark_records, args.baseline)
+    else:
+        result = compare_with_baseline(benchmark_records, args.baseline, tolerance=args.tolerance)
+        if result is not None and not result.empty and result['regression'].any():
+            sys.exit(1)
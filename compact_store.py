@@ -0,0 +1,311 @@
+# compact_store.py
+# 緊湊的內存映射 OHLCV 存儲，供大量交易對的截面研究使用。
+# 每個 交易所/交易對/週期 分區包含每列一個 float32 檔案 (連續的原始二進位數組) 和記錄已提交行數的 meta.json。
+# 讀取時以只讀 memmap 映射，返回的 DataFrame 與數組都是零拷貝視圖：「加載」幾乎不花時間，
+# 多個進程映射同一個檔案時共享作業系統的頁面緩存，只有實際訪問的頁面才佔用內存。
+# 時間戳：pandas 的 DatetimeIndex 只能零拷貝地建立在 int64 數組上，因此間隔固定、沒有缺口的分區不存時間戳，
+# 索引直接切自同一交易所/週期所有交易對共用的日曆檔案 (<root>/<exchange_id>/_calendar/<週期>.i8，
+# 等間隔的 int64 毫秒時間戳)。每個交易對每根 K 線只佔 20 位元組，比 Parquet 加載的 float64 DataFrame
+# (48 位元組) 少 58%；日曆只存一份，由所有交易對和進程共享。有缺口的分區和月線、年線
+# 另存一個 int64 時間戳檔案 (每根 28 位元組，少 42%)。
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from config import COMPACT_STORE_DIR
+from data_handler import OHLCV_COLUMNS, get_store_partition
+from data_quality import timeframe_step_ms
+
+TIMESTAMP_FILE = 'timestamp.i8'
+META_FILE = 'meta.json'
+CALENDAR_DIR = '_calendar'
+VALUE_DTYPE = np.float32
+
+def _column_path(partition_dir, column):
+    return os.path.join(partition_dir, TIMESTAMP_FILE if column == 'timestamp' else f'{column}.f4')
+
+def _calendar_path(timeframe, root, exchange_id):
+    return os.path.join(root, exchange_id, CALENDAR_DIR, f'{timeframe}.i8')
+
+def _calendar_slice(path, first, rows, step_ms):
+    """從日曆中切出 first 開始的 rows 個時間戳 (零拷貝)；日曆不存在、不對齊或不夠長時返回 None。"""
+    if not os.path.exists(path):
+        return None
+    calendar = np.memmap(path, dtype=np.int64, mode='r')
+    offset, misaligned = divmod(first - int(calendar[0]), step_ms)
+    if misaligned or offset < 0 or offset + rows > len(calendar):
+        return None
+    return calendar[offset:offset + rows]
+
+def _extend_calendar(path, first, last, step_ms):
+    """
+    確保日曆覆蓋 [first, last]，需要時重寫為更長的日曆 (寫入臨時檔案後替換，已映射舊檔案的讀取方不受影響)。
+    向後多預留一段，避免每次追加新 K 線都重寫。first 與現有日曆不對齊時返回 False。
+    """
+    if os.path.exists(path):
+        calendar = np.memmap(path, dtype=np.int64, mode='r')
+        start, stop = int(calendar[0]), int(calendar[-1])
+        del calendar
+        if (first - start) % step_ms:
+            return False
+        if start <= first and last <= stop:
+            return True
+        first, last = min(first, start), max(last, stop)
+    rows = (last - first) // step_ms + 1
+    rows += max(rows // 8, 1024)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    np.arange(first, first + rows * step_ms, step_ms, dtype=np.int64).tofile(tmp_path)
+    os.replace(tmp_path, path)
+    return True
+
+def _read_meta(partition_dir):
+    """讀取分區的 meta.json；分區不存在時返回 None。"""
+    path = os.path.join(partition_dir, META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def _write_meta(partition_dir, meta):
+    """原子地寫入 meta.json。它記錄已提交的行數，是追加寫入的提交標記。"""
+    path = os.path.join(partition_dir, META_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(path + '.tmp', path)
+
+def get_compact_partition(symbol, timeframe, root=COMPACT_STORE_DIR, exchange_id='binance'):
+    """返回緊湊存儲的分區目錄，佈局與 data_handler.get_store_partition 相同。"""
+    return get_store_partition(symbol, timeframe, root, exchange_id)
+
+def append_compact(data_df: pd.DataFrame, symbol, timeframe, root=COMPACT_STORE_DIR, exchange_id='binance'):
+    """
+    把 OHLCV 數據追加到緊湊存儲，只寫入比已存儲的最後一根更新的 K 線。
+
+    先把新行追加到各列檔案的末尾，最後更新 meta.json 中的行數；中途中斷時多寫的部分不會被讀到，
+    下次追加前會截斷。讀取方只映射已提交的行，因此可以在其他進程讀取時追加。
+    只要數據間隔固定且沒有缺口，時間戳就由共用的日曆提供；第一次出現缺口時才為分區寫出時間戳檔案。
+
+    參數:
+    - data_df (pd.DataFrame): 按時間排序、索引為 DatetimeIndex 的 OHLCV 數據。
+    - symbol, timeframe, root, exchange_id: 分區位置。
+
+    返回:
+    - int: 追加的行數。數據未按時間嚴格遞增時返回 None。
+    """
+    if data_df is None or data_df.empty:
+        return 0
+    timestamps = data_df.index.values.astype('datetime64[ms]').astype('int64')
+    if len(timestamps) > 1 and not (np.diff(timestamps) > 0).all():
+        print("錯誤: 數據的時間戳必須嚴格遞增，請先用 data_quality.validate_ohlcv 修復。")
+        return None
+    partition_dir = get_compact_partition(symbol, timeframe, root, exchange_id)
+    os.makedirs(partition_dir, exist_ok=True)
+    step_ms = timeframe_step_ms(timeframe)
+    meta = _read_meta(partition_dir) or {'rows': 0, 'first_timestamp': None, 'last_timestamp': None,
+                                         'columns': OHLCV_COLUMNS, 'dtype': np.dtype(VALUE_DTYPE).name,
+                                         'timestamps': 'calendar' if step_ms else 'file'}
+    if meta['last_timestamp'] is not None:
+        keep = timestamps > meta['last_timestamp']
+        timestamps, data_df = timestamps[keep], data_df[keep]
+    if not len(timestamps):
+        return 0
+
+    columns = {}
+    if meta.get('timestamps', 'file') == 'calendar':
+        first = timestamps[0] if meta['first_timestamp'] is None else meta['first_timestamp']
+        expected = timestamps[0] if meta['last_timestamp'] is None else meta['last_timestamp'] + step_ms
+        regular = timestamps[0] == expected and (np.diff(timestamps) == step_ms).all()
+        if not (regular and _extend_calendar(_calendar_path(timeframe, root, exchange_id), int(first),
+                                             int(timestamps[-1]), step_ms)):
+            # 出現缺口 (或與日曆不對齊)：把已有的時間戳寫成檔案，之後按普通分區追加
+            existing = np.arange(meta['rows'], dtype=np.int64) * step_ms + (meta['first_timestamp'] or 0)
+            with open(_column_path(partition_dir, 'timestamp'), 'wb') as f:
+                f.write(existing.tobytes())
+            meta['timestamps'] = 'file'
+    if meta.get('timestamps', 'file') == 'file':
+        columns['timestamp'] = timestamps
+    columns.update({col: data_df[col].to_numpy(dtype=VALUE_DTYPE) for col in OHLCV_COLUMNS})
+    for column, values in columns.items():
+        path = _column_path(partition_dir, column)
+        with open(path, 'ab') as f:
+            # 截斷上次中斷時未提交的尾部
+            f.truncate(meta['rows'] * values.dtype.itemsize)
+            f.write(np.ascontiguousarray(values).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+    meta['rows'] += len(timestamps)
+    if meta['first_timestamp'] is None:
+        meta['first_timestamp'] = int(timestamps[0])
+    meta['last_timestamp'] = int(timestamps[-1])
+    _write_meta(partition_dir, meta)
+    return len(timestamps)
+
+def write_compact(data_df: pd.DataFrame, symbol, timeframe, root=COMPACT_STORE_DIR, exchange_id='binance'):
+    """覆蓋寫入整個分區 (刪除舊數據後追加)，返回寫入的行數。"""
+    partition_dir = get_compact_partition(symbol, timeframe, root, exchange_id)
+    meta_path = os.path.join(partition_dir, META_FILE)
+    if os.path.exists(meta_path):
+        os.remove(meta_path) # 先刪除提交標記，舊數據隨即不可見
+    for column in ['timestamp'] + OHLCV_COLUMNS:
+        path = _column_path(partition_dir, column)
+        if os.path.exists(path):
+            os.remove(path)
+    return append_compact(data_df, symbol, timeframe, root, exchange_id)
+
+def load_compact_arrays(symbol, timeframe, root=COMPACT_STORE_DIR, exchange_id='binance'):
+    """
+    以只讀 memmap 映射一個分區的所有列。
+
+    返回:
+    - dict: {'timestamp': int64 毫秒數組, 'Open': float32 數組, ...}，均為長度相同的連續 memmap
+            (時間戳可能是共用日曆的切片)。分區不存在或為空時返回 None。
+    """
+    partition_dir = get_compact_partition(symbol, timeframe, root, exchange_id)
+    meta = _read_meta(partition_dir)
+    if meta is None or not meta['rows']:
+        return None
+    if meta.get('timestamps', 'file') == 'calendar':
+        path, step_ms = _calendar_path(timeframe, root, exchange_id), timeframe_step_ms(timeframe)
+        timestamps = _calendar_slice(path, meta['first_timestamp'], meta['rows'], step_ms)
+        if timestamps is None:
+            # 日曆被並發的寫入方重寫成不含本分區的範圍時補回
+            _extend_calendar(path, meta['first_timestamp'], meta['last_timestamp'], step_ms)
+            timestamps = _calendar_slice(path, meta['first_timestamp'], meta['rows'], step_ms)
+    else:
+        timestamps = np.memmap(_column_path(partition_dir, 'timestamp'), dtype=np.int64, mode='r',
+                               shape=(meta['rows'],))
+    arrays = {'timestamp': timestamps}
+    for col in OHLCV_COLUMNS:
+        arrays[col] = np.memmap(_column_path(partition_dir, col), dtype=meta['dtype'], mode='r', shape=(meta['rows'],))
+    return arrays
+
+def compact_frame(arrays, start=None, end=None):
+    """
+    把 load_compact_arrays 返回的數組包裝成零拷貝的 DataFrame。
+
+    索引為 datetime64[ms] 的 DatetimeIndex，各列為 float32，全部直接引用傳入的數組 (時間範圍篩選也只是切片)。
+
+    參數:
+    - arrays (dict): load_compact_arrays 的返回值。
+    - start, end (str | pd.Timestamp, optional): 只返回此時間範圍內的數據 (含端點)。
+
+    返回:
+    - pandas.DataFrame: 列為 OHLCV_COLUMNS 的 DataFrame。
+    """
+    timestamps = arrays['timestamp']
+    first = 0 if start is None else int(np.searchsorted(timestamps, pd.Timestamp(start).value // 10**6, side='left'))
+    stop = len(timestamps) if end is None else int(np.searchsorted(timestamps, pd.Timestamp(end).value // 10**6,
+                                                                    side='right'))
+    index = pd.DatetimeIndex(timestamps[first:stop].view('datetime64[ms]'), name='timestamp', copy=False)
+    return pd.DataFrame({col: arrays[col][first:stop] for col in OHLCV_COLUMNS}, index=index, copy=False)
+
+def load_compact(symbol='BTC/USDT', timeframe='1d', root=COMPACT_STORE_DIR, exchange_id='binance',
+                 start=None, end=None):
+    """
+    從緊湊存儲讀取 OHLCV 數據，返回直接引用 memmap 的零拷貝 DataFrame (見 compact_frame)。
+    可以直接傳給 run_backtest、run_fast_backtest 和各指標函數；數據是只讀的，修改時 pandas 會自動複製。
+
+    參數:
+    - symbol, timeframe, root, exchange_id: 分區位置。
+    - start, end (str | pd.Timestamp, optional): 只返回此時間範圍內的數據 (含端點)。
+
+    返回:
+    - pandas.DataFrame: 列為 OHLCV_COLUMNS 的 DataFrame。如果沒有數據則返回 None。
+    """
+    arrays = load_compact_arrays(symbol, timeframe, root, exchange_id)
+    if arrays is None:
+        print(f"緊湊存儲中沒有 {symbol} 的 {timeframe} 數據: {get_compact_partition(symbol, timeframe, root, exchange_id)}")
+        return None
+    return compact_frame(arrays, start, end)
+
+def update_compact_from_store(symbol='BTC/USDT', timeframe='1d', store_dir='data/ohlcv', root=COMPACT_STORE_DIR,
+                              exchange_id='binance', base_timeframe=None):
+    """
+    把本地 Parquet 存儲中比緊湊存儲更新的 K 線追加過來 (只讀取新的部分)。
+
+    參數:
+    - symbol, timeframe, exchange_id: 交易對、週期與交易所。
+    - store_dir (str): data_handler 的 Parquet 存儲根目錄。
+    - root (str): 緊湊存儲根目錄。
+    - base_timeframe (str, optional): 給出時從該週期重採樣得到 timeframe (見 data_handler.load_resampled_ohlcv)，
+                                      只追加已收盤的 K 線。
+
+    返回:
+    - int: 追加的行數。Parquet 存儲中沒有數據時返回 None。
+    """
+    from data_handler import load_ohlcv_from_store, load_resampled_ohlcv
+
+    meta = _read_meta(get_compact_partition(symbol, timeframe, root, exchange_id))
+    start = None
+    if meta is not None and meta['last_timestamp'] is not None:
+        start = pd.Timestamp(meta['last_timestamp'] + 1, unit='ms')
+    if base_timeframe:
+        df = load_resampled_ohlcv(symbol, timeframe, base_timeframe, store_dir, exchange_id, start=start,
+                                  fill_gaps=False)
+    else:
+        df = load_ohlcv_from_store(symbol, timeframe, store_dir, exchange_id, start=start, fill_gaps=False)
+    if df is None:
+        return None if meta is None else 0
+    return append_compact(df, symbol, timeframe, root, exchange_id)
+
+def compact_nbytes(data_df: pd.DataFrame):
+    """返回 DataFrame 的數據與索引所佔的位元組數 (不含 Python 對象開銷)。"""
+    return int(data_df.memory_usage(index=True, deep=False).sum())
+
+def partition_nbytes(symbol, timeframe, root=COMPACT_STORE_DIR, exchange_id='binance'):
+    """返回交易對自己佔用的位元組數 (各列檔案的已提交部分，不含共用日曆)。分區不存在時返回 0。"""
+    partition_dir = get_compact_partition(symbol, timeframe, root, exchange_id)
+    meta = _read_meta(partition_dir)
+    if meta is None:
+        return 0
+    columns = OHLCV_COLUMNS + (['timestamp'] if meta.get('timestamps', 'file') == 'file' else [])
+    return sum(meta['rows'] * (8 if column == 'timestamp' else np.dtype(meta['dtype']).itemsize)
+               for column in columns)
+
+if __name__ == '__main__':
+    import shutil
+    import tempfile
+    import time
+    import warnings
+    from synthetic_data import generate_ohlcv
+
+    warnings.filterwarnings('ignore')
+    n_bars = 2 * 365 * 1440 # 兩年的 1m K 線
+    full_df = generate_ohlcv(n_bars, 'min', start='2022-01-01', seed=3, volatility=0.0005)
+
+    root = tempfile.mkdtemp(prefix='compact_store_')
+    try:
+        # 分兩次寫入，第二次只追加新的 K 線
+        append_compact(full_df.iloc[:n_bars // 2], 'BTC/USDT', '1m', root)
+        appended = append_compact(full_df, 'BTC/USDT', '1m', root)
+        print(f"第二次追加 {appended} 行")
+
+        start = time.perf_counter()
+        compact_df = load_compact('BTC/USDT', '1m', root)
+        print(f"加載 {len(compact_df)} 根 K 線耗時 {(time.perf_counter() - start) * 1000:.2f} 毫秒，"
+              f"交易對自身 {partition_nbytes('BTC/USDT', '1m', root) / len(compact_df):.0f} 位元組/根 "
+              f"(float64 DataFrame: {compact_nbytes(full_df) / len(full_df):.0f} 位元組/根，時間戳來自共用日曆)")
+        # 中間缺了一根 K 線的交易對改為自帶時間戳檔案
+        append_compact(full_df.drop(full_df.index[1000]), 'ETH/USDT', '1m', root)
+        print(f"有缺口的交易對: {partition_nbytes('ETH/USDT', '1m', root) / (n_bars - 1):.0f} 位元組/根，數據一致:",
+              load_compact('ETH/USDT', '1m', root).index.equals(full_df.index.delete(1000)))
+        arrays = load_compact_arrays('BTC/USDT', '1m', root)
+        view_df = compact_frame(arrays, start='2023-06-01', end='2023-06-30')
+        print("零拷貝:", all(np.shares_memory(view_df[col].to_numpy(), arrays[col]) for col in OHLCV_COLUMNS)
+              and np.shares_memory(view_df.index.values, arrays['timestamp']))
+        print("數值與 float32 原始數據一致:",
+              np.array_equal(compact_df.to_numpy(), full_df.to_numpy(dtype=np.float32)))
+
+        # 緊湊數據可直接用於回測 (最近 30 天)
+        from backtester import run_backtest
+        from fast_backtest import run_fast_backtest
+        from strategies.simple_ma_strategy import MaCrossStrategy
+        recent = load_compact('BTC/USDT', '1m', root, start=compact_df.index[-30 * 1440])
+        stats = run_backtest(recent, MaCrossStrategy)
+        fast_stats = run_fast_backtest(recent, MaCrossStrategy)
+        print(f"最近 30 天回測: 回報 {stats['Return [%]']:.4f}%，向量化回測 {fast_stats['Return [%]']:.4f}%")
+
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
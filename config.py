@@ -11,6 +11,61 @@ EXCHANGE_ID = 'binance'  # 範例交易所，請根據您的選擇更改
 TRADING_PAIR = 'BTC/USDT'
 TIMEFRAME = '1d'  # K線週期: '1m', '5m', '15m', '1h', '4h', '1d', '1w', etc.
 
+# main.py 的預設值 (都可以用命令列參數覆蓋，見 python main.py --help)
+DATA_SOURCE = 'api'  # 'api'、'csv'、'store'、'compact' 或 'trades' (見 TRADE_BARS_CONFIG)
+CSV_FILE_PATH = 'data/btcusd_1d.csv'  # DATA_SOURCE 為 'csv' 時讀取的檔案
+API_LIMIT = 500  # DATA_SOURCE 為 'api' 時獲取的 K 線數量
+DEFAULT_STRATEGY = 'MA_Cross'  # strategies.STRATEGY_REGISTRY 中的名稱
+
+# 本地 K 線存儲目錄 (sync_ohlcv_data 增量同步的 Parquet 分片，按 交易所/交易對/週期 分區)
+DATA_STORE_DIR = 'data/ohlcv'
+# 高週期數據由本地存儲的此週期 K 線重採樣得到 (只同步這一個週期，切換 TIMEFRAME 不需要重新下載)；設為 None 則直接同步目標週期
+RESAMPLE_BASE_TIMEFRAME = '1m'
+# 緊湊的內存映射存儲 (compact_store.py)：int64 時間戳 + float32 OHLCV，多進程共享同一份頁面
+COMPACT_STORE_DIR = 'data/compact'
+
+# 由逐筆成交聚合的 K 線 (trade_bars.py)，main.py --source trades 使用
+TRADE_BARS_CONFIG = {
+    'trades_csv': 'data/BTCUSDT-trades.csv',  # 成交 CSV 檔案 (時間、價格、數量，可選成交編號)
+    'bar': 'volume:100',  # K 線規格: 'tick:<筆數>'、'volume:<成交量>'、'dollar:<成交額>' 或 'time:<週期，例如 5s>'
+    'chunksize': 1000000,  # 每塊讀取的成交行數，決定內存佔用
+    'cache_dir': 'data/trade_bars'  # 已聚合的 K 線和聚合器狀態，成交檔案被追加後只處理新增的行
+}
+
+# 數據質量檢查與修復 (data_quality.py)；本地存儲在同步時只檢查新寫入的 K 線，CSV/API 數據在加載後整體檢查。
+# 本地存儲只保存交易所返回的真實 K 線：寫入時缺口只報告、不可能的 K 線不會被填平 ('ffill' 按 'drop' 處理)，
+# 補齊缺口只在從存儲加載時進行，之後重新同步或回補的真實數據不會與補齊的數據混在一起
+DATA_QUALITY_CONFIG = {
+    'enabled': True,
+    'duplicates': 'last',  # 重複時間戳: 'last' / 'first' 保留一條，'flag' 只報告
+    'invalid': 'drop',  # High < Low、價格非正或 NaN 等不可能的 K 線: 'drop' 刪除，'ffill' 以前收盤價填平，'flag' 只報告
+    'gaps': 'ffill',  # 加載後數據中缺失的 K 線: 'ffill' 以前收盤價補齊 (成交量為 0)，'flag' 只報告；寫入存儲時總是只報告
+    'max_gap_ranges': 1000  # 質量報告中保留的缺口區間數量上限 (最新的)
+}
+
+# 交易所客戶端設定 (exchange_client.py)，所有數據下載共用每個交易所的長期客戶端與限速器
+EXCHANGE_CLIENT_CONFIG = {
+    'max_connections': 4,  # 每個交易所同時使用的 ccxt 實例 (HTTP 連接) 數
+    'safety': 0.9,  # 只使用權重上限的這個比例，給時鐘誤差和其他程序留餘量
+    'max_retries': 5,  # NetworkError (超時、限流、交易所暫時不可用) 的重試次數
+    'retry_base_delay': 0.5,  # 第一次重試前的等待秒數，之後每次加倍並加上隨機抖動
+    'retry_max_delay': 30.0,
+    'markets_cache_dir': 'data/cache/markets',  # load_markets 結果的磁碟緩存
+    'markets_cache_ttl': 24 * 3600  # 秒
+}
+
+# 各交易所的請求權重限制；未列出的交易所按 ccxt 的 rateLimit (請求間隔) 限速，每個請求權重為 1
+EXCHANGE_RATE_LIMITS = {
+    'binance': {
+        'weight_limit': 6000,  # 每個 IP 每分鐘的 REQUEST_WEIGHT 上限
+        'window_seconds': 60,
+        'used_weight_header': 'x-mbx-used-weight-1m',  # 伺服器回報的本分鐘已用權重，用於校正本地估計
+        'default_weight': 1,
+        'weights': {'fetch_ohlcv': 2, 'load_markets': 20, 'fetch_ticker': 2, 'fetch_tickers': 80,
+                    'fetch_order_book': 5, 'fetch_trades': 25, 'fetch_balance': 20}
+    }
+}
+
 # 策略參數
 STRATEGY_PARAMS = {
     'MA_Cross': {
@@ -28,7 +83,71 @@ STRATEGY_PARAMS = {
 # 回測設定
 BACKTEST_CONFIG = {
     'initial_cash': 100000,  # 初始資金
-    'commission_rate': 0.001  # 手續費率 (例如 0.1%)
+    'commission_rate': 0.001,  # 手續費率 (例如 0.1%)
+    'result_store_dir': 'results/store'  # 回測結果 (統計量、權益曲線、交易列表) 的追加式存儲 (result_store.py)
+}
+
+# 可斷點續跑的優化任務 (optimization_job.py)，python main.py job ... 使用
+OPTIMIZATION_JOB_CONFIG = {
+    'job_dir': 'results/jobs/default',  # 任務目錄；多台機器掛載同一目錄即可共同處理一個任務
+    'unit_size': {'sweep': 512, 'backtest': 16},  # 每個工作單元的參數組合數 (按評估方式)，完成一個單元就持久化一次
+    'lease_seconds': 300,  # 認領的心跳超時 (秒)，超時未更新的認領視為工作進程已崩潰，由其他進程接手
+    'progress_interval': 10  # run_job 打印進度的間隔 (秒)
+}
+
+# 蒙地卡羅穩健性分析 (robustness.py)，python main.py report --monte-carlo <run_id> 使用
+MONTE_CARLO_CONFIG = {
+    'n_sims': 10000,  # 每種方法的抽樣路徑數
+    'methods': ['bootstrap', 'block', 'shuffle'],  # 日收益自助法、區塊自助法、交易順序打亂
+    'confidence': 0.95,  # 置信區間的置信水準
+    'ruin_fraction': 0.5,  # 權益跌到初始資金的這個比例以下視為破產
+    'block_size': None  # 區塊自助法的區塊長度 (日)，None 表示日數的立方根
+}
+
+# 多策略、多交易對的組合回測 (portfolio_backtest.py)，python main.py portfolio 使用
+PORTFOLIO_CONFIG = {
+    'symbols': ['BTC/USDT', 'ETH/USDT'],
+    'strategies': ['MA_Cross', 'RSI'],  # 對應 STRATEGY_PARAMS 中的鍵，每個策略在每個交易對上各有一個子賬戶
+    'allocator': 'equal',  # 'equal' 等權、'volatility' 波動率目標、'fixed' 按 fractions 的固定比例
+    'fractions': {'MA_Cross': 0.5, 'RSI': 0.5},  # fixed: 每個策略的資金比例 (平均分給各交易對)，總和不超過 1
+    'target_volatility': 0.6,  # volatility: 年化目標波動率，交易對波動更大時按比例縮小開倉金額
+    'vol_window': 30,  # volatility: 計算波動率的 K 線數
+    'fractional': True  # 允許買入非整數單位 (子賬戶資金較少時 BTC 等高價資產常常買不起一個單位)
+}
+
+# 批量回測設定 (batch_runner.py)
+BATCH_CONFIG = {
+    # 交易對列表；也可以寫成 '*/USDT'，表示交易所上所有活躍的 USDT 現貨交易對
+    'symbols': ['BTC/USDT', 'ETH/USDT'],
+    'timeframes': ['1h', '1d'],
+    'strategies': ['MA_Cross', 'RSI'],  # 對應 STRATEGY_PARAMS 中的鍵
+    'data_source': 'store',  # 'store' (先增量同步再讀本地存儲)、'compact' (同步後轉存為內存映射的緊湊存儲)、'api' 或 'csv'
+    'csv_path_template': 'data/{symbol}_{timeframe}.csv',  # data_source 為 'csv' 時使用，symbol 中的 '/' 會替換為 '-'
+    'api_limit': 500,  # data_source 為 'api' 時每個交易對獲取的K線數量
+    'max_workers': None,  # 回測進程數，None 表示 CPU 核心數
+    'max_loaders': 4,  # 同時加載數據的線程數
+    'max_datasets_in_memory': 8,  # 同時駐留內存的數據集上限，回測完成後立即釋放
+    'output_path': 'results/batch_results.csv',
+    'result_store_dir': 'results/store'  # 同時把每次回測的權益曲線和交易列表寫入結果存儲；None 表示不寫入
+}
+
+# 模擬交易設定 (paper_trader.py)
+PAPER_TRADING_CONFIG = {
+    'symbols': ['BTC/USDT', 'ETH/USDT'],
+    'timeframe': '1m',
+    'strategy': 'MA_Cross',  # 對應 STRATEGY_PARAMS 中的鍵
+    'history_bars': 500,  # 每次決策使用的最近 K 線數量
+    'poll_interval': 5.0,  # 沒有新 K 線時的輪詢間隔 (秒)
+    'latency_budget_ms': 50.0,  # 每根 K 線決策耗時的預算，超出時打印警告
+    'request_timeout': 10.0  # 單次請求超時 (秒)，超時的交易對單獨退避重試
+}
+
+# 指標緩存設定 (indicator_cache.py)，BaseStrategy 的子類通過 self.I() 計算的指標會自動緩存
+INDICATOR_CACHE = {
+    'enabled': True,
+    'max_memory_mb': 512,  # 內存層上限，超出後淘汰最久未使用的指標
+    'disk_dir': None,  # 磁碟層目錄，例如 'data/indicator_cache'；None 表示只用內存
+    'max_disk_mb': 2048  # 磁碟層上限，超出後刪除最久未使用的檔案
 }
 
 # 其他設定
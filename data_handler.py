@@ -1,6 +1,19 @@
-import ccxt
+import csv
+import hashlib
+import numpy as np
 import pandas as pd
 import os
+import time
+
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# K 線週期單位對應的秒數，與 ccxt.Exchange.parse_timeframe 相同 (避免只讀本地數據時導入 ccxt)
+_TIMEFRAME_UNIT_SECONDS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800, 'M': 2592000, 'y': 31536000}
+
+def timeframe_to_ms(timeframe):
+    """把 '1m'、'4h'、'1d' 這樣的週期字串轉為毫秒數。"""
+    return int(timeframe[:-1]) * _TIMEFRAME_UNIT_SECONDS[timeframe[-1]] * 1000
+
 def fetch_ohlcv_data(api_key=None, secret_key=None, symbol='BTC/USDT', timeframe='1d', limit=100, exchange_id='binance'):
     """
     使用 CCXT 從指定交易所獲取 OHLCV 數據。
@@ -18,14 +31,11 @@ def fetch_ohlcv_data(api_key=None, secret_key=None, symbol='BTC/USDT', timeframe
                        列名為 ['Open', 'High', 'Low', 'Close', 'Volume']。
                        如果獲取失敗則返回 None。
     """
+    import ccxt
+    from exchange_client import get_exchange_client
+
     try:
-        exchange_class = getattr(ccxt, exchange_id)
-        exchange_params = {}
-        if api_key and secret_key:
-            exchange_params['apiKey'] = api_key
-            exchange_params['secret'] = secret_key
-        
-        exchange = exchange_class(exchange_params)
+        exchange = get_exchange_client(exchange_id, api_key, secret_key)
 
         if not exchange.has['fetchOHLCV']:
             print(f"交易所 {exchange_id} 不支援 fetchOHLCV 功能。")
@@ -62,86 +72,561 @@ def fetch_ohlcv_data(api_key=None, secret_key=None, symbol='BTC/USDT', timeframe
         print(f"獲取數據時發生未知錯誤: {e}")
         return None
 
-def load_data_from_csv(file_path):
+# CSV 中可作為時間索引的欄位名稱 (小寫)，按優先順序排列
+DATE_COLUMN_CANDIDATES = ['date', 'timestamp', 'datetime', 'time', 'open time', 'open_time', 'unix']
+
+def _sniff_csv_header(file_path, max_lines=5):
     """
-    從 CSV 檔案加載 OHLCV 數據。
-    CSV 檔案應包含 'Date' (或 'Timestamp'), 'Open', 'High', 'Low', 'Close', 'Volume' 列。
-    'Date' (或 'Timestamp') 列應作為索引。
+    只讀取檔案開頭幾行一次，找出表頭行並對應欄位。
+    部分數據源 (例如 CryptoDataDownload) 會在表頭前加一行網址，這裡會自動跳過。
+
+    返回:
+    - tuple: (表頭前需跳過的行數, 日期欄位原名, {原欄位名: 標準欄位名})。找不到日期欄位時日期欄位為 None。
+    """
+    with open(file_path, newline='') as f:
+        lines = [line for _, line in zip(range(max_lines), csv.reader(f))]
+    for skiprows, header in enumerate(lines):
+        lower = {col.strip().lower(): col for col in header}
+        date_col = next((lower[name] for name in DATE_COLUMN_CANDIDATES if name in lower), None)
+        if date_col is None:
+            continue
+        mapping = {}
+        for std_col in OHLCV_COLUMNS:
+            original = lower.get(std_col.lower())
+            if original is None and std_col == 'Volume':
+                # 例如 'Volume BTC'、'Volume USDT'：取第一個以 volume 開頭的欄位 (基礎貨幣成交量)
+                original = next((col for col in header if col.strip().lower().startswith('volume')), None)
+            if original is not None:
+                mapping[original] = std_col
+        return skiprows, date_col, mapping
+    return 0, None, {}
+
+def _parse_time_column(values):
+    """將日期欄位轉為 DatetimeIndex。數值欄位視為 Unix 時間戳，按數量級判斷秒/毫秒/微秒/納秒。"""
+    if pd.api.types.is_numeric_dtype(values):
+        magnitude = abs(float(values.iloc[0])) if len(values) else 0
+        unit = 'ns' if magnitude > 1e17 else 'us' if magnitude > 1e14 else 'ms' if magnitude > 1e11 else 's'
+        return pd.DatetimeIndex(pd.to_datetime(values, unit=unit))
+    return pd.DatetimeIndex(pd.to_datetime(values))
+
+def iter_csv_chunks(file_path, chunksize=1000000, float32=False):
     """
+    單次掃描、分塊讀取 OHLCV CSV 檔案。表頭只解析一次，每塊只讀需要的欄位並使用明確的數據類型。
+
+    參數:
+    - file_path (str): CSV 檔案路徑。
+    - chunksize (int): 每塊的行數。
+    - float32 (bool): 是否以 float32 解析價格與成交量 (內存減半)。
+
+    返回:
+    - generator: 逐塊產生索引為 DatetimeIndex、列為 ['Open', 'High', 'Low', 'Close', 'Volume'] 的 DataFrame。
+                 類型轉換失敗的行會被移除；缺少 Volume 時以0填充。
+
+    異常:
+    - ValueError: 找不到日期欄位或必要的 OHLC 欄位。
+    """
+    skiprows, date_col, mapping = _sniff_csv_header(file_path)
+    missing = [col for col in OHLCV_COLUMNS[:4] if col not in mapping.values()]
+    if date_col is None or missing:
+        raise ValueError(f"CSV 檔案缺少日期欄位或必要的欄位: {missing or date_col}")
+    if 'Volume' not in mapping.values():
+        print(f"警告：CSV檔案中未找到 'Volume' 列，將以0填充。")
+
+    dtype = 'float32' if float32 else 'float64'
+    reader = pd.read_csv(file_path, skiprows=skiprows, usecols=[date_col] + list(mapping),
+                         dtype={col: dtype for col in mapping}, chunksize=chunksize)
+    n_done = 0
     try:
-        # 嘗試幾種常見的日期欄位名稱
-        date_columns = ['Date', 'timestamp']
-        df = None
-        for col_name in date_columns:
-            try:
-                df_temp = pd.read_csv(file_path, index_col=col_name, parse_dates=True)
-                # 檢查是否包含必要的 OHLCV 列 (大小寫不敏感)
-                required_cols_lower = {'open', 'high', 'low', 'close', 'volume'}
-                df_cols_lower = {col.lower() for col in df_temp.columns}
-                if required_cols_lower.issubset(df_cols_lower):
-                    df = df_temp
-                    break
-            except (ValueError, TypeError, KeyError):
+        for chunk in reader:
+            yield _standardize_chunk(chunk, date_col, mapping, dtype)
+            n_done += 1
+    except ValueError:
+        # 有無法解析為數字的值：從出錯的那一塊起改為逐列強制轉換 (無效值變為 NaN 後被移除)，只在髒數據時發生
+        print(f"警告：{file_path} 中有無法轉換為數字的值，改用較慢的容錯解析。")
+        reader = pd.read_csv(file_path, skiprows=skiprows, usecols=[date_col] + list(mapping),
+                             dtype=str, chunksize=chunksize)
+        for i, chunk in enumerate(reader):
+            if i < n_done:
                 continue
-        
-        if df is None:
-            print(f"錯誤：無法從 {file_path} 正確解析日期索引或找不到所有必要的OHLCV欄位。")
-            print("請確保CSV檔案包含一個可解析的日期欄位作為索引，以及Open, High, Low, Close, Volume欄位。")
+            for col in mapping:
+                chunk[col] = pd.to_numeric(chunk[col], errors='coerce').astype(dtype)
+            yield _standardize_chunk(chunk, date_col, mapping, dtype)
+
+def _standardize_chunk(chunk, date_col, mapping, dtype):
+    """把一塊原始 CSV 數據整理為標準 OHLCV 格式，並移除包含 NaN 的行。"""
+    index = _parse_time_column(chunk[date_col])
+    index.name = date_col
+    data = {std_col: chunk[original].to_numpy() for original, std_col in mapping.items()}
+    if 'Volume' not in data:
+        data['Volume'] = np.zeros(len(chunk), dtype=dtype)
+    df = pd.DataFrame(data, index=index, columns=OHLCV_COLUMNS)
+    valid = df.notna().all(axis=1).to_numpy()
+    return df if valid.all() else df[valid]
+
+def _csv_cache_paths(file_path, cache_dir, float32):
+    """以檔案路徑、修改時間和大小生成緩存檔名，原檔案變化後自動失效。"""
+    stat = os.stat(file_path)
+    key = f"{os.path.abspath(file_path)}|{stat.st_mtime_ns}|{stat.st_size}|{'float32' if float32 else 'float64'}"
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    base = os.path.join(cache_dir, f"{os.path.splitext(os.path.basename(file_path))[0]}-{digest}")
+    return base + '.index.npy', base + '.values.npy', base + '.name'
+
+def load_data_from_csv(file_path, float32=False, chunksize=1000000, use_cache=False, cache_dir='data/cache'):
+    """
+    從 CSV 檔案加載 OHLCV 數據。
+    CSV 檔案應包含一個日期欄位 ('Date'、'timestamp'、'Open time'、'unix' 等) 以及 Open, High, Low, Close, Volume 列
+    (大小寫不敏感)，日期欄位會作為索引。檔案只掃描一次並分塊解析，適合數 GB 的分鐘數據。
+
+    參數:
+    - file_path (str): CSV 檔案路徑。
+    - float32 (bool): 是否以 float32 存儲價格與成交量。預設為 False。
+    - chunksize (int): 分塊讀取的行數。
+    - use_cache (bool): 是否使用二進位緩存。緩存以檔案修改時間和大小為鍵，第二次加載幾乎不需要時間。
+    - cache_dir (str): 緩存目錄。
+
+    返回:
+    - pandas.DataFrame: 列為 ['Open', 'High', 'Low', 'Close', 'Volume'] 的 DataFrame。如果出錯則返回 None。
+    """
+    try:
+        if use_cache:
+            index_path, values_path, name_path = _csv_cache_paths(file_path, cache_dir, float32)
+            if os.path.exists(name_path):
+                with open(name_path) as f:
+                    index_name = f.read()
+                df = pd.DataFrame(np.load(values_path), index=pd.DatetimeIndex(np.load(index_path), name=index_name),
+                                  columns=OHLCV_COLUMNS, copy=False)
+                print(f"從緩存加載 {file_path} 成功。")
+                return df
+
+        # 每塊只保留 numpy 數組，最後一次性拼接，峰值內存約為結果大小的兩倍
+        index_parts, value_parts, index_name = [], [], None
+        for chunk in iter_csv_chunks(file_path, chunksize=chunksize, float32=float32):
+            index_name = chunk.index.name
+            index_parts.append(chunk.index.values)
+            value_parts.append(chunk.to_numpy())
+        if not index_parts:
+            print(f"錯誤：{file_path} 中沒有數據。")
             return None
+        index_values = np.concatenate(index_parts)
+        values = np.concatenate(value_parts)
+        del index_parts, value_parts
 
-        # 標準化列名為 backtesting.py 所需的格式 (首字母大寫)
-        column_mapping = {col.lower(): col for col in df.columns}
-        rename_dict = {}
-        for required_col_lower in ['open', 'high', 'low', 'close', 'volume']:
-            original_col_name = None
-            # 處理可能的列名大小寫問題
-            if required_col_lower in column_mapping:
-                 original_col_name = column_mapping[required_col_lower]
-            elif required_col_lower.capitalize() in df.columns: # 如果已经是首字母大写
-                 original_col_name = required_col_lower.capitalize()
-
-            if original_col_name and original_col_name!= required_col_lower.capitalize():
-                rename_dict[original_col_name] = required_col_lower.capitalize()
-            elif not original_col_name:
-                 # 如果找不到必要的列，則嘗試添加一個預設值（例如，如果Volume不存在）
-                 if required_col_lower == 'volume' and 'Volume' not in df.columns:
-                     print(f"警告：CSV檔案中未找到 'Volume' 列，將以0填充。")
-                     df['Volume'] = 0
-                 elif required_col_lower.capitalize() not in df.columns : # 如果連首字母大寫的都沒有
-                     print(f"錯誤：CSV檔案中缺少必要的 '{required_col_lower.capitalize()}' 列。")
-                     return None
-
-
-        if rename_dict:
-            df.rename(columns=rename_dict, inplace=True)
-        
-        # 確保列名是標準的 'Open', 'High', 'Low', 'Close', 'Volume'
-        expected_cols = ['Open', 'High', 'Low', 'Close', 'Volume']
-        for col in expected_cols:
-            if col not in df.columns:
-                if col == 'Volume': # 如果Volume不存在，給予預設值
-                    print(f"警告：CSV檔案中未找到 '{col}' 列，將以0填充。")
-                    df[col] = 0
-                else:
-                    print(f"錯誤：CSV檔案處理後仍缺少必要的 '{col}' 列。")
-                    return None
-        
-        # 確保數據類型正確
-        for col in expected_cols:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        
-        df.dropna(inplace=True) # 移除包含NaN的行，這些可能是由於類型轉換失敗造成的
+        if use_cache:
+            os.makedirs(cache_dir, exist_ok=True)
+            np.save(index_path, index_values)
+            np.save(values_path, values)
+            with open(name_path, 'w') as f: # 最後寫入，作為緩存完整的標記
+                f.write(index_name)
 
+        df = pd.DataFrame(values, index=pd.DatetimeIndex(index_values, name=index_name),
+                          columns=OHLCV_COLUMNS, copy=False)
         print(f"從 {file_path} 加載數據成功。")
-        return df[expected_cols] # 只返回需要的列，並按指定順序
+        return df
 
     except FileNotFoundError:
         print(f"錯誤: 找不到檔案 {file_path}")
         return None
+    except ValueError as e:
+        print(f"錯誤：無法從 {file_path} 正確解析日期索引或找不到所有必要的OHLCV欄位。({e})")
+        print("請確保CSV檔案包含一個可解析的日期欄位作為索引，以及Open, High, Low, Close, Volume欄位。")
+        return None
     except Exception as e:
         print(f"從 CSV 加載數據時發生錯誤: {e}")
         return None
 
+def get_store_partition(symbol, timeframe, store_dir='data/ohlcv', exchange_id='binance'):
+    """
+    返回某個交易對/K線週期在本地列式存儲中的分區目錄。
+    佈局為 <store_dir>/<exchange_id>/<symbol>/<timeframe>/，交易對中的 '/' 會替換為 '-'。
+    """
+    return os.path.join(store_dir, exchange_id, symbol.replace('/', '-'), timeframe)
+
+def _list_store_parts(partition_dir):
+    """按時間順序列出分區內的 Parquet 分片檔案。檔名形如 part-<首個時間戳>-<最後時間戳>.parquet。"""
+    if not os.path.isdir(partition_dir):
+        return []
+    return sorted(f for f in os.listdir(partition_dir) if f.startswith('part-') and f.endswith('.parquet'))
+
+def _last_stored_timestamp(partition_dir):
+    """從最後一個分片的檔名讀出已存儲的最新時間戳 (毫秒)，無需打開任何檔案。沒有數據時返回 None。"""
+    parts = _list_store_parts(partition_dir)
+    if not parts:
+        return None
+    return int(parts[-1][:-len('.parquet')].split('-')[2])
+
+def _select_store_parts(partition_dir, start_ms=None, end_ms=None):
+    """返回與時間範圍 (毫秒，含端點) 重疊的分片路徑。分片檔名包含時間範圍，可以直接跳過不相關的分片。"""
+    selected = []
+    for f in _list_store_parts(partition_dir):
+        first_ts, last_ts = (int(x) for x in f[:-len('.parquet')].split('-')[1:3])
+        if (start_ms is not None and last_ts < start_ms) or (end_ms is not None and first_ts > end_ms):
+            continue
+        selected.append(os.path.join(partition_dir, f))
+    return selected
+
+def _write_store_part(partition_dir, rows):
+    """將一批 [timestamp, open, high, low, close, volume] 行寫成一個新的 Parquet 分片，返回分片檔名。"""
+    df = pd.DataFrame(rows, columns=['timestamp'] + OHLCV_COLUMNS)
+    df['timestamp'] = df['timestamp'].astype('int64')
+    df[OHLCV_COLUMNS] = df[OHLCV_COLUMNS].astype('float64')
+    first_ts, last_ts = int(df['timestamp'].iloc[0]), int(df['timestamp'].iloc[-1])
+    os.makedirs(partition_dir, exist_ok=True)
+    file_name = f"part-{first_ts:013d}-{last_ts:013d}.parquet"
+    tmp_path = os.path.join(partition_dir, file_name + '.tmp')
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, os.path.join(partition_dir, file_name)) # 原子替換，避免中斷時留下半寫的分片
+    return file_name
+
+def _write_checked_part(partition_dir, rows, timeframe, quality):
+    """
+    按 config.DATA_QUALITY_CONFIG 檢查並修復一批新 K 線後寫成分片。只檢查這一批，並與已存儲的最後一根銜接
+    (缺口、重疊)，累積的質量報告寫入分區的 quality.json。返回 (寫入的行數, 更新後的累積報告)。
+    存儲中只寫入真實的 K 線：缺口只記錄在報告中 (加載時再補齊，見 load_ohlcv_from_store)，
+    不可能的 K 線在 'ffill' 策略下也只刪除，不寫入填平的數據。
+    """
+    from config import DATA_QUALITY_CONFIG
+    from data_quality import (has_issues, merge_quality_reports, partition_state, save_partition_quality,
+                              summarize_quality, timeframe_step_ms, validate_ohlcv_arrays)
+
+    if not DATA_QUALITY_CONFIG['enabled']:
+        _write_store_part(partition_dir, rows)
+        return len(rows), quality
+    rows = np.asarray(rows, dtype=float)
+    invalid = 'drop' if DATA_QUALITY_CONFIG['invalid'] == 'ffill' else DATA_QUALITY_CONFIG['invalid']
+    timestamps, values, report = validate_ohlcv_arrays(
+        rows[:, 0].astype('int64'), rows[:, 1:], timeframe_step_ms(timeframe), DATA_QUALITY_CONFIG['duplicates'],
+        invalid, 'flag', state=partition_state(partition_dir, quality))
+    if len(timestamps):
+        checked = pd.DataFrame(values, columns=OHLCV_COLUMNS)
+        checked.insert(0, 'timestamp', timestamps)
+        _write_store_part(partition_dir, checked)
+    quality = merge_quality_reports(quality, report)
+    save_partition_quality(partition_dir, quality)
+    if has_issues(report):
+        print(f"數據質量: {summarize_quality(report)}")
+    return len(timestamps), quality
+
+def compact_ohlcv_store(symbol, timeframe, store_dir='data/ohlcv', exchange_id='binance'):
+    """
+    將分區內的所有分片合併成一個 Parquet 檔案。
+    頻繁的增量同步會產生許多小分片，合併後可加快讀取。
+
+    返回:
+    - int: 合併後的數據行數。
+    """
+    partition_dir = get_store_partition(symbol, timeframe, store_dir, exchange_id)
+    parts = _list_store_parts(partition_dir)
+    if len(parts) <= 1:
+        return 0
+    df = pd.concat([pd.read_parquet(os.path.join(partition_dir, f)) for f in parts], ignore_index=True)
+    df = df.drop_duplicates(subset='timestamp', keep='last').sort_values('timestamp')
+    merged_name = _write_store_part(partition_dir, df)
+    for f in parts:
+        if f != merged_name:
+            os.remove(os.path.join(partition_dir, f))
+    return len(df)
+
+def sync_ohlcv_data(symbol='BTC/USDT', timeframe='1d', exchange=None, exchange_id='binance',
+                    api_key=None, secret_key=None, since=None, batch_limit=1000,
+                    store_dir='data/ohlcv', flush_rows=100000, max_parts=64):
+    """
+    以 `since` 游標分頁拉取完整的歷史 K 線，並增量寫入本地 Parquet 存儲。
+    只會請求比本地已有數據更新的 K 線，尚未收盤的最後一根 K 線不會寫入。
+    每批新 K 線寫入前按 config.DATA_QUALITY_CONFIG 檢查並修復 (只檢查新數據)，累積報告見 data_quality.store_quality_report。
+
+    參數:
+    - symbol (str): 交易對，例如 'BTC/USDT'。
+    - timeframe (str): K線週期，例如 '1h'。
+    - exchange (ccxt.Exchange, optional): 已建立的交易所實例，測試時可傳入假的交易所物件。
+                                          為 None 時使用 exchange_id 與金鑰對應的共用客戶端 (限速並自動重試)。
+    - exchange_id (str): 交易所ID，同時用作存儲分區名稱。
+    - api_key (str, optional): API 金鑰。
+    - secret_key (str, optional): API 密鑰。
+    - since (int, optional): 本地無數據時的起始時間戳 (毫秒)。預設為 0，即交易所能提供的最早數據。
+    - batch_limit (int): 每次請求的 K 線數量上限。
+    - store_dir (str): 本地存儲根目錄。
+    - flush_rows (int): 累積多少行寫出一個分片，用於限制內存佔用。
+    - max_parts (int): 分片數量超過此值時自動合併。
+
+    返回:
+    - int: 本次新寫入的 K 線數量 (含補齊的缺失 K 線)。如果出錯則返回 None (已寫入的分片會保留，下次從斷點繼續)。
+    """
+    import ccxt
+    from exchange_client import get_exchange_client
+
+    from data_quality import load_partition_quality
+
+    partition_dir = get_store_partition(symbol, timeframe, store_dir, exchange_id)
+    last_ts = _last_stored_timestamp(partition_dir)
+    quality = load_partition_quality(partition_dir)
+    # 從最後一根 K 線之後的第一毫秒繼續：月線等長度不固定的週期不能按固定間隔推算下一根的開盤時間
+    cursor = last_ts + 1 if last_ts is not None else (since or 0)
+    total_new = 0
+    pending = []
+
+    try:
+        if exchange is None:
+            exchange = get_exchange_client(exchange_id, api_key, secret_key)
+        if not exchange.has['fetchOHLCV']:
+            print(f"交易所 {exchange_id} 不支援 fetchOHLCV 功能。")
+            return None
+
+        print(f"正在同步 {symbol} 的 {timeframe} K線數據至 {partition_dir}...")
+        while True:
+            batch = exchange.fetch_ohlcv(symbol, timeframe, since=cursor, limit=batch_limit)
+            # 只保留游標之後且已收盤的 K 線
+            now_ms = int(time.time() * 1000)
+            bar_ends = timeframe_bar_ends([row[0] for row in batch], timeframe)
+            batch = [row for row, end in zip(batch, bar_ends) if row[0] >= cursor and end <= now_ms]
+            if not batch:
+                break
+            pending.extend(batch)
+            cursor = batch[-1][0] + 1
+            if len(pending) >= flush_rows:
+                written, quality = _write_checked_part(partition_dir, pending, timeframe, quality)
+                total_new += written
+                pending = []
+
+    except ccxt.NetworkError as e:
+        print(f"CCXT 網路錯誤: {e}")
+        total_new = None
+    except ccxt.ExchangeError as e:
+        print(f"CCXT 交易所錯誤: {e}")
+        total_new = None
+    except Exception as e:
+        print(f"同步數據時發生未知錯誤: {e}")
+        total_new = None
+    finally:
+        # 出錯時也把已拉取的數據寫入，下次同步從斷點繼續
+        if pending:
+            written, quality = _write_checked_part(partition_dir, pending, timeframe, quality)
+            if total_new is not None:
+                total_new += written
+
+    if len(_list_store_parts(partition_dir)) > max_parts:
+        compact_ohlcv_store(symbol, timeframe, store_dir, exchange_id)
+    if total_new is not None:
+        print(f"同步完成，新增 {total_new} 條 K 線。")
+    return total_new
+
+def load_ohlcv_from_store(symbol='BTC/USDT', timeframe='1d', store_dir='data/ohlcv', exchange_id='binance',
+                          start=None, end=None, fill_gaps=None):
+    """
+    從本地 Parquet 存儲讀取 OHLCV 數據。
+
+    參數:
+    - symbol (str): 交易對。
+    - timeframe (str): K線週期。
+    - store_dir (str): 本地存儲根目錄。
+    - exchange_id (str): 交易所ID。
+    - start, end (str | pd.Timestamp, optional): 只讀取此時間範圍內的數據 (含端點)。
+    - fill_gaps (bool, optional): 是否以前收盤價補齊缺失的 K 線 (成交量為 0，只在返回的數據中，不寫回存儲)。
+                                  預設按 config.DATA_QUALITY_CONFIG (開啟檢查且 gaps 為 'ffill' 時補齊)；
+                                  把結果再寫入其他存儲 (例如 compact_store) 時應傳入 False。
+
+    返回:
+    - pandas.DataFrame: 與 fetch_ohlcv_data 相同格式的 DataFrame。如果沒有數據則返回 None。
+    """
+    partition_dir = get_store_partition(symbol, timeframe, store_dir, exchange_id)
+    parts = _list_store_parts(partition_dir)
+    if not parts:
+        print(f"本地存儲中沒有 {symbol} 的 {timeframe} 數據: {partition_dir}")
+        return None
+
+    start_ms = int(pd.Timestamp(start).value // 10**6) if start is not None else None
+    end_ms = int(pd.Timestamp(end).value // 10**6) if end is not None else None
+    selected = _select_store_parts(partition_dir, start_ms, end_ms)
+    if not selected:
+        return None
+
+    df = pd.concat([pd.read_parquet(f) for f in selected], ignore_index=True)
+    if start_ms is not None:
+        df = df[df['timestamp'] >= start_ms]
+    if end_ms is not None:
+        df = df[df['timestamp'] <= end_ms]
+    df = df.drop_duplicates(subset='timestamp', keep='last')
+    df.index = pd.to_datetime(df.pop('timestamp'), unit='ms')
+    df.index.name = 'timestamp'
+    return _fill_loaded_gaps(df.sort_index()[OHLCV_COLUMNS], timeframe, fill_gaps)
+
+def _fill_loaded_gaps(df, timeframe, fill_gaps):
+    """按 fill_gaps (None 時按 config.DATA_QUALITY_CONFIG) 補齊從存儲加載的數據中的缺口。"""
+    if fill_gaps is None:
+        from config import DATA_QUALITY_CONFIG
+        fill_gaps = DATA_QUALITY_CONFIG['enabled'] and DATA_QUALITY_CONFIG['gaps'] == 'ffill'
+    if not fill_gaps:
+        return df
+    from data_quality import fill_missing_bars
+    return fill_missing_bars(df, timeframe)
+
+# 1970-01-01 是週四；交易所的週線從週一 00:00 UTC 開始
+WEEK_OFFSET_MS = 4 * 24 * 3600 * 1000
+
+def timeframe_bucket_starts(timestamps_ms, timeframe):
+    """
+    返回每個時間戳所屬的高週期 K 線的開盤時間 (毫秒)，邊界與交易所一致：
+    分鐘/小時/日線按 UTC 紀元對齊，週線從週一開始，月線 ('1M') 從每月 1 日開始。
+    """
+    timestamps_ms = np.asarray(timestamps_ms, dtype='int64')
+    if timeframe.endswith('M'):
+        n_months = int(timeframe[:-1])
+        months = timestamps_ms.astype('datetime64[ms]').astype('datetime64[M]').astype('int64') // n_months * n_months
+        return months.astype('datetime64[M]').astype('datetime64[ms]').astype('int64')
+    step = timeframe_to_ms(timeframe)
+    offset = WEEK_OFFSET_MS if timeframe.endswith('w') else 0
+    return (timestamps_ms - offset) // step * step + offset
+
+def timeframe_bar_ends(timestamps_ms, timeframe):
+    """
+    返回以這些時間戳開盤的 K 線的收盤時間 (即下一根 K 線的開盤時間，毫秒)。
+    月線 ('1M') 和年線 ('1y') 按日曆月份/年份計算，不使用 timeframe_to_ms 的固定 30 天/365 天。
+    """
+    timestamps_ms = np.asarray(timestamps_ms, dtype='int64')
+    unit = {'M': 'M', 'y': 'Y'}.get(timeframe[-1])
+    if unit is None:
+        return timestamps_ms + timeframe_to_ms(timeframe)
+    starts = timestamps_ms.astype('datetime64[ms]').astype(f'datetime64[{unit}]')
+    return (starts + int(timeframe[:-1])).astype('datetime64[ms]').astype('int64')
+
+def _aggregate_ohlcv(timestamps_ms, values, timeframe):
+    """對按時間排序的 K 線做向量化 OHLCV 聚合，返回 (各桶開盤時間, 聚合後的數組, 各桶起始行號)。"""
+    buckets = timeframe_bucket_starts(timestamps_ms, timeframe)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(buckets)] - 1
+    aggregated = np.empty((len(starts), len(OHLCV_COLUMNS)))
+    aggregated[:, 0] = values[starts, 0]
+    aggregated[:, 1] = np.maximum.reduceat(values[:, 1], starts)
+    aggregated[:, 2] = np.minimum.reduceat(values[:, 2], starts)
+    aggregated[:, 3] = values[ends, 3]
+    aggregated[:, 4] = np.add.reduceat(values[:, 4], starts)
+    return buckets[starts], aggregated, starts
+
+def resample_ohlcv(data_df, timeframe):
+    """
+    把低週期 OHLCV 數據聚合為高週期 (例如 1m -> 4h)，桶邊界與交易所一致 (見 timeframe_bucket_starts)。
+
+    參數:
+    - data_df (pd.DataFrame): 按時間排序、索引為 DatetimeIndex 的 OHLCV 數據。
+    - timeframe (str): 目標週期，例如 '15m'、'4h'、'1d'、'1w'、'1M'。
+
+    返回:
+    - pd.DataFrame: 索引為各桶開盤時間的 OHLCV 數據。最後一桶可能尚未收盤。
+    """
+    timestamps_ms = data_df.index.values.astype('datetime64[ms]').astype('int64')
+    buckets, aggregated, _ = _aggregate_ohlcv(timestamps_ms, data_df[OHLCV_COLUMNS].to_numpy(dtype=float), timeframe)
+    index = pd.DatetimeIndex(pd.to_datetime(buckets, unit='ms'), name=data_df.index.name)
+    return pd.DataFrame(aggregated, index=index, columns=OHLCV_COLUMNS)
+
+def _resampled_timeframe(timeframe, base_timeframe):
+    """重採樣結果在存儲中的分區名稱，與直接從交易所同步的同週期數據分開存放。"""
+    return f'{timeframe}-from-{base_timeframe}'
+
+def update_resampled_store(symbol, timeframe, base_timeframe='1m', store_dir='data/ohlcv', exchange_id='binance',
+                           max_parts=64):
+    """
+    由本地存儲的低週期 K 線增量生成高週期 K 線，寫入分區 <timeframe>-from-<base_timeframe>。
+    第一次運行時逐個分片掃描全部歷史 (內存只保留一個分片)；之後只讀取最後一個 (可能未收盤的) 桶以後的分片，
+    重新聚合該桶和新增的桶，不會重新處理整段歷史。
+
+    參數:
+    - symbol (str): 交易對。
+    - timeframe (str): 目標週期，例如 '4h'。
+    - base_timeframe (str): 來源週期，預設為 '1m' (需先用 sync_ohlcv_data 同步)。
+    - store_dir (str): 本地存儲根目錄。
+    - exchange_id (str): 交易所ID。
+    - max_parts (int): 分片數量超過此值時自動合併。
+
+    返回:
+    - int: 本次寫入 (新增或更新) 的高週期 K 線數量。沒有來源數據時返回 None。
+    """
+    base_dir = get_store_partition(symbol, base_timeframe, store_dir, exchange_id)
+    target_timeframe = _resampled_timeframe(timeframe, base_timeframe)
+    target_dir = get_store_partition(symbol, target_timeframe, store_dir, exchange_id)
+    base_last = _last_stored_timestamp(base_dir)
+    if base_last is None:
+        print(f"本地存儲中沒有 {symbol} 的 {base_timeframe} 數據: {base_dir}")
+        return None
+
+    # 記錄已聚合到的來源時間戳，來源沒有新 K 線時直接返回
+    source_path = os.path.join(target_dir, 'source_timestamp')
+    if os.path.exists(source_path):
+        with open(source_path) as f:
+            if int(f.read()) == base_last:
+                return 0
+    last_bucket = _last_stored_timestamp(target_dir)
+
+    bucket_parts, value_parts = [], []
+    carry_ts = np.empty(0, dtype='int64')
+    carry_values = np.empty((0, len(OHLCV_COLUMNS)))
+    for path in _select_store_parts(base_dir, start_ms=last_bucket):
+        part = pd.read_parquet(path)
+        timestamps = np.r_[carry_ts, part['timestamp'].to_numpy(dtype='int64')]
+        values = np.r_[carry_values, part[OHLCV_COLUMNS].to_numpy(dtype=float)]
+        if last_bucket is not None:
+            keep = timestamps >= last_bucket
+            timestamps, values = timestamps[keep], values[keep]
+        if len(timestamps) > 1 and not (np.diff(timestamps) > 0).all():
+            order = pd.Series(np.arange(len(timestamps)), index=timestamps)
+            order = order[~order.index.duplicated(keep='last')].sort_index().to_numpy()
+            timestamps, values = timestamps[order], values[order]
+        if not len(timestamps):
+            continue
+        buckets, aggregated, starts = _aggregate_ohlcv(timestamps, values, timeframe)
+        # 最後一桶可能延續到下一個分片，留到下一輪再聚合
+        bucket_parts.append(buckets[:-1])
+        value_parts.append(aggregated[:-1])
+        carry_ts, carry_values = timestamps[starts[-1]:], values[starts[-1]:]
+    if len(carry_ts):
+        buckets, aggregated, _ = _aggregate_ohlcv(carry_ts, carry_values, timeframe)
+        bucket_parts.append(buckets)
+        value_parts.append(aggregated)
+
+    buckets = np.concatenate(bucket_parts) if bucket_parts else np.empty(0, dtype='int64')
+    if len(buckets):
+        rows = pd.DataFrame(np.concatenate(value_parts), columns=OHLCV_COLUMNS)
+        rows.insert(0, 'timestamp', buckets)
+        # 新分片與舊分片在最後一桶上重疊，讀取時保留較新的分片中的值
+        _write_store_part(target_dir, rows)
+    tmp_path = source_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(str(base_last))
+    os.replace(tmp_path, source_path)
+
+    if len(_list_store_parts(target_dir)) > max_parts:
+        compact_ohlcv_store(symbol, target_timeframe, store_dir, exchange_id)
+    return len(buckets)
+
+def load_resampled_ohlcv(symbol='BTC/USDT', timeframe='1h', base_timeframe='1m', store_dir='data/ohlcv',
+                         exchange_id='binance', start=None, end=None, include_partial=False, update=True,
+                         fill_gaps=None):
+    """
+    讀取由本地低週期 K 線重採樣得到的高週期 OHLCV 數據，不需要任何 API 請求。
+
+    參數:
+    - symbol, timeframe, base_timeframe, store_dir, exchange_id: 同 update_resampled_store。
+    - start, end (str | pd.Timestamp, optional): 只讀取此時間範圍內的數據 (含端點)。
+    - include_partial (bool): 是否保留最後一根尚未收盤的 K 線。預設為 False，與交易所只返回已收盤 K 線的回測用法一致。
+    - update (bool): 讀取前是否先增量更新重採樣結果。
+    - fill_gaps (bool, optional): 同 load_ohlcv_from_store。
+
+    返回:
+    - pandas.DataFrame: 與 load_ohlcv_from_store 相同格式的 DataFrame。如果沒有數據則返回 None。
+    """
+    if update and update_resampled_store(symbol, timeframe, base_timeframe, store_dir, exchange_id) is None:
+        return None
+    df = load_ohlcv_from_store(symbol, _resampled_timeframe(timeframe, base_timeframe), store_dir, exchange_id,
+                               start=start, end=end, fill_gaps=False)
+    if df is None or df.empty:
+        return df
+    if not include_partial:
+        # 來源的下一根 K 線仍屬於最後一桶，說明這一桶還沒收盤
+        base_last = _last_stored_timestamp(get_store_partition(symbol, base_timeframe, store_dir, exchange_id))
+        base_step = timeframe_to_ms(base_timeframe)
+        last_bucket = int(df.index[-1:].values.astype('datetime64[ms]').astype('int64')[0])
+        if timeframe_bucket_starts([base_last + base_step], timeframe)[0] == last_bucket:
+            df = df.iloc[:-1]
+    return _fill_loaded_gaps(df, timeframe, fill_gaps)
+
 if __name__ == '__main__':
     # 測試 fetch_ohlcv_data (需要有效的API金鑰或交易所支持公開訪問)
     # test_df_api = fetch_ohlcv_data(symbol='ETH/USDT', timeframe='1h', limit=10)
@@ -181,4 +666,35 @@ if __name__ == '__main__':
     if test_df_csv_lower is not None:
         print("\nCSV (小寫列名) 數據測試:")
         print(test_df_csv_lower.head())
-        print(test_df_csv_lower.info())
\ No newline at end of file
+        print(test_df_csv_lower.info())
+
+    # 測試 sync_ohlcv_data：用一個回放固定K線的假交易所代替真實的 ccxt 交易所
+    class _FakeExchange:
+        has = {'fetchOHLCV': True}
+
+        def __init__(self, candles):
+            self.candles = candles
+
+        def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+            rows = [c for c in self.candles if since is None or c[0] >= since]
+            return rows[:limit]
+
+    hour_ms = 3600 * 1000
+    fake_candles = [[i * hour_ms, 100 + i, 101 + i, 99 + i, 100.5 + i, 10] for i in range(250)]
+    sample_store_dir = 'data/ohlcv_sample'
+    import shutil
+    shutil.rmtree(sample_store_dir, ignore_errors=True)
+    fake_exchange = _FakeExchange(fake_candles[:200])
+    sync_ohlcv_data('BTC/USDT', '1h', exchange=fake_exchange, batch_limit=64, store_dir=sample_store_dir)
+    fake_exchange.candles = fake_candles # 新的K線到達後再次同步，只會拉取新增的部分
+    sync_ohlcv_data('BTC/USDT', '1h', exchange=fake_exchange, batch_limit=64, store_dir=sample_store_dir)
+    test_df_store = load_ohlcv_from_store('BTC/USDT', '1h', store_dir=sample_store_dir)
+    if test_df_store is not None:
+        print("\n本地存儲數據測試:")
+        print(test_df_store.tail())
+        print(f"共 {len(test_df_store)} 條，時間戳唯一: {test_df_store.index.is_unique}")
+    # 測試本地重採樣：由存儲中的 1h K 線生成 4h K 線，最後一根未收盤的 4h K 線預設不返回
+    test_df_4h = load_resampled_ohlcv('BTC/USDT', '4h', base_timeframe='1h', store_dir=sample_store_dir)
+    if test_df_4h is not None:
+        print("\n本地重採樣 (1h -> 4h) 測試:")
+        print(test_df_4h.tail())
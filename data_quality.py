@@ -0,0 +1,328 @@
+# data_quality.py
+# OHLCV 數據的向量化質量檢查與修復：亂序、重複時間戳、與週期不符的缺口以及不可能的 K 線 (High < Low 等)。
+# validate_ohlcv 返回修復後的數據和質量報告；傳入上一次的 state 時只檢查新追加的數據，
+# sync_ohlcv_data 用它在寫入本地存儲前檢查每一批新 K 線，累積的報告保存在分區目錄的 quality.json 中。
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from config import DATA_QUALITY_CONFIG
+from data_handler import OHLCV_COLUMNS, _list_store_parts, get_store_partition, timeframe_to_ms
+
+QUALITY_FILE = 'quality.json'
+COUNT_KEYS = ['rows_in', 'rows_out', 'unsorted', 'duplicates', 'overlap', 'invalid', 'irregular',
+              'missing_bars', 'filled_bars', 'dropped']
+# 報告中最多記錄的無效 K 線時間戳數量
+MAX_INVALID_TIMESTAMPS = 1000
+
+def timeframe_step_ms(timeframe):
+    """返回週期的固定間隔 (毫秒)。月線和年線長度不固定，返回 None (不檢查缺口)。"""
+    if timeframe is None or timeframe[-1] in ('M', 'y'):
+        return None
+    return timeframe_to_ms(timeframe)
+
+def infer_step_ms(timestamps_ms):
+    """由時間戳間隔的中位數推斷 K 線週期 (毫秒)；數據太少時返回 None。"""
+    diffs = np.diff(np.asarray(timestamps_ms, dtype='int64'))
+    diffs = diffs[diffs > 0]
+    return int(np.median(diffs)) if len(diffs) else None
+
+def _invalid_mask(values):
+    """向量化檢查不可能的 K 線：價格 NaN 或非正、High/Low 不包住 Open/Close、成交量為負或 NaN。"""
+    o, h, l, c, v = values.T
+    with np.errstate(invalid='ignore'):
+        return (~np.isfinite(values).all(axis=1) | (values[:, :4] <= 0).any(axis=1) | (h < l)
+                | (h < np.maximum(o, c)) | (l > np.minimum(o, c)) | (v < 0))
+
+def validate_ohlcv_arrays(timestamps, values, step_ms, duplicates, invalid, gaps, state=None):
+    """
+    validate_ohlcv 的數組版本。timestamps 為毫秒 int64 數組，values 為 (N, 5) 的 OHLCV 數組。
+    返回 (timestamps, values, report)。
+    """
+    for name, policy, allowed in (('duplicates', duplicates, ('last', 'first', 'flag')),
+                                  ('invalid', invalid, ('drop', 'ffill', 'flag')),
+                                  ('gaps', gaps, ('ffill', 'flag'))):
+        if policy not in allowed:
+            raise ValueError(f"{name} 必須是 {allowed} 之一，收到 {policy!r}")
+    last_ts = state.get('last_timestamp') if state else None
+    last_close = state.get('last_close') if state else None
+    report = dict.fromkeys(COUNT_KEYS, 0)
+    report['rows_in'] = len(timestamps)
+    report['gap_ranges'] = []
+    report['invalid_timestamps'] = []
+
+    # 1. 排序 (穩定排序，重複時間戳保持原來的先後順序)
+    if len(timestamps) > 1:
+        report['unsorted'] = int((timestamps[1:] < timestamps[:-1]).sum())
+        if report['unsorted']:
+            order = np.argsort(timestamps, kind='stable')
+            timestamps, values = timestamps[order], values[order]
+
+    # 2. 重複時間戳，以及已經檢查過的舊數據 (時間戳不晚於 state 中的最後一根)
+    same_as_next = timestamps[1:] == timestamps[:-1]
+    report['duplicates'] = int(same_as_next.sum())
+    keep = np.ones(len(timestamps), dtype=bool)
+    if duplicates == 'last':
+        keep[:-1] = ~same_as_next
+    elif duplicates == 'first':
+        keep[1:] = ~same_as_next
+    if last_ts is not None:
+        overlap = timestamps <= last_ts
+        report['overlap'] = int((overlap & keep).sum())
+        keep &= ~overlap
+    if not keep.all():
+        timestamps, values = timestamps[keep], values[keep]
+
+    # 3. 不可能的 K 線
+    bad = _invalid_mask(values)
+    report['invalid'] = int(bad.sum())
+    report['invalid_timestamps'] = timestamps[bad][-MAX_INVALID_TIMESTAMPS:].tolist()
+    if report['invalid'] and invalid != 'flag':
+        if invalid == 'ffill':
+            # 以前一根有效 K 線的收盤價填平 (沒有前一根時用 state 中的收盤價，仍沒有則刪除)
+            previous_valid = np.maximum.accumulate(np.where(bad, -1, np.arange(len(bad))))
+            fill_close = np.where(previous_valid >= 0, values[np.maximum(previous_valid, 0), 3],
+                                  np.nan if last_close is None else last_close)
+            fillable = bad & np.isfinite(fill_close)
+            values = values.copy()
+            values[fillable, :4] = fill_close[fillable, None]
+            values[fillable, 4] = 0.0
+            drop = bad & ~fillable
+        else:
+            drop = bad
+        if drop.any():
+            timestamps, values = timestamps[~drop], values[~drop]
+        bad = np.zeros(len(timestamps), dtype=bool)
+
+    # 4. 與週期不符的缺口
+    if step_ms and len(timestamps):
+        previous = np.r_[timestamps[0] if last_ts is None else last_ts, timestamps[:-1]]
+        diffs = timestamps - previous
+        report['irregular'] = int((diffs % step_ms != 0).sum())
+        gap_at = np.flatnonzero(diffs > step_ms)
+        missing = (diffs[gap_at] - 1) // step_ms
+        report['missing_bars'] = int(missing.sum())
+        report['gap_ranges'] = np.column_stack([previous[gap_at] + step_ms, previous[gap_at] + missing * step_ms,
+                                                missing]).tolist()
+        if report['missing_bars'] and gaps == 'ffill':
+            # 在每個缺口的位置插入以前收盤價填平的 K 線 (成交量為 0)
+            total = report['missing_bars']
+            owner = np.repeat(np.arange(len(gap_at)), missing)
+            k = np.arange(total) - np.repeat(np.cumsum(missing) - missing, missing) + 1
+            new_ts = previous[gap_at][owner] + k * step_ms
+            position = gap_at[owner]
+            close_before = values[np.maximum(position - 1, 0), 3]
+            if last_close is not None:
+                close_before = np.where(position == 0, last_close, close_before)
+            new_values = np.zeros((total, len(OHLCV_COLUMNS)))
+            new_values[:, :4] = close_before[:, None]
+            timestamps = np.insert(timestamps, position, new_ts)
+            values = np.insert(values, position, new_values, axis=0)
+            bad = np.insert(bad, position, False)
+            report['filled_bars'] = total
+
+    report['rows_out'] = len(timestamps)
+    report['dropped'] = report['rows_in'] + report['filled_bars'] - report['rows_out']
+    # 下一批數據從這裡接著檢查
+    new_state = {'step_ms': step_ms, 'last_timestamp': last_ts, 'last_close': last_close}
+    if len(timestamps):
+        new_state['last_timestamp'] = int(timestamps[-1])
+        valid_closes = values[~bad, 3]
+        if len(valid_closes):
+            new_state['last_close'] = float(valid_closes[-1])
+    report['state'] = new_state
+    return timestamps, values, report
+
+def validate_ohlcv(data_df: pd.DataFrame, timeframe=None, duplicates=None, invalid=None, gaps=None, state=None):
+    """
+    檢查並修復 OHLCV 數據，所有檢查都是向量化的。
+
+    依次處理: 亂序 (總是重新排序)、重複時間戳、不可能的 K 線 (價格 NaN 或非正、High < Low、
+    High/Low 不包住 Open/Close、成交量為負)，最後按週期檢查缺口。
+
+    參數:
+    - data_df (pd.DataFrame): 索引為 DatetimeIndex 的 OHLCV 數據。
+    - timeframe (str, optional): K 線週期，例如 '1m'。為 None 時由時間戳間隔的中位數推斷。
+    - duplicates, invalid, gaps (str, optional): 修復方式，預設取 config.DATA_QUALITY_CONFIG:
+        duplicates: 'last' / 'first' 保留一條，'flag' 只報告；
+        invalid: 'drop' 刪除，'ffill' 以前收盤價填平 (成交量為 0)，'flag' 只報告；
+        gaps: 'ffill' 以前收盤價補齊缺失的 K 線 (成交量為 0)，'flag' 只報告。
+    - state (dict, optional): 上一次調用返回的 report['state']。傳入時只檢查新追加的數據：
+                              不晚於上次最後一根的 K 線視為已檢查的重疊部分並丟棄，
+                              缺口檢查和填補也會銜接上一批數據。
+
+    返回:
+    - tuple: (修復後的 DataFrame, 質量報告 dict)。報告包含各類問題的數量 (COUNT_KEYS)、
+             'gap_ranges' ([首根缺失毫秒, 末根缺失毫秒, 缺失根數] 列表)、'invalid_timestamps' 和下一次調用用的 'state'。
+    """
+    duplicates = duplicates or DATA_QUALITY_CONFIG['duplicates']
+    invalid = invalid or DATA_QUALITY_CONFIG['invalid']
+    gaps = gaps or DATA_QUALITY_CONFIG['gaps']
+    timestamps = data_df.index.values.astype('datetime64[ms]').astype('int64')
+    values = data_df[OHLCV_COLUMNS].to_numpy(dtype=float)
+    if state and state.get('step_ms'):
+        step_ms = state['step_ms']
+    else:
+        step_ms = timeframe_step_ms(timeframe) if timeframe else infer_step_ms(timestamps)
+    timestamps, values, report = validate_ohlcv_arrays(timestamps, values, step_ms, duplicates, invalid, gaps, state)
+    index = pd.DatetimeIndex(timestamps.astype('datetime64[ms]'), name=data_df.index.name).as_unit(data_df.index.unit)
+    return pd.DataFrame(values, index=index, columns=OHLCV_COLUMNS), report
+
+def fill_missing_bars(data_df: pd.DataFrame, timeframe):
+    """
+    以前收盤價補齊已排序、無重複的 OHLCV 數據中缺失的 K 線 (成交量為 0)。用於從本地存儲加載的數據：
+    存儲中只保存真實 K 線，補齊的 K 線只存在於返回的 DataFrame 中。沒有缺口時直接返回原數據。
+
+    參數:
+    - data_df (pd.DataFrame): 索引為 DatetimeIndex 的 OHLCV 數據。
+    - timeframe (str): K 線週期；月線和年線長度不固定，不補齊。
+
+    返回:
+    - pd.DataFrame: 補齊後的數據。
+    """
+    step_ms = timeframe_step_ms(timeframe)
+    timestamps = data_df.index.values.astype('datetime64[ms]').astype('int64')
+    if not step_ms or len(timestamps) < 2 or (np.diff(timestamps) <= step_ms).all():
+        return data_df
+    timestamps, values, _ = validate_ohlcv_arrays(timestamps, data_df[OHLCV_COLUMNS].to_numpy(dtype=float), step_ms,
+                                                  'flag', 'flag', 'ffill')
+    index = pd.DatetimeIndex(timestamps.astype('datetime64[ms]'), name=data_df.index.name).as_unit(data_df.index.unit)
+    return pd.DataFrame(values, index=index, columns=OHLCV_COLUMNS)
+
+def merge_quality_reports(total, report, max_gap_ranges=None):
+    """把一批數據的質量報告累加到 total (可為 None)，返回新的累積報告。缺口區間只保留最新的 max_gap_ranges 個。"""
+    max_gap_ranges = DATA_QUALITY_CONFIG['max_gap_ranges'] if max_gap_ranges is None else max_gap_ranges
+    if total is None:
+        total = {**dict.fromkeys(COUNT_KEYS, 0), 'gap_ranges': [], 'invalid_timestamps': [], 'state': None}
+    merged = {key: total.get(key, 0) + report[key] for key in COUNT_KEYS}
+    merged['gap_ranges'] = (total['gap_ranges'] + report['gap_ranges'])[-max_gap_ranges:]
+    merged['invalid_timestamps'] = (total['invalid_timestamps'] + report['invalid_timestamps'])[-MAX_INVALID_TIMESTAMPS:]
+    merged['state'] = report['state']
+    return merged
+
+def has_issues(report):
+    """報告中是否有任何需要注意的問題。"""
+    return any(report[key] for key in ('unsorted', 'duplicates', 'invalid', 'irregular', 'missing_bars'))
+
+def summarize_quality(report):
+    """返回一行中文摘要，例如 '重複 3 條，缺失 120 根 (已補齊 120 根)，無效 2 根 (刪除 2 根)'。"""
+    parts = []
+    if report['unsorted']:
+        parts.append(f"亂序 {report['unsorted']} 處 (已排序)")
+    if report['duplicates']:
+        parts.append(f"重複時間戳 {report['duplicates']} 條")
+    if report['invalid']:
+        parts.append(f"無效 K 線 {report['invalid']} 根")
+    if report['missing_bars']:
+        parts.append(f"缺失 {report['missing_bars']} 根 ({len(report['gap_ranges'])} 個缺口，已補齊 {report['filled_bars']} 根)")
+    if report['irregular']:
+        parts.append(f"未對齊週期的間隔 {report['irregular']} 處")
+    if report['dropped']:
+        parts.append(f"共刪除 {report['dropped']} 行")
+    return '，'.join(parts) if parts else '未發現問題'
+
+def print_quality_report(report, max_rows=10):
+    """以易讀的格式打印質量報告，包括最新的幾個缺口區間。"""
+    print(f"數據質量: {report['rows_in']} 行 -> {report['rows_out']} 行；{summarize_quality(report)}")
+    if report['gap_ranges']:
+        gaps = pd.DataFrame(report['gap_ranges'][-max_rows:], columns=['start', 'end', 'missing_bars'])
+        gaps['start'] = pd.to_datetime(gaps['start'], unit='ms')
+        gaps['end'] = pd.to_datetime(gaps['end'], unit='ms')
+        print(f"最新的 {len(gaps)} 個缺口:")
+        print(gaps.to_string(index=False))
+    if report['invalid_timestamps']:
+        shown = pd.to_datetime(report['invalid_timestamps'][-max_rows:], unit='ms')
+        print(f"無效 K 線 (最新 {len(shown)} 根): {', '.join(str(ts) for ts in shown)}")
+
+def check_loaded_data(data_df: pd.DataFrame, timeframe=None, label='數據'):
+    """
+    按 config.DATA_QUALITY_CONFIG 檢查並修復剛加載的 CSV/API 數據，有問題時打印摘要。
+
+    參數:
+    - data_df (pd.DataFrame): OHLCV 數據，可為 None。
+    - timeframe (str, optional): K 線週期；為 None 時由數據推斷 (CSV 的週期不一定與 config.TIMEFRAME 相同)。
+    - label (str): 打印摘要時使用的名稱。
+
+    返回:
+    - pd.DataFrame: 修復後的數據 (未開啟檢查或數據為空時原樣返回)。
+    """
+    if data_df is None or data_df.empty or not DATA_QUALITY_CONFIG['enabled']:
+        return data_df
+    clean_df, report = validate_ohlcv(data_df, timeframe)
+    if has_issues(report):
+        print(f"{label}質量: {summarize_quality(report)}")
+    return clean_df
+
+def load_partition_quality(partition_dir):
+    """讀取存儲分區的累積質量報告；沒有時返回 None。"""
+    path = os.path.join(partition_dir, QUALITY_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def save_partition_quality(partition_dir, quality):
+    """原子地寫入存儲分區的累積質量報告。"""
+    os.makedirs(partition_dir, exist_ok=True)
+    path = os.path.join(partition_dir, QUALITY_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(quality, f)
+    os.replace(path + '.tmp', path)
+
+def partition_state(partition_dir, quality=None):
+    """
+    返回存儲分區增量檢查的起點 state：優先使用累積報告中的 state；
+    舊的分區沒有質量記錄時讀取最後一個分片的最後一根 K 線。分區為空時返回 None。
+    """
+    if quality is not None and quality.get('state'):
+        return quality['state']
+    parts = _list_store_parts(partition_dir)
+    if not parts:
+        return None
+    last_part = pd.read_parquet(os.path.join(partition_dir, parts[-1]))
+    last_part = last_part.sort_values('timestamp')
+    return {'step_ms': None, 'last_timestamp': int(last_part['timestamp'].iloc[-1]),
+            'last_close': float(last_part['Close'].iloc[-1])}
+
+def store_quality_report(symbol='BTC/USDT', timeframe='1d', store_dir='data/ohlcv', exchange_id='binance'):
+    """
+    返回本地存儲中某個交易對/週期的累積質量報告 (由 sync_ohlcv_data 在每次寫入時更新)，不需要讀取任何 K 線。
+
+    返回:
+    - dict: 與 validate_ohlcv 的報告格式相同。分區沒有質量記錄時返回 None。
+    """
+    return load_partition_quality(get_store_partition(symbol, timeframe, store_dir, exchange_id))
+
+if __name__ == '__main__':
+    import time
+    from synthetic_data import generate_ohlcv
+
+    # 構造一段有各種問題的 1m 數據
+    test_df = generate_ohlcv(2000, 'min', start='2024-01-01', seed=1, start_price=100.0)
+    test_df = test_df.drop(test_df.index[500:530])  # 30 分鐘的缺口
+    test_df.iloc[100, 1] = test_df.iloc[100, 2] * 0.5  # High < Low
+    test_df.iloc[200, 3] = np.nan
+    test_df = pd.concat([test_df, test_df.iloc[[50, 60]]])  # 重複時間戳且亂序
+    clean_df, test_report = validate_ohlcv(test_df, '1m')
+    print_quality_report(test_report)
+    print(f"修復後: {len(clean_df)} 行，單調遞增且唯一: {clean_df.index.is_monotonic_increasing and clean_df.index.is_unique}")
+
+    # 增量檢查：分批追加時只檢查新的一批，結果與整體檢查相同
+    state, parts, total = None, [], None
+    for chunk in np.array_split(np.arange(len(test_df)), 7):
+        part, chunk_report = validate_ohlcv(test_df.iloc[np.sort(chunk)].sort_index(), '1m', state=state)
+        state = chunk_report['state']
+        parts.append(part)
+        total = merge_quality_reports(total, chunk_report)
+    print(f"分批檢查結果與整體檢查一致: {pd.concat(parts).equals(clean_df)}")
+
+    # 多年分鐘數據: 整體檢查與追加一天數據的檢查耗時
+    n_bars = 3 * 365 * 1440
+    big_df = generate_ohlcv(n_bars, 'min', start='2020-01-01', seed=2, start_price=100.0)
+    start = time.perf_counter()
+    _, big_report = validate_ohlcv(big_df.iloc[:-1440], '1m')
+    full_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    validate_ohlcv(big_df.iloc[-1440:], '1m', state=big_report['state'])
+    print(f"{n_bars} 根 1m K 線: 整體檢查 {full_seconds:.3f} 秒，增量檢查新的一天 {time.perf_counter() - start:.4f} 秒")
@@ -0,0 +1,338 @@
+# exchange_client.py
+import json
+import os
+import queue
+import random
+import threading
+import time
+import ccxt
+
+from config import EXCHANGE_CLIENT_CONFIG, EXCHANGE_RATE_LIMITS
+
+# 以這些前綴開頭的 ccxt 方法會發出請求，經過限速與重試；其他方法 (parse_timeframe、market 等) 直接轉發
+REQUEST_METHOD_PREFIXES = ('fetch', 'create', 'cancel', 'edit', 'withdraw', 'transfer')
+
+class TokenBucket:
+    """
+    線程安全的令牌桶。每次請求按權重取走令牌，令牌以固定速率補充，不足時阻塞等待。
+    令牌數可以被 cap() 壓低到負數，表示需要等待更久 (例如伺服器回報的已用權重比本地估計的多)。
+    """
+
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    def acquire(self, weight=1.0):
+        """取走 weight 個令牌，必要時阻塞。返回等待的秒數。"""
+        weight = min(float(weight), self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= weight:
+                    self._tokens -= weight
+                    return waited
+                delay = (weight - self._tokens) / self.refill_per_second
+            time.sleep(delay)
+            waited += delay
+
+    def cap(self, max_tokens):
+        """把當前令牌數壓到不超過 max_tokens。"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, float(max_tokens))
+
+    @property
+    def tokens(self):
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+class ExchangeClient:
+    """
+    一個交易所ID (與一組金鑰) 的長期客戶端：內部維護最多 max_connections 個 ccxt 實例
+    (各自保持 HTTP 連接)，所有實例和線程共用同一個按權重限速的令牌桶。
+    load_markets 的結果緩存在磁碟上，重啟後直接載入；NetworkError 以指數退避加隨機抖動重試。
+
+    屬性讀取 (例如 client.has、client.timeframes) 轉發到底層 ccxt 實例；
+    方法調用 (例如 client.fetch_ohlcv(...)) 經過限速與重試。
+    """
+
+    def __init__(self, exchange_id, api_key=None, secret_key=None, bucket=None, max_connections=None,
+                 max_retries=None, retry_base_delay=None, retry_max_delay=None,
+                 markets_cache_dir=None, markets_cache_ttl=None):
+        self.exchange_id = exchange_id
+        self._params = {'enableRateLimit': False} # 由共用的令牌桶限速，ccxt 自帶的限速只作用於單個實例
+        if api_key and secret_key:
+            self._params['apiKey'] = api_key
+            self._params['secret'] = secret_key
+        limits = EXCHANGE_RATE_LIMITS.get(exchange_id, {})
+        self.weights = limits.get('weights', {})
+        self.default_weight = limits.get('default_weight', 1)
+        self.weight_limit = limits.get('weight_limit')
+        self.used_weight_header = limits.get('used_weight_header')
+        self.safety = EXCHANGE_CLIENT_CONFIG['safety']
+        self.max_connections = max_connections or EXCHANGE_CLIENT_CONFIG['max_connections']
+        self.max_retries = EXCHANGE_CLIENT_CONFIG['max_retries'] if max_retries is None else max_retries
+        self.retry_base_delay = retry_base_delay or EXCHANGE_CLIENT_CONFIG['retry_base_delay']
+        self.retry_max_delay = retry_max_delay or EXCHANGE_CLIENT_CONFIG['retry_max_delay']
+        self.markets_cache_dir = markets_cache_dir or EXCHANGE_CLIENT_CONFIG['markets_cache_dir']
+        self.markets_cache_ttl = markets_cache_ttl or EXCHANGE_CLIENT_CONFIG['markets_cache_ttl']
+
+        self._primary = self._new_instance()
+        self._instances = [self._primary]
+        self._synced_markets = {} # id(實例) -> 該實例上次同步的市場資訊
+        self._idle = queue.LifoQueue()
+        self._idle.put(self._primary)
+        self._instances_lock = threading.Lock()
+        self._markets_lock = threading.Lock()
+        self.bucket = bucket or self._default_bucket()
+        self.requests = 0
+        self.retries = 0
+        self.throttled_seconds = 0.0
+
+    def _new_instance(self):
+        return getattr(ccxt, self.exchange_id)(dict(self._params))
+
+    def _default_bucket(self):
+        """
+        有權重上限設定時，突發容量為上限的 (1 - safety)，補充速率使任意一個窗口內的總權重不超過上限的 safety 倍；
+        否則按 ccxt 的 rateLimit (兩次請求的最小間隔毫秒數) 每秒補充。
+        """
+        limits = EXCHANGE_RATE_LIMITS.get(self.exchange_id, {})
+        if self.weight_limit:
+            burst = self.weight_limit * (1 - self.safety)
+            return TokenBucket(burst, (self.weight_limit * self.safety - burst) / limits.get('window_seconds', 60))
+        rate = 1000.0 / max(self._primary.rateLimit, 1)
+        return TokenBucket(max(rate, 1.0), rate)
+
+    def __getattr__(self, name):
+        # 只在正常屬性查找失敗時調用，避免轉發私有屬性造成遞迴
+        if name.startswith('_'):
+            raise AttributeError(name)
+        value = getattr(self._primary, name)
+        if callable(value) and name.startswith(REQUEST_METHOD_PREFIXES):
+            return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+        return value
+
+    def _checkout(self):
+        try:
+            instance = self._idle.get_nowait()
+        except queue.Empty:
+            instance = None
+            with self._instances_lock:
+                if len(self._instances) < self.max_connections:
+                    instance = self._new_instance()
+                    self._instances.append(instance)
+            if instance is None:
+                instance = self._idle.get()
+        # 沒有市場資訊的實例會在 fetch_* 內部自行 load_markets，繞過限速與磁碟緩存
+        markets = self._primary.markets
+        if markets and instance is not self._primary and self._synced_markets.get(id(instance)) is not markets:
+            instance.set_markets(markets, self._primary.currencies)
+            self._synced_markets[id(instance)] = markets
+        return instance
+
+    def _sync_used_weight(self, instance):
+        """按伺服器回報的已用權重校正令牌桶 (例如 Binance 的 x-mbx-used-weight-1m)。"""
+        if not (self.used_weight_header and self.weight_limit):
+            return
+        headers = instance.last_response_headers or {}
+        used = next((value for key, value in headers.items() if key.lower() == self.used_weight_header), None)
+        if used is not None:
+            try:
+                self.bucket.cap(self.weight_limit * self.safety - float(used))
+            except ValueError:
+                pass
+
+    def _retry_delay(self, attempt, error, instance):
+        """指數退避加抖動；被限流時優先使用 Retry-After 並清空令牌桶。"""
+        delay = min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt)
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        if isinstance(error, (ccxt.RateLimitExceeded, ccxt.DDoSProtection)):
+            self.bucket.cap(0)
+            headers = instance.last_response_headers or {}
+            retry_after = next((value for key, value in headers.items() if key.lower() == 'retry-after'), None)
+            try:
+                delay = max(delay, float(retry_after))
+            except (TypeError, ValueError):
+                pass
+        return delay
+
+    def call(self, method, *args, weight=None, **kwargs):
+        """
+        經過限速與重試調用 ccxt 方法。
+
+        參數:
+        - method (str): ccxt 方法名，例如 'fetch_ohlcv'。
+        - weight (float, optional): 本次請求的權重。預設查 EXCHANGE_RATE_LIMITS 中的 weights 表。
+
+        返回:
+        - 方法的返回值。重試 max_retries 次後仍然失敗時拋出最後一次的 ccxt.NetworkError；其他異常直接拋出。
+        """
+        weight = self.weights.get(method, self.default_weight) if weight is None else weight
+        if method != 'load_markets' and not self._primary.markets:
+            self.load_markets()
+        for attempt in range(self.max_retries + 1):
+            self.throttled_seconds += self.bucket.acquire(weight)
+            instance = self._checkout()
+            try:
+                self.requests += 1
+                result = getattr(instance, method)(*args, **kwargs)
+                self._sync_used_weight(instance)
+                return result
+            except ccxt.NetworkError as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt, e, instance)
+                self.retries += 1
+                print(f"{self.exchange_id} {method} 網路錯誤 ({type(e).__name__})，{delay:.2f} 秒後第 {attempt + 1} 次重試: {e}")
+            finally:
+                self._idle.put(instance)
+            time.sleep(delay)
+
+    def _markets_cache_path(self):
+        return os.path.join(self.markets_cache_dir, f'{self.exchange_id}.json')
+
+    def load_markets(self, reload=False):
+        """
+        返回交易所的市場資訊。優先使用內存中已載入的結果，其次是未過期的磁碟緩存，最後才請求交易所。
+
+        參數:
+        - reload (bool): 為 True 時忽略所有緩存，重新請求交易所並更新磁碟緩存。
+
+        返回:
+        - dict: 交易對 -> 市場資訊，與 ccxt 的 load_markets 相同。
+        """
+        with self._markets_lock:
+            if self._primary.markets and not reload:
+                return self._primary.markets
+            path = self._markets_cache_path()
+            if not reload:
+                try:
+                    if time.time() - os.path.getmtime(path) < self.markets_cache_ttl:
+                        with open(path, encoding='utf-8') as f:
+                            cached = json.load(f)
+                        self._primary.set_markets(cached['markets'], cached.get('currencies'))
+                        return self._primary.markets
+                except (OSError, ValueError, KeyError) as e:
+                    if not isinstance(e, FileNotFoundError):
+                        print(f"市場資訊緩存 {path} 無法讀取，將重新請求: {e}")
+            markets = self.call('load_markets', True)
+            # call 可能使用了其他實例；主實例的市場資訊是基準，其他實例在下次取用時同步
+            if self._primary.markets is not markets:
+                with self._instances_lock:
+                    source = next(instance for instance in self._instances if instance.markets is markets)
+                self._primary.set_markets(source.markets, source.currencies)
+            markets, currencies = self._primary.markets, self._primary.currencies
+            os.makedirs(self.markets_cache_dir, exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'markets': markets, 'currencies': currencies}, f, default=str)
+            os.replace(tmp_path, path)
+            return self._primary.markets
+
+    def stats(self):
+        """返回請求數、重試次數、限速等待總秒數與當前令牌數。"""
+        return {'requests': self.requests, 'retries': self.retries, 'instances': len(self._instances),
+                'throttled_seconds': self.throttled_seconds, 'tokens': self.bucket.tokens}
+
+# 進程內的客戶端池: (exchange_id, api_key) -> ExchangeClient；同一交易所的所有客戶端共用一個令牌桶 (限額按 IP 計算)
+_clients = {}
+_buckets = {}
+_pool_lock = threading.Lock()
+
+def get_exchange_client(exchange_id='binance', api_key=None, secret_key=None):
+    """
+    返回交易所ID (與金鑰) 對應的長期 ExchangeClient，首次調用時建立，之後所有模組和線程共用。
+
+    參數:
+    - exchange_id (str): 交易所ID，例如 'binance'。
+    - api_key (str, optional): API 金鑰。
+    - secret_key (str, optional): API 密鑰。
+
+    返回:
+    - ExchangeClient: 可以像 ccxt 交易所實例一樣使用 (has、fetch_ohlcv、load_markets 等)。
+    """
+    key = (exchange_id, api_key or None)
+    with _pool_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = ExchangeClient(exchange_id, api_key, secret_key, bucket=_buckets.get(exchange_id))
+            _buckets.setdefault(exchange_id, client.bucket)
+            _clients[key] = client
+        return client
+
+if __name__ == '__main__':
+    # 用一個模擬延遲、偶發網路錯誤並回報已用權重的假 ccxt 交易所，測試多線程批量下載時的限速與重試
+    import shutil
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    class _FlakyExchange:
+        has = {'fetchOHLCV': True}
+        rateLimit = 50
+        instances = 0
+        calls = []
+        calls_lock = threading.Lock()
+
+        def __init__(self, params):
+            type(self).instances += 1
+            self.markets = None
+            self.currencies = None
+            self.last_response_headers = {}
+            self.rng = random.Random(type(self).instances)
+
+        def set_markets(self, markets, currencies=None):
+            self.markets, self.currencies = markets, currencies
+
+        def load_markets(self, reload=False):
+            time.sleep(0.05)
+            self.set_markets({'BTC/USDT': {'symbol': 'BTC/USDT', 'quote': 'USDT', 'spot': True}}, {})
+            return self.markets
+
+        def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+            time.sleep(0.01)
+            with self.calls_lock:
+                self.calls.append(time.monotonic())
+                used = sum(2 for t in self.calls if t > time.monotonic() - 1)
+            self.last_response_headers = {'X-Demo-Used-Weight': str(used)}
+            if self.rng.random() < 0.05:
+                raise ccxt.RequestTimeout('模擬超時')
+            return [[since or 0, 1.0, 1.0, 1.0, 1.0, 1.0]]
+
+    ccxt.flakyexchange = _FlakyExchange
+    EXCHANGE_RATE_LIMITS['flakyexchange'] = {'weight_limit': 100, 'window_seconds': 1, 'default_weight': 1,
+                                             'weights': {'fetch_ohlcv': 2}, 'used_weight_header': 'x-demo-used-weight'}
+    cache_dir = tempfile.mkdtemp()
+    try:
+        EXCHANGE_CLIENT_CONFIG['markets_cache_dir'] = cache_dir
+        EXCHANGE_CLIENT_CONFIG['retry_base_delay'] = 0.05
+        client = get_exchange_client('flakyexchange')
+        start = time.perf_counter()
+        client.load_markets()
+        print(f"首次 load_markets 耗時 {time.perf_counter() - start:.3f} 秒")
+        _clients.clear()
+        client = get_exchange_client('flakyexchange')
+        start = time.perf_counter()
+        markets = client.load_markets()
+        print(f"重啟後從磁碟緩存載入 {len(markets)} 個市場，耗時 {time.perf_counter() - start:.4f} 秒")
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda i: client.fetch_ohlcv('BTC/USDT', '1m', since=i), range(150)))
+        elapsed = time.perf_counter() - start
+        calls = _FlakyExchange.calls
+        peak = max(sum(1 for t in calls if s <= t < s + 1) for s in calls) * 2
+        print(f"8 個線程完成 {len(results)} 次請求，耗時 {elapsed:.2f} 秒，任意 1 秒窗口內的最大權重 {peak} (上限 100)")
+        print(f"客戶端統計: {client.stats()}")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
@@ -0,0 +1,214 @@
+# fast_backtest.py
+# 以陣列運算回測只做多的進出場信號，不經過 backtesting.py 的逐根 next() 循環。
+# 撮合規則與 run_backtest (exclusive_orders=True) 相同，統計量由 backtesting.py 的 compute_stats 計算，
+# 因此返回的 Series 與 run_backtest 的結果可以直接對比、寫入 ResultStore 或傳給 verify_fast_backtest。
+import numpy as np
+import pandas as pd
+from backtesting._stats import compute_stats
+
+from sweep import SIGNAL_MODELS, STATS_COLUMNS, _period_sampling, _simulate_long_only, _summarize
+from strategies import STRATEGY_REGISTRY, get_strategy
+
+def strategy_signals(data_df: pd.DataFrame, strategy_class, **strategy_params):
+    """
+    由 sweep.py 的信號模型生成內建策略的進出場信號。
+
+    參數:
+    - data_df (pd.DataFrame): OHLCV 數據。
+    - strategy_class (Strategy): 已在 strategies.STRATEGY_REGISTRY 註冊且有對應 sweep.SIGNAL_MODELS 的策略類。
+    - **strategy_params: 覆蓋策略類屬性的參數，未給出的使用類的預設值。
+
+    返回:
+    - tuple: (entries, exits, warmup)，entries/exits 為長度 T 的布林數組，warmup 為指標預熱的 K 線數
+             (用於計算買入持有收益)。策略沒有向量化信號或參數無效時返回 None。
+    """
+    model_class = next((SIGNAL_MODELS[name] for name in STRATEGY_REGISTRY
+                        if name in SIGNAL_MODELS and get_strategy(name) is strategy_class), None)
+    if model_class is None:
+        print(f"錯誤: {strategy_class.__name__} 沒有向量化信號模型，請使用 run_backtest。")
+        return None
+    param_grid = {col: [strategy_params.get(col, getattr(strategy_class, col))] for col in model_class.param_columns}
+    model = model_class.from_param_grid(param_grid)
+    if model.params.empty:
+        print(f"錯誤: 無效的策略參數 {param_grid}。")
+        return None
+    matrix = model.indicators(data_df['Close'].to_numpy(dtype=float))
+    entries, exits = model.signals(matrix, model.params)
+    # 與 backtesting.py 相同：預熱期為各指標第一個非 NaN 值的位置中最大者
+    warmup = int(np.isnan(matrix).argmin(axis=-1).max()) if matrix.size else 0
+    return entries[0], exits[0], warmup
+
+def _trades_frame(sim, index):
+    """把單組模擬結果中已平倉的交易轉成與 stats['_trades'] 相同列的 DataFrame。"""
+    closed = sim['closed'][0]
+    entry_bar = sim['entry_bar'][0][closed]
+    exit_bar = sim['exit_bar'][0][closed]
+    trades = pd.DataFrame({
+        'Size': sim['size'][0][closed].astype(int),
+        'EntryBar': entry_bar,
+        'ExitBar': exit_bar,
+        'EntryPrice': sim['entry_price'][0][closed],
+        'ExitPrice': sim['exit_price'][0][closed],
+        'SL': np.nan,
+        'TP': np.nan,
+        'PnL': sim['pnl'][0][closed],
+        'Commission': sim['commissions'][0][closed],
+        'ReturnPct': sim['return_pct'][0][closed],
+        'EntryTime': index[entry_bar],
+        'ExitTime': index[exit_bar],
+    })
+    trades['Duration'] = trades['ExitTime'] - trades['EntryTime']
+    trades['Tag'] = None
+    return trades
+
+def backtest_signals(data_df: pd.DataFrame, entries, exits, cash=100000, commission=0.001, warmup=0,
+                     full_stats=True):
+    """
+    以陣列運算回測一組只做多的進出場信號。
+
+    第 t 根 K 線的信號在第 t+1 根開盤成交；空倉時進場信號以幾乎全部權益買入整數單位，
+    持倉時出場信號平倉，開倉與平倉各收一次手續費，最後仍持有的倉位不計入交易統計
+    (與 run_backtest 的預設行為一致)。
+
+    參數:
+    - data_df (pd.DataFrame): 與 run_backtest 相同格式的 OHLCV 數據。
+    - entries, exits (array-like): 長度與 data_df 相同的布林數組。
+    - cash (float): 初始資金。
+    - commission (float): 手續費率。
+    - warmup (int): 指標預熱的 K 線數，買入持有收益從這根 K 線的收盤價算起。
+    - full_stats (bool): True 時由 backtesting.py 的 compute_stats 計算全部統計量 (約佔總耗時的一半)；
+                         False 時只以陣列運算計算 sweep.STATS_COLUMNS 中的關鍵統計量，數值與前者相同。
+
+    返回:
+    - pd.Series: 與 run_backtest 相同的統計數據 ('_strategy' 為 None)；full_stats 為 False 時只有關鍵統計量、
+                 '_equity_curve' (只有 Equity 列) 和 '_trades'。如果出錯則返回 None。
+    """
+    missing_columns = [col for col in ['Open', 'Close'] if col not in data_df.columns]
+    if missing_columns:
+        print(f"錯誤: 數據 DataFrame 缺少以下必要列: {', '.join(missing_columns)}")
+        return None
+    entries = np.asarray(entries, dtype=bool)
+    exits = np.asarray(exits, dtype=bool)
+    if entries.shape != (len(data_df),) or exits.shape != (len(data_df),):
+        print(f"錯誤: 信號長度必須與數據相同 ({len(data_df)})。")
+        return None
+
+    open_ = data_df['Open'].to_numpy(dtype=float)
+    close = data_df['Close'].to_numpy(dtype=float)
+    sim = _simulate_long_only(open_, close, entries[None], exits[None], cash, commission)
+    trades = _trades_frame(sim, data_df.index)
+    if not full_stats:
+        summary = _summarize(sim, len(close), *_period_sampling(data_df.index))
+        stats = pd.Series({col: summary[col][0] for col in STATS_COLUMNS}, dtype=object)
+        stats['_equity_curve'] = pd.DataFrame({'Equity': sim['equity'][0]}, index=data_df.index)
+        stats['_trades'] = trades
+        return stats
+    stats = compute_stats(trades, sim['equity'][0], data_df, None)
+
+    # compute_stats 對 DataFrame 形式的交易列表不輸出手續費，且把買入持有的起點當作第 0 根 K 線
+    commissions = trades['Commission'].sum()
+    if warmup:
+        buy_hold = (close[-1] - close[warmup]) / close[warmup] * 100
+        stats['Alpha [%]'] = stats['Return [%]'] - stats['Beta'] * buy_hold
+        stats['Buy & Hold Return [%]'] = buy_hold
+    if commissions:
+        position = stats.index.get_loc('Equity Peak [$]') + 1
+        stats = pd.concat([stats.iloc[:position], pd.Series({'Commissions [$]': commissions}, dtype=object),
+                           stats.iloc[position:]])
+    return stats
+
+def run_fast_backtest(data_df: pd.DataFrame, strategy_class, cash=100000, commission=0.001,
+                      result_store=None, symbol=None, timeframe=None, full_stats=True, **strategy_params):
+    """
+    run_backtest 的向量化版本，適用於 sweep.SIGNAL_MODELS 中有信號模型的策略 (MaCrossStrategy、RsiStrategy)。
+
+    參數:
+    - data_df, strategy_class, cash, commission, result_store, symbol, timeframe: 同 run_backtest。
+    - full_stats (bool): 同 backtest_signals；只需要關鍵統計量時設為 False，約快一倍。
+    - **strategy_params: 覆蓋策略類屬性的參數 (例如 n1=5, n2=30)。
+
+    返回:
+    - pd.Series: 與 run_backtest 相同的統計數據。策略不支持或出錯時返回 None。
+    """
+    signals = strategy_signals(data_df, strategy_class, **strategy_params)
+    if signals is None:
+        return None
+    entries, exits, warmup = signals
+    stats = backtest_signals(data_df, entries, exits, cash=cash, commission=commission, warmup=warmup,
+                             full_stats=full_stats)
+    if stats is not None and result_store is not None:
+        result_store.add(stats, strategy_class, strategy_params, data_df, symbol, timeframe, cash, commission)
+    return stats
+
+def verify_fast_backtest(data_df: pd.DataFrame, strategy_class, cash=100000, commission=0.001, rtol=1e-9,
+                         **strategy_params) -> pd.DataFrame:
+    """
+    用 run_backtest 回測同一策略，逐項比較公開統計量與交易列表。
+
+    參數:
+    - data_df, strategy_class, cash, commission, **strategy_params: 同 run_fast_backtest。
+    - rtol (float): 數值統計量允許的相對誤差。
+
+    返回:
+    - pd.DataFrame: 每個統計量一行，包含 'fast'、'backtest' 和 'Match' 列；
+                    交易列表與權益曲線的比較結果記在 '_trades' 和 '_equity_curve' 行。
+    """
+    from backtester import run_backtest
+
+    fast = run_fast_backtest(data_df, strategy_class, cash=cash, commission=commission, **strategy_params)
+    expected = run_backtest(data_df, strategy_class, cash=cash, commission=commission, **strategy_params)
+    rows = []
+    for key in expected.index:
+        if key.startswith('_'):
+            continue
+        a, b = fast.get(key, np.nan), expected[key]
+        if isinstance(b, (int, float, np.number)) and not isinstance(b, bool):
+            match = bool(np.isclose(float(a), float(b), rtol=rtol, atol=0, equal_nan=True))
+        else:
+            match = (pd.isna(a) and pd.isna(b)) or a == b
+        rows.append({'stat': key, 'fast': a, 'backtest': b, 'Match': match})
+
+    trade_columns = ['Size', 'EntryBar', 'ExitBar', 'EntryPrice', 'ExitPrice', 'PnL', 'ReturnPct']
+    fast_trades, expected_trades = fast['_trades'][trade_columns], expected['_trades'][trade_columns]
+    trades_match = len(fast_trades) == len(expected_trades) and bool(
+        np.allclose(fast_trades.to_numpy(dtype=float), expected_trades.to_numpy(dtype=float), rtol=rtol))
+    rows.append({'stat': '_trades', 'fast': len(fast_trades), 'backtest': len(expected_trades), 'Match': trades_match})
+    fast_equity, expected_equity = fast['_equity_curve']['Equity'], expected['_equity_curve']['Equity']
+    rows.append({'stat': '_equity_curve', 'fast': fast_equity.iloc[-1], 'backtest': expected_equity.iloc[-1],
+                 'Match': bool(np.allclose(fast_equity.to_numpy(), expected_equity.to_numpy(), rtol=rtol))})
+    report = pd.DataFrame(rows)
+    if not report['Match'].all():
+        print(f"警告: {strategy_class.__name__} 的向量化回測與 run_backtest 不一致:")
+        print(report[~report['Match']].to_string(index=False))
+    return report
+
+if __name__ == '__main__':
+    # 用隨機遊走價格對照兩個內建策略，並比較長序列上的耗時
+    import time
+    import warnings
+    from backtester import run_backtest
+    from synthetic_data import generate_ohlcv
+    from strategies.simple_ma_strategy import MaCrossStrategy
+    from strategies.simple_rsi_strategy import RsiStrategy
+
+    warnings.filterwarnings('ignore')
+
+    cases = [(MaCrossStrategy, {}), (MaCrossStrategy, {'n1': 5, 'n2': 60}),
+             (RsiStrategy, {}), (RsiStrategy, {'rsi_period': 7, 'oversold_threshold': 25, 'overbought_threshold': 75})]
+    for freq, n_bars in [('D', 1500), ('h', 20000), ('min', 5000)]:
+        test_df = generate_ohlcv(n_bars, freq, start='2019-01-01', seed=7, volatility=0.01)
+        for strategy_class, params in cases:
+            report = verify_fast_backtest(test_df, strategy_class, **params)
+            print(f"{freq:>3} {n_bars:>6} 根 {strategy_class.__name__:<16} {params}: "
+                  f"{'一致' if report['Match'].all() else '不一致'} ({int(report['Match'].sum())}/{len(report)})")
+
+    test_df = generate_ohlcv(200000, 'min', start='2019-01-01', seed=7, volatility=0.01)
+    for strategy_class in (MaCrossStrategy, RsiStrategy):
+        start = time.perf_counter()
+        run_fast_backtest(test_df, strategy_class)
+        fast_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        run_backtest(test_df, strategy_class)
+        slow_seconds = time.perf_counter() - start
+        print(f"{strategy_class.__name__}: {len(test_df)} 根 K 線，向量化 {fast_seconds:.3f} 秒，"
+              f"run_backtest {slow_seconds:.2f} 秒 ({slow_seconds / fast_seconds:.0f} 倍)")
@@ -0,0 +1,260 @@
+# indicator_cache.py
+import functools
+import hashlib
+import os
+import threading
+import types
+import weakref
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+from config import INDICATOR_CACHE
+
+class IndicatorCache:
+    """
+    指標函數的記憶化緩存。
+    鍵由輸入序列內容的指紋、函數 (含其位元組碼、閉包捕獲的值、預設參數和綁定的實例) 與參數組成；值保存為只讀 numpy 數組。
+    內存層是按位元組大小淘汰的 LRU；可選的磁碟層把結果存為 .npy，供之後的運行和其他進程共用。
+    """
+
+    def __init__(self, max_memory_bytes=512 * 2**20, disk_dir=None, max_disk_bytes=2 * 2**30):
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        # 同一個數組對象在一次運行中常被多個指標使用，記住它的指紋以免重複哈希
+        self._array_fingerprints = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def stats(self):
+        """返回命中/未命中計數和當前佔用。"""
+        total = self.hits + self.disk_hits + self.misses
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'bypassed': self.bypassed,
+            'hit_rate': (self.hits + self.disk_hits) / total if total else float('nan'),
+            'memory_entries': len(self._memory),
+            'memory_bytes': self._memory_bytes,
+        }
+
+    def clear(self):
+        """清空內存層 (磁碟層保留) 並重置計數。"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            self._array_fingerprints.clear()
+            self.hits = self.disk_hits = self.misses = self.bypassed = 0
+
+    def _fingerprint_array(self, obj):
+        entry = self._array_fingerprints.get(id(obj))
+        if entry is not None and entry[0]() is obj:
+            return entry[1]
+        array = np.ascontiguousarray(obj.to_numpy() if isinstance(obj, (pd.Series, pd.Index)) else obj)
+        if array.dtype == object:
+            return None
+        digest = hashlib.blake2b(array.view(np.uint8).reshape(-1), digest_size=16)
+        digest.update(f'{array.dtype.str}{array.shape}'.encode())
+        fingerprint = 'a:' + digest.hexdigest()
+        try:
+            ref = weakref.ref(obj, lambda _, key=id(obj): self._array_fingerprints.pop(key, None))
+            self._array_fingerprints[id(obj)] = (ref, fingerprint)
+        except TypeError:
+            pass
+        return fingerprint
+
+    def _fingerprint_value(self, value):
+        """返回參數的指紋；遇到無法穩定表示的參數類型返回 None (不緩存)。"""
+        if isinstance(value, (np.ndarray, pd.Series, pd.Index)):
+            return self._fingerprint_array(value)
+        if value is None or isinstance(value, (bool, int, float, str, np.number)):
+            return f'{type(value).__name__}:{value!r}'
+        if isinstance(value, tuple):
+            parts = [self._fingerprint_value(item) for item in value]
+            return None if None in parts else 't:(' + ','.join(parts) + ')'
+        return None
+
+    def _fingerprint_code(self, code):
+        """位元組碼、常量和引用的名字 (例如 SMA 與 EMA) 都參與指紋；嵌套的代碼對象遞歸處理，不使用含地址的 repr。"""
+        digest = hashlib.blake2b(code.co_code, digest_size=16)
+        for const in code.co_consts:
+            digest.update(self._fingerprint_code(const).encode() if hasattr(const, 'co_code') else repr(const).encode())
+        digest.update(repr(code.co_names).encode())
+        return digest.hexdigest()
+
+    def _fingerprint_function(self, func, depth=0):
+        """
+        返回函數的指紋：名字、位元組碼，以及閉包捕獲的值、預設參數和綁定的實例。
+        兩個只在捕獲值上不同的 lambda (例如捕獲 n1 和 n2) 得到不同的指紋；任何部分無法表示時返回 None。
+        """
+        if depth > 8:
+            return None
+        if isinstance(func, functools.partial):
+            parts = [self._fingerprint_function(func.func, depth + 1),
+                     self._fingerprint_value(func.args), self._fingerprint_value(tuple(sorted(func.keywords.items())))]
+            return None if None in parts else 'p:(' + ','.join(parts) + ')'
+        parts = [f'{getattr(func, "__module__", "")}.{getattr(func, "__qualname__", repr(func))}']
+        bound_self = getattr(func, '__self__', None)
+        if bound_self is not None and not isinstance(bound_self, types.ModuleType): # 內建函數的 __self__ 是所在模組
+            parts.append(self._fingerprint_value(bound_self))
+            func = getattr(func, '__func__', func)
+        code = getattr(func, '__code__', None)
+        if code is not None:
+            parts.append(self._fingerprint_code(code))
+            for cell in getattr(func, '__closure__', None) or ():
+                try:
+                    value = cell.cell_contents
+                except ValueError:
+                    parts.append('empty')
+                    continue
+                parts.append(self._fingerprint_function(value, depth + 1) if callable(value)
+                             else self._fingerprint_value(value))
+            parts.append(self._fingerprint_value(getattr(func, '__defaults__', None)))
+            kwdefaults = getattr(func, '__kwdefaults__', None) or {}
+            parts.append(self._fingerprint_value(tuple(sorted(kwdefaults.items()))))
+        return None if None in parts else '|'.join(parts)
+
+    def make_key(self, func, args, kwargs):
+        """生成緩存鍵，無法緩存時返回 None。"""
+        parts = [self._fingerprint_value(arg) for arg in args]
+        parts += [self._fingerprint_value(value) for _, value in sorted(kwargs.items())]
+        parts.append(self._fingerprint_function(func))
+        if None in parts:
+            return None
+        parts += sorted(kwargs)
+        digest = hashlib.blake2b('|'.join(parts).encode(), digest_size=16)
+        return digest.hexdigest()
+
+    def _store_memory(self, key, value):
+        with self._lock:
+            if key in self._memory:
+                return
+            self._memory[key] = value
+            self._memory_bytes += value.nbytes
+            while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted.nbytes
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f'{key}.npy')
+
+    def _load_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            value = np.load(path)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        os.utime(path) # 更新訪問時間，供淘汰順序使用
+        return value
+
+    def _store_disk(self, key, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, value)
+        os.replace(tmp_path, path)
+        self._evict_disk()
+
+    def _evict_disk(self):
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith('.npy'):
+                try:
+                    stat = os.stat(os.path.join(self.disk_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.disk_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def call(self, func, *args, **kwargs):
+        """以緩存方式調用 func(*args, **kwargs)。結果為只讀 numpy 數組 (DataFrame 結果按列轉置，與 Strategy.I 一致)。"""
+        key = self.make_key(func, args, kwargs)
+        if key is None:
+            self.bypassed += 1
+            return func(*args, **kwargs)
+
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return value
+        value = self._load_disk(key)
+        if value is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            result = func(*args, **kwargs)
+            if isinstance(result, pd.DataFrame):
+                result = result.values.T
+            try:
+                value = np.array(result, order='C')
+            except (TypeError, ValueError):
+                return result
+            if value.dtype == object:
+                return result
+            self._store_disk(key, value)
+        value.flags.writeable = False
+        self._store_memory(key, value)
+        return value
+
+    def wrap(self, func):
+        """返回 func 的緩存版本，保留原函數名 (Strategy.I 用它生成指標名稱)。"""
+        @functools.wraps(func)
+        def cached(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+        return cached
+
+def _create_default_cache():
+    return IndicatorCache(max_memory_bytes=int(INDICATOR_CACHE['max_memory_mb'] * 2**20),
+                          disk_dir=INDICATOR_CACHE['disk_dir'],
+                          max_disk_bytes=int(INDICATOR_CACHE['max_disk_mb'] * 2**20))
+
+# BaseStrategy 預設使用的進程內共享緩存；INDICATOR_CACHE['enabled'] 為 False 時為 None
+default_cache = _create_default_cache() if INDICATOR_CACHE['enabled'] else None
+
+if __name__ == '__main__':
+    # 重複回測同一數據時，第二次起指標全部命中緩存，結果與不使用緩存時相同
+    import time
+    import warnings
+    import indicator_cache # 與 BaseStrategy 使用同一個模組實例 (本檔案以 __main__ 運行)
+    from backtester import run_backtest
+    from strategies.simple_ma_strategy import MaCrossStrategy
+    from strategies.simple_rsi_strategy import RsiStrategy
+    from synthetic_data import generate_ohlcv
+
+    warnings.filterwarnings('ignore')
+    test_df = generate_ohlcv(200000, 'min', start='2020-01-01', volatility=0.002)
+
+    for strategy_class, params in [(MaCrossStrategy, {'n1': 10, 'n2': 20}), (RsiStrategy, {'rsi_period': 14})]:
+        timings = []
+        results = []
+        for _ in range(3):
+            start = time.perf_counter()
+            results.append(run_backtest(test_df, strategy_class, plot_results=False, **params))
+            timings.append(time.perf_counter() - start)
+        identical = all(results[0].drop(['_strategy', '_equity_curve', '_trades']).equals(
+            r.drop(['_strategy', '_equity_curve', '_trades'])) for r in results[1:])
+        print(f"{strategy_class.__name__}: 耗時 {', '.join(f'{t:.2f}s' for t in timings)}，結果一致 = {identical}")
+    print(f"緩存統計: {indicator_cache.default_cache.stats()}")
@@ -0,0 +1,246 @@
+# indicators.py
+# 可增量更新的技術指標。
+# 每個指標對象保存計算所需的最少狀態，新的一根 K 線到達時以 O(1) 時間更新，
+# 數值與 utils.py / backtesting.test 中的批量函數逐位相同 (浮點運算順序與 pandas 的滾動/指數平均實現一致)。
+# update() 可以傳入單個值 (返回 float) 或一批值 (返回 np.ndarray)；
+# to_dict() / indicator_from_dict() 用於把狀態保存為 JSON 兼容的字典，重啟後從斷點繼續。
+import math
+from collections import deque
+import numpy as np
+
+class StreamingIndicator:
+    """增量指標的基類。子類實現 _update_one()，並在 _state_fields 中列出需要序列化的屬性。"""
+    _state_fields = ()
+
+    def update(self, value):
+        """輸入一根或一批 K 線的值，返回對應的指標值。"""
+        if np.ndim(value) == 0:
+            return self._update_one(float(value))
+        return np.array([self._update_one(float(v)) for v in np.asarray(value, dtype=float)])
+
+    def _update_one(self, value):
+        raise NotImplementedError
+
+    def to_dict(self):
+        """返回可 JSON 序列化的狀態字典。"""
+        state = {}
+        for name in self._state_fields:
+            value = getattr(self, name)
+            if isinstance(value, deque):
+                value = list(value)
+            elif isinstance(value, StreamingIndicator):
+                value = value.to_dict()
+            state[name] = value
+        return {'type': type(self).__name__, 'state': state}
+
+    @classmethod
+    def from_dict(cls, data):
+        """由 to_dict() 的結果恢復指標對象。"""
+        obj = cls.__new__(cls)
+        for name, value in data['state'].items():
+            setattr(obj, name, deque(value) if isinstance(value, list) else value)
+        return obj
+
+class RollingMean(StreamingIndicator):
+    """
+    與 pandas Series.rolling(n).mean() 數值相同的滾動平均。
+    使用帶 Kahan 補償的累加/移除，並保留 pandas 對全負/全非負窗口和連續相同值的特殊處理。
+    """
+    _state_fields = ('n', 'window', 'nobs', 'sum_x', 'neg_ct', 'compensation_add', 'compensation_remove',
+                     'num_consecutive_same_value', 'prev_value')
+
+    def __init__(self, n):
+        self.n = n
+        self.window = deque()
+        self.nobs = 0
+        self.sum_x = 0.0
+        self.neg_ct = 0
+        self.compensation_add = 0.0
+        self.compensation_remove = 0.0
+        self.num_consecutive_same_value = 0
+        self.prev_value = math.nan
+
+    def _update_one(self, value):
+        self.window.append(value)
+        if len(self.window) > self.n:
+            self._remove(self.window.popleft())
+        self._add(value)
+        if self.nobs < self.n or self.nobs == 0:
+            return math.nan
+        result = self.sum_x / self.nobs
+        if self.num_consecutive_same_value >= self.nobs:
+            result = self.prev_value
+        elif self.neg_ct == 0 and result < 0:
+            result = 0.0
+        elif self.neg_ct == self.nobs and result > 0:
+            result = 0.0
+        return result
+
+    def _add(self, value):
+        if value != value:
+            return
+        self.nobs += 1
+        y = value - self.compensation_add
+        t = self.sum_x + y
+        self.compensation_add = t - self.sum_x - y
+        self.sum_x = t
+        if math.copysign(1.0, value) < 0:
+            self.neg_ct += 1
+        if value == self.prev_value:
+            self.num_consecutive_same_value += 1
+        else:
+            self.num_consecutive_same_value = 1
+        self.prev_value = value
+
+    def _remove(self, value):
+        if value != value:
+            return
+        self.nobs -= 1
+        y = -value - self.compensation_remove
+        t = self.sum_x + y
+        self.compensation_remove = t - self.sum_x - y
+        self.sum_x = t
+        if math.copysign(1.0, value) < 0:
+            self.neg_ct -= 1
+
+class ExponentialMean(StreamingIndicator):
+    """與 pandas Series.ewm(alpha=..., adjust=False, min_periods=...).mean() 數值相同的指數平均。"""
+    _state_fields = ('alpha', 'min_periods', 'weighted', 'nobs')
+
+    def __init__(self, alpha, min_periods=0):
+        com = 1 / alpha - 1
+        self.alpha = 1 / (1 + com) # 與 pandas 相同，由質心重新計算 alpha
+        self.min_periods = min_periods
+        self.weighted = math.nan
+        self.nobs = 0
+
+    def _update_one(self, value):
+        is_observation = value == value
+        self.nobs += int(is_observation)
+        if self.weighted == self.weighted:
+            if is_observation and self.weighted != value:
+                old_wt = 1 - self.alpha
+                self.weighted = (old_wt * self.weighted + self.alpha * value) / (old_wt + self.alpha)
+        elif is_observation:
+            self.weighted = value
+        return self.weighted if self.nobs >= max(self.min_periods, 1) else math.nan
+
+class SMA(RollingMean):
+    """簡單移動平均，與 backtesting.test.SMA 相同。"""
+
+class EMA(ExponentialMean):
+    """指數移動平均，與 utils.ema_indicator 相同。"""
+    _state_fields = ExponentialMean._state_fields + ('n',)
+
+    def __init__(self, n=20):
+        super().__init__(alpha=2 / (n + 1))
+        self.n = n
+
+class RSI(StreamingIndicator):
+    """
+    增量 RSI。wilder=False 時以簡單平均計算，與 utils.rsi_indicator 相同；
+    wilder=True 時以 Wilder 平滑計算，與 utils.rsi_wilder_indicator 相同。
+    """
+    _state_fields = ('n', 'wilder', 'prev_close', 'gain', 'loss')
+
+    def __init__(self, n=14, wilder=False):
+        self.n = n
+        self.wilder = wilder
+        self.prev_close = math.nan
+        if wilder:
+            self.gain = ExponentialMean(alpha=1 / n, min_periods=n)
+            self.loss = ExponentialMean(alpha=1 / n, min_periods=n)
+        else:
+            self.gain = RollingMean(n)
+            self.loss = RollingMean(n)
+
+    @classmethod
+    def from_dict(cls, data):
+        obj = cls.__new__(cls)
+        state = dict(data['state'])
+        mean_class = ExponentialMean if state['wilder'] else RollingMean
+        state['gain'] = mean_class.from_dict(state['gain'])
+        state['loss'] = mean_class.from_dict(state['loss'])
+        obj.__dict__.update(state)
+        return obj
+
+    def _update_one(self, value):
+        delta = value - self.prev_close
+        self.prev_close = value
+        # 與批量版本的 delta.where(...) 一致：NaN 差值視為 0，非負變動的虧損值為 -0.0
+        gain = self.gain.update(delta if delta > 0 else 0.0)
+        loss = self.loss.update(-(delta if delta < 0 else 0.0))
+        if loss == 0 and gain == gain and gain != 0:
+            rs = 1000.0 # 只有上漲，RS 趨近無窮大
+        elif loss == 0 or gain != gain or loss != loss:
+            rs = 1.0
+        else:
+            rs = gain / loss
+        return 100 - (100 / (1 + rs))
+
+class Crossover(StreamingIndicator):
+    """
+    增量交叉檢測，判斷規則與 backtesting.lib.crossover 相同。
+    update((series1, series2)) 在 series1 上穿 series2 時返回 1，下穿時返回 -1，否則返回 0。
+    """
+    _state_fields = ('prev1', 'prev2')
+
+    def __init__(self):
+        self.prev1 = math.nan
+        self.prev2 = math.nan
+
+    def update(self, value):
+        values = np.asarray(value, dtype=float)
+        if values.ndim == 1:
+            return self._update_one(values)
+        return np.array([self._update_one(pair) for pair in values], dtype=int)
+
+    def _update_one(self, pair):
+        value1, value2 = float(pair[0]), float(pair[1])
+        if self.prev1 < self.prev2 and value1 > value2:
+            signal = 1
+        elif self.prev2 < self.prev1 and value2 > value1:
+            signal = -1
+        else:
+            signal = 0
+        self.prev1, self.prev2 = value1, value2
+        return signal
+
+def indicator_from_dict(data):
+    """根據 to_dict() 結果中的類型名恢復任意指標對象。"""
+    classes = {cls.__name__: cls for cls in (RollingMean, ExponentialMean, SMA, EMA, RSI, Crossover)}
+    return classes[data['type']].from_dict(data)
+
+if __name__ == '__main__':
+    # 與批量函數逐位對照，並測試狀態序列化後繼續更新
+    import json
+    import pandas as pd
+    from backtesting.test import SMA as batch_sma
+    from utils import rsi_indicator, rsi_wilder_indicator, ema_indicator
+
+    rng = np.random.default_rng(1)
+    prices = pd.Series(30000 * np.exp(np.cumsum(rng.normal(0, 0.01, 5000))))
+    prices[100:120] = prices[100] # 包含連續相同價格的區段
+
+    checks = {
+        'SMA(20)': (SMA(20), batch_sma(prices, 20)),
+        'EMA(20)': (EMA(20), ema_indicator(prices, 20)),
+        'RSI(14)': (RSI(14), rsi_indicator(prices, 14)),
+        'Wilder RSI(14)': (RSI(14, wilder=True), rsi_wilder_indicator(prices, 14)),
+    }
+    for name, (indicator, expected) in checks.items():
+        first = indicator.update(prices[:3000])
+        # 模擬重啟：序列化狀態後恢復，再逐根更新剩下的 K 線
+        restored = indicator_from_dict(json.loads(json.dumps(indicator.to_dict())))
+        rest = [restored.update(p) for p in prices[3000:]]
+        streamed = np.r_[first, rest]
+        identical = np.array_equal(streamed, expected.values, equal_nan=True)
+        print(f"{name}: 與批量函數完全一致 = {identical}")
+
+    from backtesting.lib import crossover
+    fast, slow = batch_sma(prices, 10).values, batch_sma(prices, 30).values
+    detector = Crossover()
+    signals = detector.update(np.column_stack([fast, slow]))
+    expected = [1 if crossover(fast[:i + 1], slow[:i + 1]) else -1 if crossover(slow[:i + 1], fast[:i + 1]) else 0
+                for i in range(len(fast))]
+    print(f"Crossover: 與 backtesting.lib.crossover 一致 = {np.array_equal(signals, expected)}")
@@ -1,94 +1,460 @@
-import pandas as pd
-from config import API_KEY, API_SECRET, TRADING_PAIR, TIMEFRAME, STRATEGY_PARAMS, BACKTEST_CONFIG
-from data_handler import fetch_ohlcv_data, load_data_from_csv
-from strategies.simple_ma_strategy import MaCrossStrategy
-from strategies.simple_rsi_strategy import RsiStrategy
-from backtester import run_backtest
+# main.py
+# 命令列入口。這裡只導入 argparse 和 config；pandas、ccxt、backtesting 等重型模組
+# 在子命令真正需要時才導入，所以 --help、strategies、report 等輕量命令可以快速啟動。
+import argparse
 import os
+import sys
 
-def main():
-    print("開始執行量化交易回測程式...")
+import config
+from strategies import STRATEGY_REGISTRY, get_strategy, list_strategies
 
-    # 選擇數據來源：'api' 或 'csv'
-    data_source = 'api'  # 或 'api'
+def _parse_value(text):
+    """把命令列上的參數值轉為 int、float 或保留為字串。"""
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return text
 
-    data_df = None
+def _split_assignments(items):
+    """把 ['n1=10', 'n2=30'] 拆成 {'n1': '10', 'n2': '30'}。"""
+    pairs = {}
+    for item in items or []:
+        name, sep, value = item.partition('=')
+        if not sep:
+            raise SystemExit(f"錯誤: 參數格式應為 name=value: {item}")
+        pairs[name] = value
+    return pairs
 
-    if data_source == 'api':
-        print(f"正在從 API ({TRADING_PAIR}, {TIMEFRAME}) 獲取數據...")
+def _parse_params(items):
+    """把 ['n1=10', 'n2=30'] 解析為 {'n1': 10, 'n2': 30}。"""
+    return {name: _parse_value(value) for name, value in _split_assignments(items).items()}
+
+def _parse_grid(items):
+    """把 ['n1=5,10,15', 'n2=20:60:10'] 解析為參數網格；start:stop:step 表示 range (不含 stop)。"""
+    grid = {}
+    for name, value in _split_assignments(items).items():
+        if ':' in value:
+            start, stop, *step = (int(part) for part in value.split(':'))
+            grid[name] = list(range(start, stop, step[0] if step else 1))
+        else:
+            grid[name] = [_parse_value(part) for part in value.split(',')]
+    return grid
+
+def _add_data_arguments(parser):
+    parser.add_argument('--source', choices=['api', 'csv', 'store', 'compact', 'trades'], default=config.DATA_SOURCE,
+                        help=f"數據來源 (預設 {config.DATA_SOURCE})；'store' 先增量同步到本地 Parquet 存儲再讀取，"
+                             f"'compact' 同步後再轉存為內存映射的緊湊存儲 (float32)，"
+                             f"'trades' 由成交 CSV 聚合 tick/volume/dollar/秒級 K 線")
+    parser.add_argument('--symbol', default=config.TRADING_PAIR, help=f"交易對 (預設 {config.TRADING_PAIR})")
+    parser.add_argument('--timeframe', default=config.TIMEFRAME, help=f"K線週期 (預設 {config.TIMEFRAME})")
+    parser.add_argument('--exchange', default=config.EXCHANGE_ID, help=f"交易所ID (預設 {config.EXCHANGE_ID})")
+    parser.add_argument('--csv', default=config.CSV_FILE_PATH, help=f"CSV 檔案路徑 (預設 {config.CSV_FILE_PATH})")
+    parser.add_argument('--limit', type=int, default=config.API_LIMIT,
+                        help=f"API 獲取的 K 線數量 (預設 {config.API_LIMIT})")
+    parser.add_argument('--trades-csv', default=config.TRADE_BARS_CONFIG['trades_csv'],
+                        help=f"--source trades 的成交 CSV 檔案 (預設 {config.TRADE_BARS_CONFIG['trades_csv']})")
+    parser.add_argument('--bar', default=config.TRADE_BARS_CONFIG['bar'],
+                        help=f"--source trades 的 K 線規格，例如 tick:500、volume:100、dollar:5e6、time:5s "
+                             f"(預設 {config.TRADE_BARS_CONFIG['bar']})")
+
+def _add_backtest_arguments(parser):
+    parser.add_argument('--strategy', default=config.DEFAULT_STRATEGY, choices=list_strategies(),
+                        help=f"策略名稱 (預設 {config.DEFAULT_STRATEGY})")
+    parser.add_argument('--cash', type=float, default=config.BACKTEST_CONFIG['initial_cash'], help='初始資金')
+    parser.add_argument('--commission', type=float, default=config.BACKTEST_CONFIG['commission_rate'], help='手續費率')
+
+def _sync_store(args):
+    """把目標週期 (或設定的重採樣基礎週期) 增量同步到本地存儲，返回是否需要重採樣。"""
+    from data_handler import sync_ohlcv_data
+
+    resample = bool(config.RESAMPLE_BASE_TIMEFRAME) and config.RESAMPLE_BASE_TIMEFRAME != args.timeframe
+    sync_ohlcv_data(symbol=args.symbol, timeframe=config.RESAMPLE_BASE_TIMEFRAME if resample else args.timeframe,
+                    exchange_id=args.exchange, api_key=config.API_KEY, secret_key=config.API_SECRET,
+                    store_dir=config.DATA_STORE_DIR)
+    return resample
+
+def _load_data(args):
+    """按 --source 加載數據，失敗時返回 None。"""
+    import data_handler
+
+    if args.source == 'api':
+        print(f"正在從 API ({args.symbol}, {args.timeframe}) 獲取數據...")
         # 注意：實際使用API獲取數據時，請確保config.py中的API金鑰已填寫
         # 且交易所支援無金鑰獲取公開數據，或已正確配置金鑰權限
-        data_df = fetch_ohlcv_data(
-            api_key=API_KEY,
-            secret_key=API_SECRET,
-            symbol=TRADING_PAIR,
-            timeframe=TIMEFRAME,
-            limit=500  # 可根據需求調整獲取數據的筆數
-        )
-    elif data_source == 'csv':
-        # 確保 'data' 資料夾存在且包含指定的CSV檔案
-        csv_file_path = os.path.join('data', 'btcusd_1d.csv') # 假設您有一個名為 btcusd_1d.csv 的檔案
-        if not os.path.exists(csv_file_path):
-            print(f"錯誤：找不到CSV檔案 {csv_file_path}")
-            print("請將您的數據檔案放置在 'data' 資料夾下，或修改 'main.py' 中的檔案路徑。")
-            print("您也可以從以下連結下載範例數據：https://www.cryptodatadownload.com/data/binance/")
-            return
-
-        print(f"正在從 CSV 檔案 ({csv_file_path}) 加載數據...")
-        data_df = load_data_from_csv(csv_file_path)
-        # 確保列名符合 backtesting.py 的要求 (Open, High, Low, Close, Volume)
-        # CSV 檔案的日期欄位應設為索引 (parse_dates=True, index_col='Date' or 'Timestamp')
-        # 例如:
-        # data_df = pd.read_csv(csv_file_path, index_col='Date', parse_dates=True)
-        # data_df.columns = ['Open', 'High', 'Low', 'Close', 'Volume'] # 根據您的CSV調整
+        return data_handler.fetch_ohlcv_data(api_key=config.API_KEY, secret_key=config.API_SECRET,
+                                             symbol=args.symbol, timeframe=args.timeframe, limit=args.limit,
+                                             exchange_id=args.exchange)
+    if args.source == 'compact':
+        from compact_store import load_compact, update_compact_from_store
+
+        print(f"正在同步並從緊湊存儲 ({config.COMPACT_STORE_DIR}) 映射 {args.symbol}, {args.timeframe} 數據...")
+        resample = _sync_store(args)
+        update_compact_from_store(args.symbol, args.timeframe, config.DATA_STORE_DIR, config.COMPACT_STORE_DIR,
+                                  args.exchange, base_timeframe=config.RESAMPLE_BASE_TIMEFRAME if resample else None)
+        return load_compact(args.symbol, args.timeframe, config.COMPACT_STORE_DIR, args.exchange)
+    if args.source == 'trades':
+        from trade_bars import parse_bar_spec, update_trade_bars
 
+        try:
+            bar_type, threshold = parse_bar_spec(args.bar)
+        except ValueError as e:
+            print(f"錯誤: {e}")
+            return None
+        print(f"正在由成交檔案 ({args.trades_csv}) 聚合 {args.bar} K 線...")
+        args.timeframe = args.bar # 結果存儲中以 K 線規格作為週期
+        return update_trade_bars(args.trades_csv, bar_type, threshold, chunksize=config.TRADE_BARS_CONFIG['chunksize'])
+    if args.source == 'store':
+        print(f"正在同步並從本地存儲 ({config.DATA_STORE_DIR}) 加載 {args.symbol}, {args.timeframe} 數據...")
+        # 設定了 RESAMPLE_BASE_TIMEFRAME 時只同步該週期，目標週期在本地重採樣得到
+        if _sync_store(args):
+            return data_handler.load_resampled_ohlcv(args.symbol, args.timeframe,
+                                                     base_timeframe=config.RESAMPLE_BASE_TIMEFRAME,
+                                                     store_dir=config.DATA_STORE_DIR, exchange_id=args.exchange)
+        return data_handler.load_ohlcv_from_store(args.symbol, args.timeframe, store_dir=config.DATA_STORE_DIR,
+                                                  exchange_id=args.exchange)
+    if not os.path.exists(args.csv):
+        print(f"錯誤：找不到CSV檔案 {args.csv}")
+        print("請將您的數據檔案放置在 'data' 資料夾下，或用 --csv 指定檔案路徑。")
+        print("您也可以從以下連結下載範例數據：https://www.cryptodatadownload.com/data/binance/")
+        return None
+    print(f"正在從 CSV 檔案 ({args.csv}) 加載數據...")
+    return data_handler.load_data_from_csv(args.csv, use_cache=True) # 第二次加載直接讀取二進位緩存
 
+def _load_data_or_fail(args):
+    data_df = _load_data(args)
+    if args.source in ('api', 'csv'):
+        # 本地存儲在同步時已檢查過新數據；CSV/API 數據在這裡整體檢查 (CSV 的週期由數據推斷)
+        from data_quality import check_loaded_data
+        data_df = check_loaded_data(data_df, args.timeframe if args.source == 'api' else None)
     if data_df is None or data_df.empty:
         print("數據獲取失敗，程式終止。")
-        return
-
-    print("數據加載完成。")
-    print(data_df.head())
-
-    # 選擇策略
-    strategy_to_run = MaCrossStrategy
-    # strategy_to_run = RsiStrategy
-    print(f"選擇的策略: {strategy_to_run.__name__}")
-
-    # 根據選擇的策略傳遞相應的參數
-    if strategy_to_run == MaCrossStrategy:
-        strategy_params = STRATEGY_PARAMS['MA_Cross']
-        # MaCrossStrategy.n1 = strategy_params['n1'] # 可以在這裡動態設定，或在策略類中直接使用
-        # MaCrossStrategy.n2 = strategy_params['n2']
-    elif strategy_to_run == RsiStrategy:
-        strategy_params = STRATEGY_PARAMS
-        # RsiStrategy.rsi_period = strategy_params['rsi_period']
-        # RsiStrategy.overbought_threshold = strategy_params['overbought_threshold']
-        # RsiStrategy.oversold_threshold = strategy_params['oversold_threshold']
+        return None
+    print(f"數據加載完成，共 {len(data_df)} 根 K 線 ({data_df.index[0]} 至 {data_df.index[-1]})。")
+    return data_df
+
+def cmd_fetch(args):
+    """
+    下載數據：--source store 增量同步到本地存儲 (compact 再轉存到緊湊存儲，trades 增量聚合成交檔案)；
+    --source api 獲取最近的 K 線並可寫入 CSV。
+    """
+    if args.source == 'csv':
+        print("錯誤: fetch 只支持 --source api、store、compact 或 trades。")
+        return 1
+    if args.source == 'store':
+        _sync_store(args)
+        return 0
+    if args.source in ('compact', 'trades'):
+        return 0 if _load_data_or_fail(args) is not None else 1
+    data_df = _load_data_or_fail(args)
+    if data_df is None:
+        return 1
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        data_df.to_csv(args.output, index_label='timestamp')
+        print(f"數據已寫入 {args.output}")
     else:
-        print("未知的策略類型。")
-        return
+        print(data_df.tail())
+    return 0
+
+def cmd_backtest(args):
+    """運行一次回測，打印統計並寫入結果存儲。"""
+    from backtester import run_backtest
+    from result_store import ResultStore
 
-    print(f"策略參數: {strategy_params}")
+    data_df = _load_data_or_fail(args)
+    if data_df is None:
+        return 1
+    strategy_class = get_strategy(args.strategy)
+    strategy_params = {**config.STRATEGY_PARAMS.get(args.strategy, {}), **_parse_params(args.param)}
+    print(f"選擇的策略: {strategy_class.__name__}，參數: {strategy_params}")
     print("開始執行回測...")
 
-    stats = run_backtest(
-        data_df,
-        strategy_to_run,
-        cash=BACKTEST_CONFIG['initial_cash'],
-        commission=BACKTEST_CONFIG['commission_rate']
-    )
-
-    if stats is not None:
-        print("\n回測結果統計:")
-        print(stats)
-        # stats['_strategy'] 包含策略實例，可以訪問優化後的參數等
-        # print("\n策略詳情:")
-        # print(stats['_strategy'])
+    # 結果寫入結果存儲，不再每次生成 HTML 圖表；需要時用 report --plot 按需繪圖
+    store = None if args.no_store else ResultStore(args.store_dir)
+    if args.fast:
+        from fast_backtest import run_fast_backtest
+        stats = run_fast_backtest(data_df, strategy_class, cash=args.cash, commission=args.commission,
+                                  result_store=store, symbol=args.symbol, timeframe=args.timeframe, **strategy_params)
     else:
+        stats = run_backtest(data_df, strategy_class, cash=args.cash, commission=args.commission,
+                             plot_results=args.plot, result_store=store, symbol=args.symbol, timeframe=args.timeframe,
+                             **strategy_params)
+    if stats is None:
         print("回測執行出錯。")
+        return 1
+    print("\n回測結果統計:")
+    print(stats.filter(regex='^[^_]').to_string())
+    if store is not None:
+        store.flush()
+        print(f"\n結果已寫入 {args.store_dir}；查看排名: python main.py report，繪圖: python main.py report --plot <run_id>")
+    return 0
+
+def cmd_optimize(args):
+    """在參數網格上優化策略：有向量化信號模型的策略預設用 sweep.py，其他策略用 optimizer.py 並行回測。"""
+    grid = _parse_grid(args.grid)
+    if not grid:
+        print("錯誤: 請用 --grid 指定參數網格，例如 --grid n1=5:50:5 --grid n2=10,20,50")
+        return 1
+    data_df = _load_data_or_fail(args)
+    if data_df is None:
+        return 1
+    method = args.method
+    if method == 'auto':
+        from sweep import SIGNAL_MODELS
+        method = 'sweep' if args.strategy in SIGNAL_MODELS else 'parallel'
+    print(f"優化 {args.strategy} ({method})，參數網格: {grid}")
+
+    if method == 'sweep':
+        from sweep import SIGNAL_MODELS, run_sweep
+        if args.strategy not in SIGNAL_MODELS:
+            print(f"錯誤: 策略 {args.strategy} 沒有向量化信號模型，請使用 --method parallel。")
+            return 1
+        results = run_sweep(data_df, SIGNAL_MODELS[args.strategy].from_param_grid(grid), cash=args.cash,
+                            commission=args.commission, maximize=args.maximize)
+    else:
+        from optimizer import optimize
+        results = optimize(data_df, get_strategy(args.strategy), grid, maximize=args.maximize, cash=args.cash,
+                           commission=args.commission, n_workers=args.workers)
+    if results.empty:
+        print("沒有可評估的參數組合。")
+        return 1
+    print(results.head(args.top).to_string(index=False))
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        results.to_csv(args.output, index=False)
+        print(f"完整結果已寫入 {args.output}")
+    return 0
+
+def cmd_report(args):
+    """查詢結果存儲中的排名，為選中的運行繪製圖表或做蒙地卡羅穩健性分析。"""
+    # 存儲中還沒有運行時直接返回，不必導入 pandas/pyarrow (約 0.5 秒)
+    runs_dir = os.path.join(args.store_dir, 'runs')
+    has_runs = os.path.isdir(runs_dir) and any(name.endswith('.parquet') for name in os.listdir(runs_dir))
+    if not has_runs and not args.plot and not args.monte_carlo:
+        print(f"{args.store_dir} 中沒有符合條件的運行。")
+        return 0
+    from result_store import ResultStore
+
+    store = ResultStore(args.store_dir)
+    if args.plot:
+        runs = store.runs()
+        row = runs[runs['run_id'] == args.plot]
+        if row.empty:
+            print(f"錯誤: 找不到運行 {args.plot}")
+            return 1
+        # 預設按運行記錄的交易對和週期加載數據
+        args.symbol = args.symbol or row['symbol'].iloc[0] or config.TRADING_PAIR
+        args.timeframe = args.timeframe or row['timeframe'].iloc[0] or config.TIMEFRAME
+        data_df = _load_data_or_fail(args)
+        if data_df is None:
+            return 1
+        filename = store.plot(args.plot, data_df, open_browser=args.open)
+        if filename is None:
+            return 1
+        print(f"圖表已寫入 {filename}")
+        return 0
+
+    if args.monte_carlo:
+        from robustness import monte_carlo, print_monte_carlo_report
+
+        equity = store.load_equity(args.monte_carlo)
+        if equity is None:
+            return 1
+        report = monte_carlo(equity=equity, trades=store.load_trades(args.monte_carlo), n_sims=args.sims,
+                             seed=args.seed)
+        if report is None:
+            return 1
+        print_monte_carlo_report(report)
+        return 0
+
+    runs = store.query(args.symbol, args.timeframe, args.strategy, sort_by=args.by, top=args.top)
+    if runs.empty:
+        print(f"{args.store_dir} 中沒有符合條件的運行。")
+        return 0
+    columns = ['run_id', 'strategy', 'symbol', 'timeframe', 'params', args.by,
+               'Return [%]', 'Max. Drawdown [%]', '# Trades']
+    print(runs[[col for col in dict.fromkeys(columns) if col in runs.columns]].to_string(index=False))
+    return 0
+
+def cmd_job(args):
+    """
+    可斷點續跑的優化任務：create 建立任務 (數據快照到任務目錄)，run 在本機多進程運行並打印進度，
+    work 運行單個工作進程 (可在共享同一目錄的其他機器上啟動)，status 查看進度，results 匯總結果。
+    """
+    import optimization_job
+
+    if args.action == 'create':
+        grid = _parse_grid(args.grid)
+        if not grid:
+            print("錯誤: 請用 --grid 指定參數網格，例如 --grid n1=5:50:5 --grid n2=10,20,50")
+            return 1
+        datasets = {}
+        for symbol in args.symbols or [args.symbol]:
+            args.symbol = symbol
+            data_df = _load_data_or_fail(args)
+            if data_df is None:
+                return 1
+            datasets[symbol] = data_df
+        job = optimization_job.create_job(args.job_dir, args.strategy, datasets, grid, timeframe=args.timeframe,
+                                          method=args.method, cash=args.cash, commission=args.commission,
+                                          maximize=args.maximize, unit_size=args.unit_size)
+        return 0 if job is not None else 1
+    if args.action == 'run':
+        return 0 if optimization_job.run_job(args.job_dir, n_workers=args.workers) is not None else 1
+    if args.action == 'work':
+        completed = optimization_job.run_worker(args.job_dir)
+        if completed is None:
+            return 1
+        print(f"本工作進程完成 {completed} 個單元。")
+        return 0
+    if args.action == 'status':
+        progress = optimization_job.job_progress(args.job_dir)
+        if progress is None:
+            print(f"錯誤: 找不到任務 {args.job_dir}")
+            return 1
+        print(optimization_job.format_progress(progress))
+        return 0
+    results = optimization_job.collect_results(args.job_dir, maximize=args.maximize)
+    if results is None:
+        return 1
+    if results.empty:
+        print("任務還沒有完成的單元。")
+        return 0
+    print(results.head(args.top).to_string(index=False))
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        results.to_csv(args.output, index=False)
+        print(f"完整結果已寫入 {args.output}")
+    return 0
+
+def cmd_portfolio(args):
+    """在多個交易對上同時回測多個策略 (共用資金與指標計算)，打印組合、各策略和各子賬戶的統計。"""
+    from portfolio_backtest import run_portfolio_backtest, print_portfolio_report
+
+    datasets = {}
+    for symbol in args.symbols:
+        args.symbol = symbol
+        data_df = _load_data_or_fail(args)
+        if data_df is None:
+            return 1
+        datasets[symbol] = data_df
+    fractions = _parse_params(args.fraction) if args.fraction else None
+    results = run_portfolio_backtest(datasets, args.strategies, allocator=args.allocator, cash=args.cash,
+                                     commission=args.commission, fractions=fractions,
+                                     target_volatility=args.target_volatility)
+    if results is None:
+        print("組合回測執行出錯。")
+        return 1
+    print()
+    print_portfolio_report(results)
+    return 0
+
+def cmd_strategies(args):
+    """列出已註冊的策略及其在 config.py 中的預設參數 (不導入策略模組)。"""
+    for name in list_strategies():
+        strategy = STRATEGY_REGISTRY[name]
+        path = strategy if isinstance(strategy, str) else f'{strategy.__module__}:{strategy.__qualname__}'
+        print(f"{name:<12} {path:<50} {config.STRATEGY_PARAMS.get(name, {})}")
+    return 0
+
+def build_parser():
+    """建立命令列解析器，所有預設值取自 config.py。"""
+    parser = argparse.ArgumentParser(description='加密貨幣量化交易回測工具 (參數預設值來自 config.py)')
+    subparsers = parser.add_subparsers(dest='command')
+
+    fetch = subparsers.add_parser('fetch', help='下載 K 線數據')
+    _add_data_arguments(fetch)
+    fetch.set_defaults(source='store', func=cmd_fetch)
+    fetch.add_argument('--output', help='--source api 時把數據寫入此 CSV 檔案')
+
+    backtest = subparsers.add_parser('backtest', help='運行一次回測 (不帶子命令時的預設命令)')
+    _add_data_arguments(backtest)
+    _add_backtest_arguments(backtest)
+    backtest.add_argument('--param', action='append', metavar='NAME=VALUE', help='覆蓋策略參數，可重複')
+    backtest.add_argument('--plot', action='store_true', help='生成 Bokeh HTML 圖表')
+    backtest.add_argument('--fast', action='store_true',
+                          help='用 fast_backtest.py 的向量化引擎回測 (僅限有向量化信號的策略，結果與預設引擎相同)')
+    backtest.add_argument('--no-store', action='store_true', help='不把結果寫入結果存儲')
+    backtest.add_argument('--store-dir', default=config.BACKTEST_CONFIG['result_store_dir'])
+    backtest.set_defaults(func=cmd_backtest)
+
+    optimize = subparsers.add_parser('optimize', help='在參數網格上優化策略')
+    _add_data_arguments(optimize)
+    _add_backtest_arguments(optimize)
+    optimize.add_argument('--grid', action='append', metavar='NAME=VALUES',
+                          help='參數候選值，逗號分隔或 start:stop:step，可重複')
+    optimize.add_argument('--method', choices=['auto', 'sweep', 'parallel'], default='auto',
+                          help='sweep 為向量化掃描，parallel 為多進程 run_backtest；auto 按策略選擇')
+    optimize.add_argument('--maximize', default='Sharpe Ratio')
+    optimize.add_argument('--workers', type=int, help='--method parallel 的進程數')
+    optimize.add_argument('--top', type=int, default=10)
+    optimize.add_argument('--output', help='把完整結果寫入此 CSV 檔案')
+    optimize.set_defaults(func=cmd_optimize)
+
+    report = subparsers.add_parser('report', help='查詢結果存儲，或為某次運行繪圖')
+    _add_data_arguments(report)
+    report.set_defaults(symbol=None, timeframe=None, func=cmd_report)
+    report.add_argument('--strategy', help='策略類名，例如 MaCrossStrategy')
+    report.add_argument('--by', default='Sharpe Ratio', help='排序的統計列名')
+    report.add_argument('--top', type=int, default=20)
+    report.add_argument('--plot', metavar='RUN_ID', help='用存儲的參數重新回測該運行並生成圖表')
+    report.add_argument('--open', action='store_true', help='在瀏覽器中打開圖表')
+    report.add_argument('--monte-carlo', metavar='RUN_ID',
+                        help='對該運行做蒙地卡羅穩健性分析 (收益、夏普、最大回撤的置信區間與破產概率)')
+    report.add_argument('--sims', type=int, help=f"抽樣路徑數 (預設 {config.MONTE_CARLO_CONFIG['n_sims']})")
+    report.add_argument('--seed', type=int, help='隨機數種子')
+    report.add_argument('--store-dir', default=config.BACKTEST_CONFIG['result_store_dir'])
+
+    job = subparsers.add_parser('job', help='可斷點續跑、可多進程/多機器共同處理的優化任務')
+    job.add_argument('action', choices=['create', 'run', 'work', 'status', 'results'],
+                     help='create 建立任務，run 本機多進程運行，work 單個工作進程，status 查看進度，results 匯總結果')
+    job.add_argument('--job-dir', default=config.OPTIMIZATION_JOB_CONFIG['job_dir'],
+                     help=f"任務目錄 (預設 {config.OPTIMIZATION_JOB_CONFIG['job_dir']})")
+    _add_data_arguments(job)
+    _add_backtest_arguments(job)
+    job.add_argument('--symbols', nargs='+', help='create: 交易對列表 (預設為 --symbol)')
+    job.add_argument('--grid', action='append', metavar='NAME=VALUES',
+                     help='create: 參數候選值，逗號分隔或 start:stop:step，可重複')
+    job.add_argument('--method', choices=['auto', 'sweep', 'backtest'], default='auto',
+                     help='create: sweep 為向量化掃描，backtest 為逐組 run_backtest；auto 按策略選擇')
+    job.add_argument('--unit-size', type=int, help='create: 每個工作單元的參數組合數')
+    job.add_argument('--maximize', default='Sharpe Ratio')
+    job.add_argument('--workers', type=int, help='run: 本機工作進程數 (預設為 CPU 核心數)')
+    job.add_argument('--top', type=int, default=10)
+    job.add_argument('--output', help='results: 把完整結果寫入此 CSV 檔案')
+    job.set_defaults(func=cmd_job)
+
+    portfolio = subparsers.add_parser('portfolio', help='多策略、多交易對共用資金的組合回測')
+    _add_data_arguments(portfolio)
+    portfolio.add_argument('--symbols', nargs='+', default=config.PORTFOLIO_CONFIG['symbols'],
+                           help=f"交易對列表 (預設 {' '.join(config.PORTFOLIO_CONFIG['symbols'])})")
+    portfolio.add_argument('--strategies', nargs='+', default=config.PORTFOLIO_CONFIG['strategies'],
+                           choices=list_strategies(), help='策略名稱，參數取 config.STRATEGY_PARAMS')
+    portfolio.add_argument('--allocator', choices=['equal', 'volatility', 'fixed'],
+                           default=config.PORTFOLIO_CONFIG['allocator'], help='資金分配方式')
+    portfolio.add_argument('--fraction', action='append', metavar='STRATEGY=VALUE',
+                           help='--allocator fixed 的策略資金比例，可重複 (預設取 config.PORTFOLIO_CONFIG)')
+    portfolio.add_argument('--target-volatility', type=float,
+                           help=f"--allocator volatility 的年化目標波動率 "
+                                f"(預設 {config.PORTFOLIO_CONFIG['target_volatility']})")
+    portfolio.add_argument('--cash', type=float, default=config.BACKTEST_CONFIG['initial_cash'], help='初始資金')
+    portfolio.add_argument('--commission', type=float, default=config.BACKTEST_CONFIG['commission_rate'],
+                           help='手續費率')
+    portfolio.set_defaults(func=cmd_portfolio)
+
+    strategies = subparsers.add_parser('strategies', help='列出已註冊的策略')
+    strategies.set_defaults(func=cmd_strategies)
+    return parser
 
-    print("\n程式執行完畢。")
+def main(argv=None):
+    """解析命令列並運行子命令，返回退出碼。不帶子命令時按 config.py 的設定運行一次回測。"""
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or (argv[0].startswith('-') and argv[0] not in ('-h', '--help')):
+        argv = ['backtest'] + argv
+    args = build_parser().parse_args(argv)
+    return args.func(args)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
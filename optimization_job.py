@@ -0,0 +1,398 @@
+# optimization_job.py
+# 可斷點續跑的大規模參數優化任務。一個任務是共享檔案系統上的一個目錄：
+#   job.json            任務定義 (策略、交易對、評估方式、每個工作單元的參數組合數等)
+#   params.parquet      展開後的參數組合 (所有工作進程看到同一個順序)
+#   data/               建立任務時的 OHLCV 快照 (.npy)，工作進程以只讀 memmap 映射，不需要連接交易所
+#   claims/unit-N.G     工作單元的第 G 代認領標記，以 O_EXCL 原子地建立；持有者定期更新修改時間作為心跳，
+#                       過期的認領由其他進程建立下一代接手
+#   results/unit-N.parquet  完成的工作單元結果，先寫臨時檔案並 fsync，再原子地改名
+# 重新啟動時已有結果的單元直接跳過；多個進程 (或掛載同一目錄的多台機器) 可以同時認領同一任務的單元，
+# 崩潰的工作進程留下的認領在心跳超時後由其他進程接手，因此不會重複或遺漏工作。
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from config import OPTIMIZATION_JOB_CONFIG
+from optimizer import _WORKER_DATA, _attach_datasets, _publish_datasets, expand_param_grid
+
+JOB_FILE = 'job.json'
+PARAMS_FILE = 'params.parquet'
+
+def _unit_name(unit):
+    return f'unit-{unit:06d}'
+
+def _result_path(job_dir, unit):
+    return os.path.join(job_dir, 'results', _unit_name(unit) + '.parquet')
+
+def _claim_path(job_dir, unit, generation=0):
+    return os.path.join(job_dir, 'claims', f'{_unit_name(unit)}.{generation}')
+
+def load_job(job_dir):
+    """讀取任務定義；任務不存在時返回 None。"""
+    path = os.path.join(job_dir, JOB_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def _job_params(job, strategy_name, param_grid):
+    """按評估方式展開參數網格：sweep 使用信號模型的參數表 (已過濾無效組合)，backtest 使用笛卡兒積。"""
+    if job['method'] == 'sweep':
+        from sweep import SIGNAL_MODELS
+        return SIGNAL_MODELS[strategy_name].from_param_grid(param_grid).params
+    return pd.DataFrame(expand_param_grid(param_grid))
+
+def create_job(job_dir, strategy_name, datasets, param_grid, timeframe=None, method='auto', cash=100000,
+               commission=0.001, maximize='Sharpe Ratio', unit_size=None):
+    """
+    建立一個優化任務。任務已存在時不覆蓋，直接返回已有的定義 (可在崩潰後用同一命令繼續)。
+
+    參數:
+    - job_dir (str): 任務目錄，多個工作進程/機器共享。
+    - strategy_name (str): strategies.STRATEGY_REGISTRY 中的策略名稱。
+    - datasets (dict | pd.DataFrame): 交易對 -> OHLCV DataFrame；數據會複製一份到任務目錄。
+    - param_grid (dict): 參數名 -> 候選值列表。
+    - timeframe (str, optional): K 線週期，只用於記錄。
+    - method (str): 'sweep' (sweep.py 向量化掃描)、'backtest' (逐組 run_backtest) 或 'auto' (有信號模型時用 sweep)。
+    - cash, commission: 回測資金與手續費率。
+    - maximize (str): collect_results 排序依據的統計列名。
+    - unit_size (int, optional): 每個工作單元的參數組合數，預設取 config.OPTIMIZATION_JOB_CONFIG['unit_size']。
+
+    返回:
+    - dict: 任務定義。參數無效時返回 None。
+    """
+    from strategies import STRATEGY_REGISTRY
+    from sweep import SIGNAL_MODELS
+
+    existing = load_job(job_dir)
+    if existing is not None:
+        print(f"任務 {job_dir} 已存在 ({existing['strategy']}，{existing['n_units']} 個工作單元)，繼續使用已有的定義。")
+        return existing
+    if strategy_name not in STRATEGY_REGISTRY:
+        print(f"錯誤: 未知的策略 {strategy_name}")
+        return None
+    if method == 'auto':
+        method = 'sweep' if strategy_name in SIGNAL_MODELS else 'backtest'
+    if method == 'sweep' and strategy_name not in SIGNAL_MODELS:
+        print(f"錯誤: 策略 {strategy_name} 沒有向量化信號模型，請使用 method='backtest'。")
+        return None
+    if isinstance(datasets, pd.DataFrame):
+        datasets = {None: datasets}
+
+    job = {'strategy': strategy_name, 'method': method, 'timeframe': timeframe, 'symbols': list(datasets),
+           'param_grid': param_grid, 'cash': cash, 'commission': commission, 'maximize': maximize}
+    params = _job_params(job, strategy_name, param_grid)
+    if params.empty:
+        print(f"錯誤: 參數網格 {param_grid} 沒有有效的組合。")
+        return None
+    unit_size = unit_size or OPTIMIZATION_JOB_CONFIG['unit_size'][method]
+    units_per_symbol = -(-len(params) // unit_size)
+    job.update({'n_combos': len(params), 'unit_size': unit_size, 'units_per_symbol': units_per_symbol,
+                'n_units': units_per_symbol * len(datasets), 'created': time.time()})
+
+    for sub in ('data', 'claims', 'results'):
+        os.makedirs(os.path.join(job_dir, sub), exist_ok=True)
+    params.to_parquet(os.path.join(job_dir, PARAMS_FILE), index=False)
+    paths = _publish_datasets(datasets, os.path.join(job_dir, 'data'))
+    job['data_files'] = [[os.path.basename(path) for path in paths[symbol]] for symbol in datasets]
+    path = os.path.join(job_dir, JOB_FILE)
+    with open(path + '.tmp', 'w') as f: # job.json 最後寫入，作為任務建立完成的標記
+        json.dump(job, f, indent=2)
+    os.replace(path + '.tmp', path)
+    print(f"已建立任務 {job_dir}: {strategy_name} ({method})，{len(datasets)} 個交易對 x {len(params)} 組參數，"
+          f"{job['n_units']} 個工作單元。")
+    return job
+
+def _unit_claims(job_dir, unit):
+    """返回工作單元現有的認領標記 [(世代, 路徑)]，按世代升序。"""
+    prefix = _unit_name(unit) + '.'
+    claims_dir = os.path.join(job_dir, 'claims')
+    claims = [(int(name[len(prefix):]), os.path.join(claims_dir, name)) for name in os.listdir(claims_dir)
+              if name.startswith(prefix) and name[len(prefix):].isdigit()]
+    return sorted(claims)
+
+def _try_claim(job_dir, unit, worker_id, lease_seconds):
+    """
+    嘗試認領一個工作單元，成功時返回認領標記的路徑，否則返回 None。
+
+    認領標記帶世代號 (claims/unit-N.G)，每一代都以 O_EXCL 建立，同一代只有一個進程能成功。
+    最新一代的修改時間超過 lease_seconds 未更新時，視為持有者已崩潰，以 O_EXCL 建立下一代來接手：
+    多個進程同時判定同一代過期時只有一個能建立下一代，也不會刪掉別人剛建立的新認領。
+    """
+    claims = _unit_claims(job_dir, unit)
+    generation = 0
+    if claims:
+        latest_generation, latest = claims[-1]
+        try:
+            if time.time() - os.path.getmtime(latest) < lease_seconds:
+                return None
+        except FileNotFoundError: # 剛被完成或被其他進程接手
+            return None
+        generation = latest_generation + 1
+    path = _claim_path(job_dir, unit, generation)
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return None
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'worker': worker_id, 'claimed': time.time(), 'generation': generation}, f)
+    for _, stale in claims: # 清理被接手的舊世代
+        try:
+            os.remove(stale)
+        except FileNotFoundError:
+            pass
+    if os.path.exists(_result_path(job_dir, unit)): # 認領前的瞬間被其他進程完成
+        os.remove(path)
+        return None
+    return path
+
+class _Heartbeat:
+    """在背景線程中定期更新認領標記的修改時間，讓其他進程知道該單元仍在處理中。"""
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                os.utime(self.path)
+            except FileNotFoundError:
+                return
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+def _load_worker_data(job_dir, job, symbol_index):
+    """映射任務目錄中的數據快照 (每個進程只映射一次)。"""
+    key = (os.path.abspath(job_dir), symbol_index)
+    if key not in _WORKER_DATA:
+        values_file, index_file = job['data_files'][symbol_index]
+        data_dir = os.path.join(job_dir, 'data')
+        _attach_datasets({key: (os.path.join(data_dir, values_file), os.path.join(data_dir, index_file))})
+    return _WORKER_DATA[key]
+
+def _evaluate_unit(job_dir, job, params, unit, indicator_cache):
+    """評估一個工作單元的所有參數組合，返回包含 symbol、參數和統計量的結果表。"""
+    symbol_index, part = divmod(unit, job['units_per_symbol'])
+    chunk = params.iloc[part * job['unit_size']:(part + 1) * job['unit_size']]
+    data_df = _load_worker_data(job_dir, job, symbol_index)
+    if job['method'] == 'sweep':
+        from sweep import SIGNAL_MODELS, _evaluate_range
+
+        model = SIGNAL_MODELS[job['strategy']].from_param_grid(job['param_grid'])
+        # 同一交易對的指標矩陣只算一次，供該進程處理的所有單元使用
+        if indicator_cache.get('symbol') != symbol_index:
+            indicator_cache.update(symbol=symbol_index, matrix=model.indicators(data_df['Close'].to_numpy(dtype=float)))
+        results = _evaluate_range(data_df['Open'].to_numpy(dtype=float), data_df['Close'].to_numpy(dtype=float),
+                                  data_df.index, model, indicator_cache['matrix'], chunk.reset_index(drop=True),
+                                  0, len(data_df), job['cash'], job['commission'], chunk_size=128)
+    else:
+        from backtester import run_backtest
+        from strategies import get_strategy
+
+        strategy_class = get_strategy(job['strategy'])
+        rows = []
+        for params_row in chunk.to_dict('records'):
+            stats = run_backtest(data_df, strategy_class, cash=job['cash'], commission=job['commission'],
+                                 plot_results=False, **params_row)
+            row = dict(params_row)
+            if stats is not None:
+                row.update({key: value for key, value in stats.filter(regex='^[^_]').items()
+                            if isinstance(value, (int, float, np.number))})
+            rows.append(row)
+        results = pd.DataFrame(rows)
+    results.insert(0, 'symbol', job['symbols'][symbol_index])
+    return results
+
+def _write_result(job_dir, unit, results):
+    """持久地寫入一個單元的結果：寫臨時檔案、fsync，再原子地改名。改名後該單元即視為完成。"""
+    path = _result_path(job_dir, unit)
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    results.to_parquet(tmp_path, index=False)
+    with open(tmp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def run_worker(job_dir, worker_id=None, max_units=None, lease_seconds=None):
+    """
+    認領並處理任務中尚未完成的工作單元，直到沒有可認領的單元。可以在多個進程或機器上同時運行。
+
+    參數:
+    - job_dir (str): 任務目錄。
+    - worker_id (str, optional): 工作進程標識，預設為 主機名-進程號。
+    - max_units (int, optional): 最多處理的單元數 (例如只跑一部分後退出)。
+    - lease_seconds (float, optional): 認領的心跳超時，預設取 config.OPTIMIZATION_JOB_CONFIG。
+
+    返回:
+    - int: 本進程完成的單元數。任務不存在時返回 None。
+    """
+    job = load_job(job_dir)
+    if job is None:
+        print(f"錯誤: 找不到任務 {job_dir}")
+        return None
+    import warnings
+    warnings.filterwarnings('ignore') # backtesting.py 對每組參數的警告會淹沒輸出
+
+    worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+    lease_seconds = lease_seconds or OPTIMIZATION_JOB_CONFIG['lease_seconds']
+    params = pd.read_parquet(os.path.join(job_dir, PARAMS_FILE))
+    indicator_cache = {}
+    completed = 0
+    while max_units is None or completed < max_units:
+        claimed_any = False
+        for unit in range(job['n_units']):
+            if max_units is not None and completed >= max_units:
+                break
+            if os.path.exists(_result_path(job_dir, unit)):
+                continue
+            claim = _try_claim(job_dir, unit, worker_id, lease_seconds)
+            if claim is None:
+                continue
+            claimed_any = True
+            with _Heartbeat(claim, lease_seconds / 3):
+                results = _evaluate_unit(job_dir, job, params, unit, indicator_cache)
+            _write_result(job_dir, unit, results)
+            try:
+                os.remove(claim)
+            except FileNotFoundError: # 心跳中斷過久，認領已被其他進程接手並清理
+                pass
+            completed += 1
+        if not claimed_any:
+            break
+    return completed
+
+def job_progress(job_dir, window=50):
+    """
+    統計任務進度。吞吐量由最近 window 個完成單元的完成時間估計 (跨重啟和多台機器都適用)。
+
+    返回:
+    - dict: n_units、done、running (心跳未超時的認領)、n_combos、combos_done、
+            throughput (參數組合/秒)、eta_seconds、percent。任務不存在時返回 None。
+    """
+    job = load_job(job_dir)
+    if job is None:
+        return None
+    results_dir, claims_dir = os.path.join(job_dir, 'results'), os.path.join(job_dir, 'claims')
+    done_files = [f for f in os.listdir(results_dir) if f.endswith('.parquet')]
+    now = time.time()
+    running = len({f.split('.')[0] for f in os.listdir(claims_dir) if f.startswith('unit-')
+                   and now - os.path.getmtime(os.path.join(claims_dir, f)) < OPTIMIZATION_JOB_CONFIG['lease_seconds']})
+
+    def unit_combos(name):
+        part = int(name[5:11]) % job['units_per_symbol']
+        return min(job['unit_size'], job['n_combos'] - part * job['unit_size'])
+
+    total_combos = job['n_combos'] * len(job['symbols'])
+    combos_done = sum(unit_combos(f) for f in done_files)
+    throughput = np.nan
+    recent = sorted((os.path.getmtime(os.path.join(results_dir, f)), f) for f in done_files)[-window:]
+    if len(recent) >= 2 and recent[-1][0] > recent[0][0]:
+        throughput = sum(unit_combos(f) for _, f in recent[1:]) / (recent[-1][0] - recent[0][0])
+    remaining = total_combos - combos_done
+    return {'n_units': job['n_units'], 'done': len(done_files), 'running': running, 'n_combos': total_combos,
+            'combos_done': combos_done, 'throughput': throughput,
+            'eta_seconds': remaining / throughput if throughput > 0 else (0.0 if not remaining else np.nan),
+            'percent': combos_done / total_combos * 100}
+
+def format_progress(progress):
+    """把 job_progress 的結果格式化為一行文字。"""
+    eta = progress['eta_seconds']
+    eta_text = '未知' if not np.isfinite(eta) else time.strftime('%H:%M:%S', time.gmtime(eta)) if eta < 86400 \
+        else f'{eta / 86400:.1f} 天'
+    throughput = progress['throughput']
+    return (f"進度 {progress['done']}/{progress['n_units']} 單元 ({progress['percent']:.1f}%，"
+            f"{progress['combos_done']}/{progress['n_combos']} 組)，進行中 {progress['running']}，"
+            f"吞吐量 {'未知' if not np.isfinite(throughput) else f'{throughput:,.1f} 組/秒'}，剩餘時間 {eta_text}")
+
+def run_job(job_dir, n_workers=None, progress_interval=None):
+    """
+    在本機用 n_workers 個進程運行任務，並定期打印進度、吞吐量和剩餘時間。
+    其他機器可以同時對同一任務目錄運行 run_worker。
+
+    返回:
+    - int: 本機完成的單元數。任務不存在時返回 None。
+    """
+    if load_job(job_dir) is None:
+        print(f"錯誤: 找不到任務 {job_dir}")
+        return None
+    n_workers = n_workers or os.cpu_count() or 1
+    progress_interval = progress_interval or OPTIMIZATION_JOB_CONFIG['progress_interval']
+    host = socket.gethostname()
+    print(format_progress(job_progress(job_dir)))
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(run_worker, job_dir, f'{host}-{os.getpid()}-{i}') for i in range(n_workers)]
+        next_report = time.time() + progress_interval
+        while not all(future.done() for future in futures):
+            time.sleep(0.2)
+            if time.time() >= next_report:
+                print(format_progress(job_progress(job_dir)))
+                next_report += progress_interval
+        completed = sum(future.result() or 0 for future in futures)
+    print(format_progress(job_progress(job_dir)))
+    return completed
+
+def collect_results(job_dir, maximize=None):
+    """
+    匯總所有已完成單元的結果。
+
+    返回:
+    - pd.DataFrame: 每個 (交易對, 參數組合) 一行，按 maximize (預設為建立任務時的設定) 降序排列。任務不存在時返回 None。
+    """
+    job = load_job(job_dir)
+    if job is None:
+        print(f"錯誤: 找不到任務 {job_dir}")
+        return None
+    results_dir = os.path.join(job_dir, 'results')
+    parts = [pd.read_parquet(os.path.join(results_dir, f)) for f in sorted(os.listdir(results_dir))
+             if f.endswith('.parquet')]
+    if not parts:
+        return pd.DataFrame()
+    results = pd.concat(parts, ignore_index=True)
+    maximize = maximize or job['maximize']
+    if maximize not in results.columns:
+        return results
+    return results.sort_values(maximize, ascending=False, na_position='last').reset_index(drop=True)
+
+if __name__ == '__main__':
+    # 模擬崩潰：第一個工作進程只完成一部分後退出，留下一個未完成的認領；之後的進程應跳過已完成的單元，
+    # 並在心跳超時後接手被遺棄的單元，最終結果與直接運行 run_sweep 相同
+    import tempfile
+    from sweep import MaCrossSignals, run_sweep
+    from synthetic_data import generate_ohlcv
+
+    data_df = generate_ohlcv(20000, 'h', start='2022-01-01', seed=5, volatility=0.002)
+    grid = {'n1': list(range(2, 60)), 'n2': list(range(10, 200, 2))}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        job_dir = os.path.join(tmp, 'job')
+        job = create_job(job_dir, 'MA_Cross', {'BTC/USDT': data_df, 'ETH/USDT': data_df * 1.5}, grid,
+                         timeframe='1h', unit_size=300)
+        print(f"第一個工作進程完成 {run_worker(job_dir, 'crashed', max_units=3)} 個單元後退出")
+        with open(_claim_path(job_dir, 3), 'w') as f: # 被遺棄的認領
+            json.dump({'worker': 'crashed'}, f)
+        os.utime(_claim_path(job_dir, 3), (time.time() - 3600, time.time() - 3600))
+        print(format_progress(job_progress(job_dir)))
+        start = time.perf_counter()
+        completed = run_job(job_dir, n_workers=2, progress_interval=2)
+        print(f"重新運行完成 {completed} 個單元，耗時 {time.perf_counter() - start:.1f} 秒")
+
+        results = collect_results(job_dir)
+        expected = run_sweep(data_df, MaCrossSignals(grid['n1'], grid['n2']))
+        btc = results[results['symbol'] == 'BTC/USDT'].drop(columns='symbol').sort_values(['n1', 'n2'])
+        expected = expected.sort_values(['n1', 'n2'])
+        same = len(btc) == len(expected) and np.allclose(btc['Sharpe Ratio'].to_numpy(), expected['Sharpe Ratio'].to_numpy(),
+                                                         equal_nan=True)
+        print(f"共 {len(results)} 行結果 (預期 {2 * job['n_combos']})，與 run_sweep {'一致' if same else '不一致'}")
@@ -0,0 +1,158 @@
+# optimizer.py
+import itertools
+import math
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+from backtester import run_backtest
+
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# 工作進程中已映射的數據集: symbol -> DataFrame (底層為只讀 memmap，不佔用額外內存)
+_WORKER_DATA = {}
+
+def expand_param_grid(param_grid, constraint=None):
+    """
+    將參數網格展開為參數字典列表。
+
+    參數:
+    - param_grid (dict): 參數名 -> 候選值列表，例如 {'n1': [5, 10], 'n2': [20, 30]}。
+    - constraint (callable, optional): 接受參數字典並返回 bool 的過濾函數，例如 lambda p: p['n1'] < p['n2']。
+
+    返回:
+    - list[dict]: 所有 (滿足約束的) 參數組合。
+    """
+    names = list(param_grid)
+    combos = [dict(zip(names, values)) for values in itertools.product(*(param_grid[name] for name in names))]
+    if constraint is not None:
+        combos = [params for params in combos if constraint(params)]
+    return combos
+
+def _publish_datasets(datasets, directory):
+    """把每個交易對的 OHLCV 數組寫成 .npy 檔案一次，供所有工作進程以 memmap 共享同一份頁面。"""
+    paths = {}
+    for i, (symbol, df) in enumerate(datasets.items()):
+        values_path = os.path.join(directory, f'{i}_values.npy')
+        index_path = os.path.join(directory, f'{i}_index.npy')
+        np.save(values_path, np.ascontiguousarray(df[OHLCV_COLUMNS].to_numpy(dtype=float)))
+        np.save(index_path, df.index.values)
+        paths[symbol] = (values_path, index_path)
+    return paths
+
+def _attach_datasets(paths):
+    """工作進程初始化：以只讀 memmap 方式映射所有數據集，並包裝成零拷貝的 DataFrame。"""
+    for symbol, (values_path, index_path) in paths.items():
+        values = np.load(values_path, mmap_mode='r')
+        index = pd.DatetimeIndex(np.load(index_path, mmap_mode='r'))
+        _WORKER_DATA[symbol] = pd.DataFrame(values, index=index, columns=OHLCV_COLUMNS, copy=False)
+
+def _run_batch(strategy_class, tasks, cash, commission):
+    """在工作進程中依次回測一批 (symbol, params) 任務。"""
+    return [(symbol, params, run_backtest(_WORKER_DATA[symbol], strategy_class, cash=cash, commission=commission,
+                                          plot_results=False, **params))
+            for symbol, params in tasks]
+
+def optimize_parallel(datasets, strategy_class, param_grid, cash=100000, commission=0.001,
+                      n_workers=None, batch_size=None, constraint=None):
+    """
+    在進程池中並行回測多個參數組合 (與多個交易對)，結果完成一批即返回一批。
+    OHLCV 數據只寫入臨時 memmap 檔案一次，工作進程直接映射，不會把數據 pickle 給每個任務。
+
+    參數:
+    - datasets (dict | pd.DataFrame): 交易對 -> OHLCV DataFrame；傳入單個 DataFrame 時交易對名稱為 None。
+    - strategy_class (Strategy): 要回測的策略類，必須可以被 import (定義在模組頂層)。
+    - param_grid (dict | list[dict]): 參數網格 (見 expand_param_grid) 或已展開的參數字典列表。
+    - cash (float): 初始資金。
+    - commission (float): 手續費率。
+    - n_workers (int, optional): 工作進程數。預設為 CPU 核心數。
+    - batch_size (int, optional): 每個進程任務包含的回測次數，用於減少進程間通訊。
+                                  預設讓每個進程大約分到 4 批任務。
+    - constraint (callable, optional): 參數過濾函數，僅在 param_grid 為 dict 時使用。
+
+    返回:
+    - generator: 逐個產生 (symbol, params, stats)，stats 與 run_backtest 的返回值相同 (出錯時為 None)。
+                 產生順序為完成順序，不是提交順序。
+    """
+    if isinstance(datasets, pd.DataFrame):
+        datasets = {None: datasets}
+    combos = expand_param_grid(param_grid, constraint) if isinstance(param_grid, dict) else list(param_grid)
+    tasks = [(symbol, params) for symbol in datasets for params in combos]
+    if not tasks:
+        return
+
+    n_workers = n_workers or os.cpu_count() or 1
+    batch_size = batch_size or max(1, math.ceil(len(tasks) / (n_workers * 4)))
+    batches = [tasks[i:i + batch_size] for i in range(0, len(tasks), batch_size)]
+
+    directory = tempfile.mkdtemp(prefix='optimizer_')
+    executor = None
+    try:
+        paths = _publish_datasets(datasets, directory)
+        executor = ProcessPoolExecutor(max_workers=n_workers, initializer=_attach_datasets, initargs=(paths,))
+        futures = [executor.submit(_run_batch, strategy_class, batch, cash, commission) for batch in batches]
+        for future in as_completed(futures):
+            yield from future.result()
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        shutil.rmtree(directory, ignore_errors=True)
+
+def optimize(datasets, strategy_class, param_grid, maximize='Sharpe Ratio', progress=True, **kwargs):
+    """
+    運行 optimize_parallel 並把結果匯總為一張排序後的表格。
+
+    參數:
+    - datasets, strategy_class, param_grid: 同 optimize_parallel。
+    - maximize (str): 排序依據的統計列名。
+    - progress (bool): 是否打印進度。
+    - **kwargs: 傳給 optimize_parallel 的其他參數 (cash, commission, n_workers, batch_size, constraint)。
+
+    返回:
+    - pd.DataFrame: 每次回測一行，包含 symbol、參數和 stats 中的公開統計量 (不含以 '_' 開頭的項)。
+    """
+    rows = []
+    n_total = None
+    if progress:
+        n_datasets = 1 if isinstance(datasets, pd.DataFrame) else len(datasets)
+        combos = param_grid if not isinstance(param_grid, dict) else \
+            expand_param_grid(param_grid, kwargs.get('constraint'))
+        n_total = n_datasets * len(combos)
+    for done, (symbol, params, stats) in enumerate(optimize_parallel(datasets, strategy_class, param_grid, **kwargs), 1):
+        row = {'symbol': symbol, **params}
+        if stats is not None:
+            row.update(stats.filter(regex='^[^_]').to_dict())
+        rows.append(row)
+        if progress and (done % max(1, n_total // 10) == 0 or done == n_total):
+            print(f"優化進度: {done}/{n_total}")
+    results = pd.DataFrame(rows)
+    if results.empty or maximize not in results.columns:
+        return results
+    return results.sort_values(maximize, ascending=False, na_position='last').reset_index(drop=True)
+
+if __name__ == '__main__':
+    # 用隨機遊走價格測試並行優化器
+    import time
+    import warnings
+    from strategies.simple_ma_strategy import MaCrossStrategy
+    from synthetic_data import generate_ohlcv
+
+    warnings.filterwarnings('ignore')
+    test_datasets = {symbol: generate_ohlcv(2000, 'h', start='2023-01-01', seed=seed, start_price=1000.0,
+                                            volatility=0.01)
+                     for seed, symbol in enumerate(['BTC/USDT', 'ETH/USDT'])}
+
+    grid = {'n1': [5, 10, 15, 20], 'n2': [20, 30, 40, 50]}
+    start = time.perf_counter()
+    results = optimize(test_datasets, MaCrossStrategy, grid, constraint=lambda p: p['n1'] < p['n2'], n_workers=2)
+    print(f"並行優化完成，耗時 {time.perf_counter() - start:.2f} 秒")
+    print(results[['symbol', 'n1', 'n2', 'Return [%]', 'Sharpe Ratio', '# Trades']].head(10))
+
+    # 與單次 run_backtest 對照
+    best = results.iloc[0]
+    serial = run_backtest(test_datasets[best['symbol']], MaCrossStrategy, plot_results=False,
+                          n1=int(best['n1']), n2=int(best['n2']))
+    print(f"對照 run_backtest: {serial['Return [%]']:.6f} vs {best['Return [%]']:.6f}")
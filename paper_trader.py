@@ -0,0 +1,428 @@
+# paper_trader.py
+import asyncio
+import sys
+import time
+from collections import deque
+import numpy as np
+import pandas as pd
+import ccxt
+import ccxt.async_support as ccxt_async
+from backtesting._util import _Data
+
+from data_handler import OHLCV_COLUMNS
+
+_FULL_EQUITY = 1 - sys.float_info.epsilon # 與 Strategy.buy() 的預設 size 相同
+
+class PaperPosition:
+    """提供與 backtesting.Position 相同的接口 (布林值、size、is_long、is_short、pl、close)，供策略在 next() 中使用。"""
+
+    def __init__(self, broker):
+        self._broker = broker
+
+    def __bool__(self):
+        return bool(self.size)
+
+    @property
+    def size(self):
+        return self._broker.position_size
+
+    @property
+    def pl(self):
+        return self._broker.unrealized_pl
+
+    @property
+    def is_long(self):
+        return self.size > 0
+
+    @property
+    def is_short(self):
+        return self.size < 0
+
+    def close(self, portion=1.):
+        self._broker.close_position(portion)
+
+class PaperBroker:
+    """
+    模擬撮合的賬戶，規則與 run_backtest (exclusive_orders=True) 相同：
+    市價單在下一根 K 線的開盤價成交，開倉和平倉各收一次手續費，size 小於 1 時表示按權益比例下單，
+    新訂單會取消未成交的訂單並先平掉現有倉位。只支持市價單。
+    """
+
+    def __init__(self, cash=100000, commission=0.001):
+        self.cash = float(cash)
+        self.commission = commission
+        self.position_size = 0
+        self.entry_price = np.nan
+        self.entry_time = None
+        self.last_price = np.nan
+        self.orders = []
+        self.closed_trades = []
+        self.position = PaperPosition(self)
+
+    @property
+    def trades(self):
+        return () if not self.position_size else ((self.position_size, self.entry_price, self.entry_time),)
+
+    @property
+    def unrealized_pl(self):
+        return self.position_size * (self.last_price - self.entry_price) if self.position_size else 0.0
+
+    @property
+    def equity(self):
+        return self.cash + self.unrealized_pl
+
+    def new_order(self, size, limit=None, stop=None, sl=None, tp=None, tag=None):
+        if any(value is not None for value in (limit, stop, sl, tp)):
+            raise NotImplementedError("模擬撮合只支持市價單。")
+        self.orders = []
+        if self.position_size:
+            self.orders.append({'close': 1.})
+        order = {'size': float(size), 'tag': tag}
+        self.orders.append(order)
+        return order
+
+    def close_position(self, portion=1.):
+        if self.position_size:
+            self.orders.insert(0, {'close': portion})
+
+    def fill_orders(self, timestamp, price):
+        """以這根 K 線的開盤價成交所有待成交訂單，返回成交記錄列表。"""
+        fills = []
+        orders, self.orders = self.orders, []
+        for order in orders:
+            if 'close' in order:
+                units = -int(round(self.position_size * order['close']))
+                if units:
+                    fills.append(self._fill(timestamp, price, units))
+                continue
+            size = order['size']
+            if abs(size) < 1:
+                units = int(self.equity * abs(size) // (price * (1 + self.commission)))
+            else:
+                units = int(abs(size))
+            if units == 0:
+                print(f"{timestamp}: 資金不足，訂單取消 (權益 {self.equity:.2f})。")
+                continue
+            fills.append(self._fill(timestamp, price, units if size > 0 else -units))
+        return fills
+
+    def _fill(self, timestamp, price, units):
+        commission = abs(units) * price * self.commission
+        if self.position_size and (units > 0) != (self.position_size > 0):
+            # 減倉或平倉：實現盈虧
+            closed = min(abs(units), abs(self.position_size)) * (1 if self.position_size > 0 else -1)
+            pnl = closed * (price - self.entry_price)
+            self.cash += pnl - commission
+            self.closed_trades.append({'EntryTime': self.entry_time, 'ExitTime': timestamp, 'Size': closed,
+                                       'EntryPrice': self.entry_price, 'ExitPrice': price, 'PnL': pnl})
+            self.position_size -= closed
+            if not self.position_size:
+                self.entry_price, self.entry_time = np.nan, None
+        else:
+            self.cash -= commission
+            if not self.position_size:
+                self.entry_price, self.entry_time = price, timestamp
+            else:
+                total = self.position_size + units
+                self.entry_price = (self.entry_price * self.position_size + price * units) / total
+            self.position_size += units
+        return {'timestamp': timestamp, 'size': units, 'price': price, 'commission': commission}
+
+class _SymbolState:
+    """單個交易對的運行狀態：最近的 K 線、模擬賬戶和延遲記錄。"""
+
+    def __init__(self, history_bars, cash, commission):
+        self.history = deque(maxlen=history_bars)
+        self.broker = PaperBroker(cash, commission)
+        self.cursor = None
+        self.n_bars = 0
+        self.latencies_ms = []
+        self.budget_exceeded = 0
+        self.errors = 0
+        self.fills = []
+        self.signals = None # 策略的增量信號對象 (見 BaseStrategy.streaming_signals)
+
+class PaperTrader:
+    """
+    以 asyncio 同時輪詢多個交易對的新 K 線，每根已收盤的 K 線都交給現有的策略類 (backtesting.Strategy 子類) 決策，
+    在 PaperBroker 中模擬成交並跟蹤倉位。每個交易對在自己的任務中運行，
+    網路請求有超時和退避，一個交易對變慢或出錯不會阻塞其他交易對。
+
+    提供 streaming_signals() 的策略 (內建的 MA 交叉和 RSI 策略) 以 indicators.py 的增量指標逐根更新信號，
+    每根 K 線的決策耗時是 O(1)，與 history_bars 無關。其他策略的決策方式與回測相同：
+    用最近 history_bars 根 K 線建立策略實例、運行 init() 計算指標，再對最後一根 K 線調用 next()；
+    指標尚在預熱期時不調用 next()。
+    """
+
+    def __init__(self, exchange, symbols, strategy_class, timeframe='1m', strategy_params=None,
+                 cash=100000, commission=0.001, history_bars=500, warmup_bars=None, poll_interval=5.0,
+                 latency_budget_ms=50.0, request_timeout=10.0, retry_delay=1.0, streaming=True, verbose=True):
+        """
+        參數:
+        - exchange: ccxt 異步交易所實例 (見 create_async_exchange) 或 ReplayExchange。
+        - symbols (list[str]): 交易對列表。
+        - strategy_class (Strategy): 策略類，例如 MaCrossStrategy。
+        - timeframe (str): K線週期。
+        - strategy_params (dict, optional): 策略參數 (覆蓋類屬性)。
+        - cash (float): 每個交易對的初始資金。
+        - commission (float): 手續費率。
+        - history_bars (int): 每次決策使用的最近 K 線數量，必須不小於策略指標的最長週期。
+        - warmup_bars (int, optional): 啟動時先拉取的歷史 K 線數量 (只用於指標預熱，不交易)。預設為 history_bars。
+        - poll_interval (float): 沒有新 K 線時的輪詢間隔 (秒)。
+        - latency_budget_ms (float): 每根 K 線決策耗時的預算，超出時打印警告。
+        - request_timeout (float): 單次請求的超時 (秒)。
+        - retry_delay (float): 請求失敗後的首次重試等待 (秒)，連續失敗時加倍，最多 60 秒。
+        - streaming (bool): 策略提供 streaming_signals() 時是否使用增量信號；為 False 時每根 K 線重建策略。
+        - verbose (bool): 是否打印成交記錄。
+        """
+        self.exchange = exchange
+        self.symbols = list(symbols)
+        self.strategy_class = strategy_class
+        self.timeframe = timeframe
+        self.timeframe_ms = ccxt.Exchange.parse_timeframe(timeframe) * 1000
+        self.strategy_params = dict(strategy_params or {})
+        # 每根 K 線的數據窗口都不同，指標緩存只會增加開銷
+        if hasattr(strategy_class, 'use_indicator_cache'):
+            self.strategy_params.setdefault('use_indicator_cache', False)
+        self.history_bars = history_bars
+        self.warmup_bars = history_bars if warmup_bars is None else warmup_bars
+        self.poll_interval = poll_interval
+        self.latency_budget_ms = latency_budget_ms
+        self.request_timeout = request_timeout
+        self.retry_delay = retry_delay
+        self.verbose = verbose
+        self.states = {symbol: _SymbolState(history_bars, cash, commission) for symbol in self.symbols}
+        if streaming and hasattr(strategy_class, 'streaming_signals'):
+            for state in self.states.values():
+                state.signals = strategy_class.streaming_signals(self.strategy_params)
+
+    async def run(self, max_bars=None, duration=None):
+        """
+        運行交易循環，直到每個交易對都處理了 max_bars 根新 K 線、運行了 duration 秒，或任務被取消。
+
+        返回:
+        - pd.DataFrame: 見 summary()。
+        """
+        tasks = [asyncio.create_task(self._run_symbol(symbol, max_bars), name=symbol) for symbol in self.symbols]
+        try:
+            await asyncio.wait_for(asyncio.gather(*tasks), timeout=duration)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return self.summary()
+
+    async def _fetch(self, symbol, since):
+        return await asyncio.wait_for(self.exchange.fetch_ohlcv(symbol, self.timeframe, since=since, limit=1000),
+                                      timeout=self.request_timeout)
+
+    async def _run_symbol(self, symbol, max_bars):
+        state = self.states[symbol]
+        # 當前未收盤 K 線的開盤時間；之前的 K 線只用於預熱
+        live_start = self.exchange.milliseconds() // self.timeframe_ms * self.timeframe_ms
+        state.cursor = live_start - self.warmup_bars * self.timeframe_ms
+        delay = self.retry_delay
+        while max_bars is None or state.n_bars < max_bars:
+            try:
+                batch = await self._fetch(symbol, state.cursor)
+            except (asyncio.TimeoutError, ccxt.NetworkError) as e:
+                state.errors += 1
+                print(f"{symbol}: 請求失敗 ({type(e).__name__})，{delay:.1f} 秒後重試。")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+                continue
+            except ccxt.ExchangeError as e:
+                state.errors += 1
+                print(f"{symbol}: 交易所錯誤，停止此交易對: {e}")
+                return
+            delay = self.retry_delay
+
+            now_ms = self.exchange.milliseconds()
+            closed = [row for row in batch if row[0] >= state.cursor and row[0] + self.timeframe_ms <= now_ms]
+            for row in closed:
+                if row[0] < live_start:
+                    state.history.append(row[:6])
+                    if state.signals is not None:
+                        state.signals.update(float(row[4])) # 只預熱指標，不交易
+                else:
+                    self._on_bar(symbol, state, row)
+                state.cursor = row[0] + self.timeframe_ms
+                if max_bars is not None and state.n_bars >= max_bars:
+                    return
+            if len(closed) < len(batch) or not closed:
+                await asyncio.sleep(self.poll_interval)
+
+    def _on_bar(self, symbol, state, row):
+        """處理一根剛收盤的 K 線：以其開盤價成交上一根 K 線發出的訂單，然後讓策略對它作出決策。"""
+        timestamp = pd.Timestamp(row[0], unit='ms')
+        broker = state.broker
+        for fill in broker.fill_orders(timestamp, float(row[1])):
+            state.fills.append(fill)
+            if self.verbose:
+                side = '買入' if fill['size'] > 0 else '賣出'
+                print(f"{timestamp} {symbol}: {side} {abs(fill['size'])} @ {fill['price']:.2f}，權益 {broker.equity:.2f}")
+        state.history.append(row[:6])
+        broker.last_price = float(row[4])
+        state.n_bars += 1
+
+        start = time.perf_counter()
+        self._decide(state, float(row[4]))
+        latency_ms = (time.perf_counter() - start) * 1000
+        state.latencies_ms.append(latency_ms)
+        if latency_ms > self.latency_budget_ms:
+            state.budget_exceeded += 1
+            print(f"{timestamp} {symbol}: 決策耗時 {latency_ms:.1f} ms，超出預算 {self.latency_budget_ms:.1f} ms")
+
+    def _decide(self, state, close):
+        if state.signals is not None:
+            # 與 BaseStrategy.next() 查表下單的規則相同
+            entry, exit_ = state.signals.update(close)
+            position = state.broker.position
+            if entry:
+                if not position:
+                    state.broker.new_order(_FULL_EQUITY)
+            elif exit_:
+                if position.is_long:
+                    position.close()
+            return
+        rows = np.asarray(state.history, dtype=float)
+        df = pd.DataFrame(rows[:, 1:], index=pd.to_datetime(rows[:, 0].astype('int64'), unit='ms'), columns=OHLCV_COLUMNS)
+        strategy = self.strategy_class(state.broker, _Data(df), self.strategy_params)
+        strategy.init()
+        # 與 Backtest.run 相同：指標全部有值後的第二根 K 線才開始調用 next()
+        warmup = 0
+        for indicator in strategy._indicators:
+            valid = ~np.isnan(np.atleast_2d(indicator)).any(axis=0)
+            warmup = max(warmup, int(valid.argmax()) if valid.any() else len(df))
+        if len(df) >= warmup + 2:
+            strategy.next()
+
+    def summary(self):
+        """
+        返回每個交易對的運行摘要。
+
+        返回:
+        - pd.DataFrame: 索引為交易對，包含處理的 K 線數、成交次數、權益、回報率、持倉、
+                        決策延遲 (p50/p99/最大，毫秒)、超出預算次數和請求錯誤次數。
+        """
+        rows = {}
+        for symbol, state in self.states.items():
+            latencies = np.asarray(state.latencies_ms)
+            rows[symbol] = {
+                'bars': state.n_bars,
+                'fills': len(state.fills),
+                'closed_trades': len(state.broker.closed_trades),
+                'equity': state.broker.equity,
+                'position': state.broker.position_size,
+                'latency_p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else np.nan,
+                'latency_p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else np.nan,
+                'latency_max_ms': float(latencies.max()) if len(latencies) else np.nan,
+                'budget_exceeded': state.budget_exceeded,
+                'errors': state.errors,
+            }
+        return pd.DataFrame.from_dict(rows, orient='index')
+
+def create_async_exchange(exchange_id='binance', api_key=None, secret_key=None):
+    """建立 ccxt 異步交易所實例 (已開啟內建的請求頻率限制)。用完後需要 await exchange.close()。"""
+    exchange_params = {'enableRateLimit': True}
+    if api_key and secret_key:
+        exchange_params['apiKey'] = api_key
+        exchange_params['secret'] = secret_key
+    return getattr(ccxt_async, exchange_id)(exchange_params)
+
+class ReplayExchange:
+    """
+    離線回放已記錄 K 線的模擬交易所，接口與 ccxt 異步交易所的 fetch_ohlcv / milliseconds / close 相同。
+    模擬時鐘從 start 開始，以 speed 倍速前進；只返回開盤時間不晚於當前模擬時間的 K 線。
+    """
+    has = {'fetchOHLCV': True}
+
+    def __init__(self, candles, speed=1.0, start=None, delays=None):
+        """
+        參數:
+        - candles (dict): 交易對 -> OHLCV DataFrame (例如 load_ohlcv_from_store 的結果)。
+        - speed (float): 模擬時鐘相對真實時間的倍速，例如 60 表示每真實秒前進 1 分鐘。
+        - start (pd.Timestamp | str, optional): 模擬時鐘的起點。預設為所有數據中最早的 K 線時間。
+        - delays (dict, optional): 交易對 -> 每次請求的額外延遲 (秒)，用於模擬慢速交易對。
+        """
+        self._timestamps = {symbol: df.index.values.astype('datetime64[ms]').astype('int64')
+                            for symbol, df in candles.items()}
+        self._values = {symbol: df[OHLCV_COLUMNS].to_numpy(dtype=float) for symbol, df in candles.items()}
+        first = min(int(ts[0]) for ts in self._timestamps.values())
+        self.start_ms = int(pd.Timestamp(start).value // 10**6) if start is not None else first
+        self.speed = speed
+        self.delays = delays or {}
+        self._t0 = time.monotonic()
+
+    def milliseconds(self):
+        return self.start_ms + int((time.monotonic() - self._t0) * 1000 * self.speed)
+
+    async def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None):
+        if symbol not in self._timestamps:
+            raise ccxt.BadSymbol(f"ReplayExchange 沒有 {symbol} 的數據")
+        delay = self.delays.get(symbol)
+        if delay:
+            await asyncio.sleep(delay)
+        timestamps = self._timestamps[symbol]
+        begin = 0 if since is None else int(np.searchsorted(timestamps, since))
+        end = int(np.searchsorted(timestamps, self.milliseconds(), side='right'))
+        if limit is not None:
+            end = min(end, begin + limit)
+        return [[ts, *values] for ts, values in zip(timestamps[begin:end].tolist(),
+                                                     self._values[symbol][begin:end].tolist())]
+
+    async def close(self):
+        pass
+
+async def run_paper_trading(symbols, strategy_class, timeframe='1m', exchange=None, exchange_id='binance',
+                            api_key=None, secret_key=None, max_bars=None, duration=None, **trader_kwargs):
+    """
+    建立交易所與 PaperTrader 並運行，結束後關閉連接。
+
+    參數:
+    - symbols, strategy_class, timeframe: 同 PaperTrader。
+    - exchange (optional): 已建立的異步交易所或 ReplayExchange；為 None 時根據 exchange_id 與金鑰建立。
+    - max_bars, duration: 同 PaperTrader.run。
+    - **trader_kwargs: 傳給 PaperTrader 的其他參數。
+
+    返回:
+    - pd.DataFrame: 每個交易對的運行摘要。
+    """
+    own_exchange = exchange is None
+    if own_exchange:
+        exchange = create_async_exchange(exchange_id, api_key, secret_key)
+    try:
+        trader = PaperTrader(exchange, symbols, strategy_class, timeframe=timeframe, **trader_kwargs)
+        return await trader.run(max_bars=max_bars, duration=duration)
+    finally:
+        if own_exchange:
+            await exchange.close()
+
+if __name__ == '__main__':
+    # 離線測試：以 6000 倍速回放三個交易對的 1 分鐘 K 線，其中一個交易對每次請求都很慢
+    import warnings
+    from synthetic_data import generate_ohlcv
+    from backtester import run_backtest
+    from strategies.simple_ma_strategy import MaCrossStrategy
+
+    warnings.filterwarnings('ignore')
+    n_bars = 600
+    replay = {symbol: generate_ohlcv(n_bars, seed=seed, start='2024-01-01')
+              for seed, symbol in enumerate(['BTC/USDT', 'ETH/USDT', 'SLOW/USDT'])}
+    mock_exchange = ReplayExchange(replay, speed=6000, delays={'SLOW/USDT': 0.3})
+
+    start = time.perf_counter()
+    summary = asyncio.run(run_paper_trading(list(replay), MaCrossStrategy, timeframe='1m', exchange=mock_exchange,
+                                            max_bars=n_bars - 1, strategy_params={'n1': 10, 'n2': 20},
+                                            history_bars=100, warmup_bars=0, poll_interval=0.01,
+                                            latency_budget_ms=20, verbose=False))
+    print(f"\n模擬交易完成，耗時 {time.perf_counter() - start:.1f} 秒:")
+    print(summary.to_string(float_format=lambda x: f'{x:.2f}'))
+
+    # 與離線回測對照：同樣的 K 線，權益和已平倉交易數應一致
+    for symbol, df in replay.items():
+        stats = run_backtest(df.iloc[:-1], MaCrossStrategy, plot_results=False, n1=10, n2=20)
+        print(f"{symbol}: 回測權益 {stats['Equity Final [$]']:.2f} / 模擬 {summary.loc[symbol, 'equity']:.2f}，"
+              f"回測交易 {stats['# Trades']} / 模擬平倉 {summary.loc[symbol, 'closed_trades']}")
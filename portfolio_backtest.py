@@ -0,0 +1,337 @@
+# portfolio_backtest.py
+# 多策略、多交易對的組合回測。每個 (策略, 交易對) 是一個子賬戶 (sleeve)，所有子賬戶共用一份資金，
+# 在同一次遍歷中撮合，而不是對每個策略各跑一次 Backtest：
+# - 指標按 (交易對, 信號模型) 分組只算一次，同一交易對上不同參數的 MA/RSI 共用 sma_matrix / rsi_matrix；
+# - Python 循環只經過有信號的 K 線，權益曲線由成交事件以矩陣累加得到，不逐根 K 線、逐策略循環；
+# - 資金分配器 (equal 等權、volatility 波動率目標、fixed 固定比例) 決定每個子賬戶分到的初始資金，
+#   之後每個子賬戶只用自己的權益 (分到的資金 + 累計盈虧) 開倉，虧光的子賬戶不會再從共用資金中補充。
+# 撮合規則與 fast_backtest.backtest_signals 相同 (第 t 根的信號在第 t+1 根開盤成交、整數單位、開平倉各收手續費)，
+# 只有一個子賬戶且權重為 1 時結果與 run_fast_backtest 相同。
+import numpy as np
+import pandas as pd
+from backtesting._stats import compute_stats
+
+from config import PORTFOLIO_CONFIG, STRATEGY_PARAMS
+from sweep import SIGNAL_MODELS, STATS_COLUMNS, _FULL_EQUITY, _period_sampling, _summarize
+from strategies import get_strategy
+
+ALLOCATORS = ('equal', 'volatility', 'fixed')
+
+def _sleeve_table(strategies, symbols):
+    """
+    展開策略與交易對的組合。strategies 的元素為策略名稱 (參數取 config.STRATEGY_PARAMS)
+    或 (名稱, 參數字典)；同名策略出現多次時以參數區分標籤。
+    """
+    specs = [(item, STRATEGY_PARAMS.get(item, {})) if isinstance(item, str) else (item[0], dict(item[1]))
+             for item in strategies]
+    counts = pd.Series([name for name, _ in specs]).value_counts()
+    rows = []
+    for name, params in specs:
+        label = name if counts[name] == 1 else f"{name}({','.join(f'{k}={v}' for k, v in params.items())})"
+        for symbol in symbols:
+            rows.append({'strategy': label, 'name': name, 'symbol': symbol, 'params': params})
+    return pd.DataFrame(rows, columns=['strategy', 'name', 'symbol', 'params'])
+
+def _align(datasets):
+    """把各交易對的數據對齊到共同的時間索引，返回 (索引, 開盤價 (M, T), 收盤價 (M, T))。"""
+    index = None
+    for data_df in datasets.values():
+        index = data_df.index if index is None else index.intersection(data_df.index)
+    dropped = max(len(data_df) for data_df in datasets.values()) - len(index)
+    if dropped:
+        print(f"提示: 各交易對的時間索引不完全相同，只使用共同的 {len(index)} 根 K 線 (捨棄 {dropped} 根)。")
+    open_ = np.vstack([data_df['Open'].reindex(index).to_numpy(dtype=float) for data_df in datasets.values()])
+    close = np.vstack([data_df['Close'].reindex(index).to_numpy(dtype=float) for data_df in datasets.values()])
+    return index, open_, close
+
+def _sleeve_signals(sleeves, symbols, close):
+    """
+    計算所有子賬戶的 (entries, exits) 布林矩陣，形狀為 (S, T)。
+    同一交易對上同一信號模型的子賬戶合併成一個參數表，指標矩陣只算一次，信號一次生成。
+    """
+    entries = np.zeros((len(sleeves), close.shape[1]), dtype=bool)
+    exits = np.zeros_like(entries)
+    for (symbol, name), group in sleeves.groupby(['symbol', 'name'], sort=False):
+        model_class, strategy_class = SIGNAL_MODELS[name], get_strategy(name)
+        # 未給出的參數使用策略類的預設值 (與 fast_backtest.strategy_signals 相同)
+        params = pd.DataFrame([{col: params.get(col, getattr(strategy_class, col))
+                                for col in model_class.param_columns} for params in group['params']])
+        model = model_class.from_param_grid({col: sorted(set(params[col])) for col in model_class.param_columns})
+        matrix = model.indicators(close[symbols.index(symbol)])
+        entries[group.index], exits[group.index] = model.signals(matrix, params)
+    return entries, exits
+
+def _annualized_volatility(close, index, window):
+    """各交易對對數收益的滾動標準差，按 K 線週期年化，形狀為 (M, T)；預熱期為 NaN。"""
+    period = pd.Series(index[-100:]).diff().dropna().median() if isinstance(index, pd.DatetimeIndex) else None
+    bars_per_year = pd.Timedelta(days=365) / period if period is not None and period > pd.Timedelta(0) else 252
+    log_returns = pd.DataFrame(np.log(close.T)).diff()
+    return (log_returns.rolling(window).std() * np.sqrt(bars_per_year)).to_numpy().T
+
+def _base_weights(sleeves, allocator, fractions):
+    """每個子賬戶的基準權重；fixed 的比例按策略標籤給出，平均分給該策略的各個交易對。出錯時返回 None。"""
+    if allocator != 'fixed':
+        return np.full(len(sleeves), 1 / len(sleeves))
+    unknown = sorted(set(fractions) - set(sleeves['strategy']))
+    if unknown:
+        print(f"錯誤: fractions 中有未知的策略 {unknown}，可選: {', '.join(sleeves['strategy'].unique())}")
+        return None
+    total = sum(fractions.values())
+    if any(value < 0 for value in fractions.values()) or total > 1 + 1e-9:
+        print(f"錯誤: 固定比例必須非負且總和不超過 1 (目前為 {total:g})。")
+        return None
+    per_symbol = sleeves.groupby('strategy')['symbol'].transform('size').to_numpy()
+    return sleeves['strategy'].map(lambda label: fractions.get(label, 0.0)).to_numpy(dtype=float) / per_symbol
+
+def _simulate_portfolio(open_, sleeve_symbol, entries, exits, initial, volatility, target_volatility,
+                        commission, fractional):
+    """
+    按時間順序撮合所有子賬戶，只處理信號事件，不逐根 K 線循環。
+    平倉先於開倉；子賬戶空倉時的權益就是它的現金 (initial 中的初始資金 + 已實現盈虧)，開倉金額為這筆現金，
+    波動率目標時再乘以 min(目標波動率 / 該交易對的年化波動率, 1)。子賬戶只花自己的現金，所以權益不會為負。
+    fractional 為 False 時與 run_backtest 一樣只買入整數單位。
+
+    返回:
+    - tuple: (成交事件列表 [(子賬戶, K 線, 單位變化, 現金變化)], 交易列表 [(子賬戶, 開倉 K 線, 平倉 K 線,
+              單位, 開倉價, 平倉價)]，未平倉的交易平倉 K 線為 -1)。
+    """
+    # 所有信號按 (K 線, 平倉在前, 子賬戶) 排成一個事件序列；成交價與波動率縮放係數一次向量化取出，
+    # 循環內只做標量運算 (最後一根 K 線上的信號不會成交)
+    exit_bar, exit_sleeve = np.nonzero(exits[:, :-1].T)
+    entry_bar, entry_sleeve = np.nonzero(entries[:, :-1].T)
+    bars = np.concatenate([exit_bar, entry_bar])
+    is_entry = np.r_[np.zeros(len(exit_bar), dtype=bool), np.ones(len(entry_bar), dtype=bool)]
+    sleeves = np.concatenate([exit_sleeve, entry_sleeve])
+    order = np.lexsort((sleeves, is_entry, bars))
+    bars, is_entry, sleeves = bars[order], is_entry[order], sleeves[order]
+    prices = open_[sleeve_symbol[sleeves], bars + 1]
+    scale = np.ones(len(bars))
+    if volatility is not None:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vol = volatility[sleeve_symbol[sleeves], bars]
+            scale = np.where(np.isfinite(vol) & (vol > 0), np.minimum(target_volatility / vol, 1.0), 1.0)
+
+    sleeve_cash = [float(value) for value in initial]
+    held = {} # 子賬戶 -> (單位, 開倉 K 線, 開倉價)
+    fills, trades = [], []
+    for bar, entry, sleeve, price, fraction in zip(bars.tolist(), is_entry.tolist(), sleeves.tolist(),
+                                                   prices.tolist(), scale.tolist()):
+        fill_bar = bar + 1
+        if not entry:
+            if sleeve in held:
+                size, entry_fill, entry_price = held.pop(sleeve)
+                proceeds = size * price - size * price * commission
+                sleeve_cash[sleeve] += proceeds
+                fills.append((sleeve, fill_bar, -size, proceeds))
+                trades.append((sleeve, entry_fill, fill_bar, size, entry_price, price))
+            continue
+        if sleeve in held:
+            continue
+        budget = sleeve_cash[sleeve] * fraction * _FULL_EQUITY
+        size = budget / (price + price * commission) if fractional else budget // (price + price * commission)
+        if size <= 0:
+            continue # 資金不足以買入一個單位，訂單取消
+        cost = size * price + size * price * commission
+        sleeve_cash[sleeve] -= cost
+        held[sleeve] = (size, fill_bar, price)
+        fills.append((sleeve, fill_bar, size, -cost))
+    for sleeve, (size, entry_fill, entry_price) in held.items():
+        trades.append((sleeve, entry_fill, -1, size, entry_price, np.nan))
+    return fills, trades
+
+def _trades_frame(trades, sleeves, index, commission):
+    """把交易列表轉成與 stats['_trades'] 相同列 (另加 Strategy、Symbol) 的 DataFrame，只保留已平倉的交易。"""
+    columns = ['sleeve', 'EntryBar', 'ExitBar', 'Size', 'EntryPrice', 'ExitPrice']
+    frame = pd.DataFrame(trades, columns=columns)
+    frame = frame[frame['ExitBar'] >= 0].sort_values(['ExitBar', 'sleeve'], kind='stable').reset_index(drop=True)
+    size, entry_price, exit_price = frame['Size'], frame['EntryPrice'], frame['ExitPrice']
+    commissions = size * entry_price * commission + size * exit_price * commission
+    trades_df = pd.DataFrame({
+        'Size': size,
+        'EntryBar': frame['EntryBar'].astype(int),
+        'ExitBar': frame['ExitBar'].astype(int),
+        'EntryPrice': entry_price,
+        'ExitPrice': exit_price,
+        'SL': np.nan,
+        'TP': np.nan,
+        'PnL': size * (exit_price - entry_price) - commissions,
+        'Commission': commissions,
+        'ReturnPct': exit_price / entry_price - 1 - commissions / (size * entry_price),
+        'EntryTime': index[frame['EntryBar'].to_numpy(dtype=int)],
+        'ExitTime': index[frame['ExitBar'].to_numpy(dtype=int)],
+    })
+    trades_df['Duration'] = trades_df['ExitTime'] - trades_df['EntryTime']
+    trades_df['Tag'] = None
+    trades_df['Strategy'] = sleeves['strategy'].to_numpy()[frame['sleeve'].to_numpy(dtype=int)]
+    trades_df['Symbol'] = sleeves['symbol'].to_numpy()[frame['sleeve'].to_numpy(dtype=int)]
+    trades_df['sleeve'] = frame['sleeve'].to_numpy(dtype=int)
+    return trades_df
+
+def _stats(trades_df, equity, ohlc):
+    """compute_stats 加上 DataFrame 形式交易列表不輸出的手續費，與 fast_backtest.backtest_signals 一致。"""
+    stats = compute_stats(trades_df.drop(columns='sleeve'), equity, ohlc, None)
+    commissions = trades_df['Commission'].sum()
+    if commissions:
+        position = stats.index.get_loc('Equity Peak [$]') + 1
+        stats = pd.concat([stats.iloc[:position], pd.Series({'Commissions [$]': commissions}, dtype=object),
+                           stats.iloc[position:]])
+    return stats
+
+def run_portfolio_backtest(datasets, strategies=None, allocator=None, cash=100000, commission=0.001,
+                           fractions=None, target_volatility=None, vol_window=None, fractional=None):
+    """
+    在多個交易對上同時回測多個策略，共用一份資金。
+
+    參數:
+    - datasets (dict[str, pd.DataFrame] 或 pd.DataFrame): {交易對: OHLCV 數據}；單個 DataFrame 視為一個交易對。
+                                                       各交易對按共同的時間索引對齊。
+    - strategies (list): 策略名稱 (sweep.SIGNAL_MODELS 的鍵，參數取 config.STRATEGY_PARAMS) 或 (名稱, 參數字典)，
+                         每個策略在每個交易對上各有一個子賬戶。
+    - allocator (str): ALLOCATORS 之一，決定各子賬戶分到的資金。equal 每個子賬戶分到 1/S；fixed 按 fractions
+                       給出的策略比例 (平均分給各交易對，總和不超過 1，其餘保留為現金)；volatility 同樣等分，
+                       每次開倉只動用子賬戶權益的 min(目標波動率 / 該交易對的年化波動率, 1)，預熱期內全額開倉。
+                       子賬戶之間不再平衡，各自按自己的權益複利。
+    - cash (float): 初始資金。
+    - commission (float): 手續費率。
+    - fractions (dict[str, float]): fixed 分配器的 {策略標籤: 比例}。
+    - target_volatility (float): volatility 分配器的年化目標波動率，例如 0.6 表示 60%。
+    - vol_window (int): 計算波動率的 K 線數。
+    - fractional (bool): 是否允許買入非整數單位。每個子賬戶只分到一部分資金，BTC 等高價資產按整數單位
+                         往往一個單位也買不起；False 時與 run_backtest 的整數單位相同。
+    未給出的參數使用 config.PORTFOLIO_CONFIG。
+
+    返回:
+    - dict: 'portfolio' 為組合的統計數據 (pd.Series，格式同 run_backtest，買入持有收益為各交易對等權的籃子)；
+            'strategies' 為 {策略標籤: 統計數據}，權益為該策略各子賬戶的權益之和；
+            'sleeves' 為每個子賬戶一行的表 (strategy、symbol、params、weight 與 sweep.STATS_COLUMNS)。
+            子賬戶的權益 = 初始資金 x 權重 + 累計盈虧 (不會為負)，所有子賬戶與未分配現金之和等於組合權益。
+            出錯時返回 None。
+    """
+    config = PORTFOLIO_CONFIG
+    strategies = strategies or config['strategies']
+    allocator = allocator or config['allocator']
+    target_volatility = target_volatility or config['target_volatility']
+    vol_window = vol_window or config['vol_window']
+    fractional = config['fractional'] if fractional is None else fractional
+    if isinstance(datasets, pd.DataFrame):
+        datasets = {'data': datasets}
+    if allocator not in ALLOCATORS:
+        print(f"錯誤: 未知的資金分配器 {allocator}，可選: {', '.join(ALLOCATORS)}")
+        return None
+    if not datasets or not strategies:
+        print("錯誤: 需要至少一個交易對和一個策略。")
+        return None
+    names = [item if isinstance(item, str) else item[0] for item in strategies]
+    unsupported = sorted(set(names) - set(SIGNAL_MODELS))
+    if unsupported:
+        print(f"錯誤: 策略 {unsupported} 沒有向量化信號模型，組合回測支持: {', '.join(SIGNAL_MODELS)}")
+        return None
+    missing = [symbol for symbol, data_df in datasets.items()
+               if data_df is None or not {'Open', 'Close'}.issubset(data_df.columns)]
+    if missing:
+        print(f"錯誤: 交易對 {missing} 沒有數據或缺少 Open/Close 列。")
+        return None
+
+    symbols = list(datasets)
+    sleeves = _sleeve_table(strategies, symbols)
+    if fractions is None: # 設定檔中的比例只取本次運行的策略
+        fractions = {label: value for label, value in config['fractions'].items() if label in set(sleeves['strategy'])}
+    weights = _base_weights(sleeves, allocator, fractions)
+    if weights is None:
+        return None
+    index, open_, close = _align(datasets)
+    if len(index) < 2:
+        print("錯誤: 各交易對的共同 K 線少於兩根。")
+        return None
+    sleeve_symbol = sleeves['symbol'].map(symbols.index).to_numpy()
+    entries, exits = _sleeve_signals(sleeves, symbols, close)
+    volatility = _annualized_volatility(close, index, vol_window) if allocator == 'volatility' else None
+    initial = float(cash) * weights
+    fills, trades = _simulate_portfolio(open_, sleeve_symbol, entries, exits, initial, volatility,
+                                        target_volatility, commission, fractional)
+
+    # 權益曲線：持倉單位與現金只在成交的 K 線上變化，按事件累加後一次算出 (S, T) 矩陣
+    n_sleeves, n_bars = entries.shape
+    held = np.zeros((n_sleeves, n_bars))
+    flows = np.zeros((n_sleeves, n_bars))
+    if fills:
+        sleeve_idx, bar_idx, unit_delta, cash_delta = (np.array(values) for values in zip(*fills))
+        np.add.at(held, (sleeve_idx.astype(int), bar_idx.astype(int)), unit_delta)
+        np.add.at(flows, (sleeve_idx.astype(int), bar_idx.astype(int)), cash_delta)
+    sleeve_equity = initial[:, None] + np.cumsum(flows, axis=1) + np.cumsum(held, axis=1) * close[sleeve_symbol]
+    # 子賬戶只用自己的現金開倉且只做多，權益為負說明撮合有誤，此時的統計量沒有意義
+    negative = np.flatnonzero((sleeve_equity < 0).any(axis=1))
+    if len(negative):
+        print(f"錯誤: 子賬戶 {sleeves.loc[negative, ['strategy', 'symbol']].values.tolist()} 的權益為負。")
+        return None
+    equity = float(cash) - initial.sum() + sleeve_equity.sum(axis=0)
+
+    trades_df = _trades_frame(trades, sleeves, index, commission)
+    basket = pd.DataFrame({'Close': (close / close[:, :1]).mean(axis=0)}, index=index)
+    results = {'portfolio': _stats(trades_df, equity, basket), 'strategies': {}}
+    for label, group in sleeves.groupby('strategy', sort=False):
+        results['strategies'][label] = _stats(trades_df[trades_df['Strategy'] == label],
+                                              sleeve_equity[group.index].sum(axis=0), basket)
+
+    # 子賬戶的關鍵統計量與 sweep.py 一樣按矩陣一次算出
+    per_sleeve = [trades_df[trades_df['sleeve'] == sleeve] for sleeve in range(n_sleeves)]
+    width = max(1, max(len(frame) for frame in per_sleeve))
+    sim = {'equity': sleeve_equity, 'pnl': np.full((n_sleeves, width), np.nan),
+           'closed': np.zeros((n_sleeves, width), dtype=bool),
+           'entry_bar': np.zeros((n_sleeves, width), dtype=int), 'exit_bar': np.zeros((n_sleeves, width), dtype=int)}
+    for sleeve, frame in enumerate(per_sleeve):
+        sim['pnl'][sleeve, :len(frame)] = frame['PnL']
+        sim['closed'][sleeve, :len(frame)] = True
+        sim['entry_bar'][sleeve, :len(frame)] = frame['EntryBar']
+        sim['exit_bar'][sleeve, :len(frame)] = frame['ExitBar']
+    summary = _summarize(sim, n_bars, *_period_sampling(index))
+    results['sleeves'] = sleeves.drop(columns='name').assign(weight=weights,
+                                                             **{col: summary[col] for col in STATS_COLUMNS})
+    return results
+
+def print_portfolio_report(results):
+    """打印組合、各策略和各子賬戶的關鍵統計量。"""
+    rows = {'Portfolio': results['portfolio']}
+    rows.update(results['strategies'])
+    table = pd.DataFrame({label: stats[STATS_COLUMNS] for label, stats in rows.items()}).T
+    print("組合與各策略:")
+    print(table.to_string(float_format=lambda x: f'{x:.2f}'))
+    print("\n各子賬戶 (策略 x 交易對):")
+    print(results['sleeves'].drop(columns='params').to_string(index=False, float_format=lambda x: f'{x:.2f}'))
+
+if __name__ == '__main__':
+    # 1) 單個子賬戶、權重為 1 時與 run_fast_backtest 的結果對照；
+    # 2) 比較組合回測與對每個 (策略, 交易對) 分別 run_backtest 的耗時
+    import time
+    import warnings
+    from backtester import run_backtest
+    from fast_backtest import run_fast_backtest
+    from synthetic_data import generate_ohlcv
+
+    warnings.filterwarnings('ignore')
+    test_df = generate_ohlcv(20000, 'h', start='2019-01-01', seed=5, volatility=0.01)
+    for name, params in [('MA_Cross', {'n1': 10, 'n2': 40}), ('RSI', {'rsi_period': 14})]:
+        portfolio = run_portfolio_backtest({'BTC/USDT': test_df}, [(name, params)], allocator='equal',
+                                           fractional=False)['portfolio']
+        expected = run_fast_backtest(test_df, get_strategy(name), **params)
+        same = all(np.isclose(portfolio[col], expected[col], rtol=1e-9, equal_nan=True) for col in STATS_COLUMNS)
+        print(f"{name} 單個子賬戶與 run_fast_backtest: {'一致' if same else '不一致'}")
+
+    n_bars = 100000
+    datasets = {symbol: generate_ohlcv(n_bars, 'h', start='2019-01-01', seed=seed, volatility=vol)
+                for seed, (symbol, vol) in enumerate([('BTC/USDT', 0.006), ('ETH/USDT', 0.008), ('SOL/USDT', 0.012)])}
+    strategies = [('MA_Cross', {'n1': 10, 'n2': 40}), ('MA_Cross', {'n1': 20, 'n2': 100}),
+                  ('RSI', {'rsi_period': 14}), ('RSI', {'rsi_period': 7})]
+    for allocator in ALLOCATORS:
+        start = time.perf_counter()
+        results = run_portfolio_backtest(datasets, strategies, allocator=allocator,
+                                         fractions={label: 0.2 for label in _sleeve_table(strategies, [''])['strategy']})
+        print(f"\n{allocator}: {len(strategies)} 個策略 x {len(datasets)} 個交易對 x {n_bars} 根 K 線，"
+              f"耗時 {time.perf_counter() - start:.2f} 秒")
+        print_portfolio_report(results)
+
+    start = time.perf_counter()
+    for symbol, data_df in datasets.items():
+        for name, params in strategies:
+            run_backtest(data_df, get_strategy(name), plot_results=False, **params)
+    print(f"\n分別 run_backtest {len(strategies) * len(datasets)} 次耗時 {time.perf_counter() - start:.2f} 秒")
@@ -0,0 +1,337 @@
+# result_store.py
+import hashlib
+import importlib
+import json
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+from data_handler import OHLCV_COLUMNS
+
+# 每次運行的元數據列；其餘列為 stats 中的公開統計量
+RUN_KEY_COLUMNS = ['run_id', 'strategy', 'strategy_path', 'params', 'symbol', 'timeframe', 'data_fingerprint',
+                   'bars', 'cash', 'commission', 'created_at']
+
+def data_fingerprint(data_df: pd.DataFrame) -> str:
+    """返回 OHLCV 數據 (時間索引與價格/成交量) 的內容指紋，用於判斷兩次回測是否使用了相同的數據。"""
+    digest = hashlib.blake2b(digest_size=16)
+    index = data_df.index
+    if isinstance(index, pd.DatetimeIndex):
+        digest.update(np.ascontiguousarray(index.values.astype('datetime64[ms]').astype('int64')).view(np.uint8))
+    else:
+        digest.update(np.ascontiguousarray(np.asarray(index, dtype='int64')).view(np.uint8))
+    columns = [col for col in OHLCV_COLUMNS if col in data_df.columns]
+    digest.update(np.ascontiguousarray(data_df[columns].to_numpy(dtype=float)).view(np.uint8))
+    return digest.hexdigest()
+
+def _jsonable(value):
+    return value.item() if isinstance(value, np.generic) else str(value)
+
+def make_run_id(strategy_path, params, symbol, timeframe, fingerprint, cash, commission):
+    """由 (策略, 參數, 交易對, 週期, 數據指紋, 資金, 手續費) 生成穩定的運行ID；相同的組合會覆蓋舊結果。"""
+    key = json.dumps([strategy_path, params, symbol, timeframe, fingerprint, cash, commission],
+                     sort_keys=True, default=_jsonable)
+    return hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+
+def build_record(stats, strategy_class, params, data_df, symbol=None, timeframe=None, cash=100000, commission=0.001):
+    """
+    把 run_backtest 的返回值整理成可寫入 ResultStore 的緊湊記錄 (可在進程間傳遞，不含策略實例)。
+
+    參數:
+    - stats (pd.Series): run_backtest 的返回值。
+    - strategy_class (Strategy): 回測使用的策略類。
+    - params (dict): 傳給策略的參數。
+    - data_df (pd.DataFrame): 回測使用的數據，只用於計算指紋。
+    - symbol, timeframe (str, optional): 交易對與週期，用作查詢條件。
+    - cash, commission: 回測使用的初始資金與手續費率。
+
+    返回:
+    - dict: 'run' (一行元數據與統計量)、'equity' (時間戳毫秒與權益數組)、'trades' (交易列表 DataFrame)。
+    """
+    params = {key: value for key, value in params.items() if key != 'profile'}
+    params_json = json.dumps(params, sort_keys=True, default=_jsonable)
+    strategy_path = f'{strategy_class.__module__}:{strategy_class.__qualname__}'
+    fingerprint = data_fingerprint(data_df)
+    run = {
+        'run_id': make_run_id(strategy_path, json.loads(params_json), symbol, timeframe, fingerprint, cash, commission),
+        'strategy': strategy_class.__name__, 'strategy_path': strategy_path, 'params': params_json,
+        'symbol': symbol, 'timeframe': timeframe, 'data_fingerprint': fingerprint, 'bars': len(data_df),
+        'cash': float(cash), 'commission': float(commission), 'created_at': pd.Timestamp.now(tz='UTC'),
+    }
+    run.update(stats.filter(regex='^[^_]').to_dict())
+
+    equity_curve = stats['_equity_curve']
+    equity = {'timestamp': equity_curve.index.values.astype('datetime64[ms]').astype('int64'),
+              'equity': equity_curve['Equity'].to_numpy(dtype=float)}
+    trades = stats['_trades'].copy()
+    for col in trades.columns:
+        if trades[col].dtype == object:
+            trades[col] = trades[col].astype(str) if col == 'Tag' else pd.to_numeric(trades[col], errors='coerce')
+    return {'run': run, 'equity': equity, 'trades': trades}
+
+class ResultStore:
+    """
+    回測結果的可追加二進位存儲。目錄佈局:
+        <root>/runs/part-*.parquet     每次運行一行：元數據 + 所有公開統計量
+        <root>/equity/part-*.parquet   run_id、timestamp (毫秒)、equity
+        <root>/trades/part-*.parquet   run_id + 交易列表
+    每次 flush 寫出同名的三個分片 (runs 最後寫入，作為提交標記)，多個進程可以同時追加。
+    同一 run_id (相同策略、參數、交易對、週期、數據、資金與手續費) 再次寫入時，讀取時以最新的一次為準。
+    查詢只讀 runs 分片，已讀過的分片緩存在內存中；權益曲線和交易列表按需讀取。
+    """
+
+    def __init__(self, root='results/store', flush_runs=500):
+        self.root = root
+        self.flush_runs = flush_runs
+        self._pending = []
+        self._lock = threading.Lock()
+        self._runs_cache = {} # 分片檔名 -> DataFrame (分片寫入後不再改變)
+        for sub in ('runs', 'equity', 'trades'):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+    def add(self, stats, strategy_class, params, data_df, symbol=None, timeframe=None, cash=100000, commission=0.001):
+        """整理並追加一次 run_backtest 的結果 (見 build_record)，返回 run_id。"""
+        return self.append(build_record(stats, strategy_class, params, data_df, symbol, timeframe, cash, commission))
+
+    def append(self, record):
+        """追加一條 build_record 生成的記錄，累積到 flush_runs 條時自動寫出。返回 run_id。"""
+        with self._lock:
+            self._pending.append(record)
+            should_flush = len(self._pending) >= self.flush_runs
+        if should_flush:
+            self.flush()
+        return record['run']['run_id']
+
+    def _part_path(self, sub, name):
+        return os.path.join(self.root, sub, name)
+
+    def _write_part(self, sub, name, df):
+        path = self._part_path(sub, name)
+        tmp_path = f'{path}.tmp'
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def flush(self):
+        """把緩衝中的記錄寫成一組新分片。返回寫入的運行數。"""
+        with self._lock:
+            records, self._pending = self._pending, []
+        if not records:
+            return 0
+        name = f'part-{time.time_ns():020d}-{os.getpid()}.parquet'
+        equity = pd.DataFrame({
+            'run_id': np.repeat([r['run']['run_id'] for r in records], [len(r['equity']['equity']) for r in records]),
+            'timestamp': np.concatenate([r['equity']['timestamp'] for r in records]),
+            'equity': np.concatenate([r['equity']['equity'] for r in records]),
+        })
+        trades = pd.concat([r['trades'].assign(run_id=r['run']['run_id']) for r in records], ignore_index=True)
+        self._write_part('equity', name, equity)
+        self._write_part('trades', name, trades)
+        self._write_part('runs', name, pd.DataFrame([r['run'] for r in records]))
+        return len(records)
+
+    def _list_parts(self):
+        return sorted(f for f in os.listdir(os.path.join(self.root, 'runs')) if f.endswith('.parquet'))
+
+    def runs(self):
+        """返回所有運行 (每個 run_id 取最新一次)，包含 part 列 (所在分片) 與展開的 param_* 參數列。"""
+        frames = []
+        for name in self._list_parts():
+            df = self._runs_cache.get(name)
+            if df is None:
+                df = pd.read_parquet(self._part_path('runs', name)).assign(part=name)
+                self._runs_cache[name] = df
+            frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=RUN_KEY_COLUMNS + ['part'])
+        runs = pd.concat(frames, ignore_index=True).drop_duplicates('run_id', keep='last')
+        params = pd.DataFrame([json.loads(p) for p in runs['params']], index=runs.index).add_prefix('param_')
+        return pd.concat([runs, params], axis=1).reset_index(drop=True)
+
+    def query(self, symbol=None, timeframe=None, strategy=None, sort_by='Sharpe Ratio', top=None,
+              ascending=False, **params):
+        """
+        篩選並排序運行結果，例如 store.query('BTC/USDT', '1h', sort_by='Sharpe Ratio', top=20)。
+
+        參數:
+        - symbol, timeframe, strategy (str, optional): 篩選條件，strategy 為策略類名。
+        - sort_by (str, optional): 排序的統計列名，None 表示不排序。
+        - top (int, optional): 只返回前 top 行。
+        - ascending (bool): 是否升序排列。
+        - **params: 按策略參數篩選，例如 n1=10。
+
+        返回:
+        - pd.DataFrame: 符合條件的運行，NaN 排在最後。
+        """
+        runs = self.runs()
+        if runs.empty:
+            return runs
+        if sort_by is not None and sort_by not in runs.columns:
+            print(f"錯誤: 沒有統計列 {sort_by}")
+            return runs.iloc[0:0]
+        mask = pd.Series(True, index=runs.index)
+        for column, value in (('symbol', symbol), ('timeframe', timeframe), ('strategy', strategy)):
+            if value is not None:
+                mask &= runs[column] == value
+        for name, value in params.items():
+            column = f'param_{name}'
+            mask &= runs[column] == value if column in runs.columns else False
+        runs = runs[mask]
+        if sort_by is not None:
+            runs = runs.sort_values(sort_by, ascending=ascending, na_position='last')
+        if top is not None:
+            runs = runs.head(top)
+        return runs.reset_index(drop=True)
+
+    def _run_row(self, run_id):
+        runs = self.runs()
+        row = runs[runs['run_id'] == run_id]
+        if row.empty:
+            return None
+        return row.iloc[0]
+
+    def load_equity(self, run_id):
+        """
+        讀取一次運行的權益曲線。
+
+        返回:
+        - pd.DataFrame: 以時間為索引，包含 Equity 與 DrawdownPct 列；找不到時返回 None。
+        """
+        row = self._run_row(run_id)
+        if row is None:
+            print(f"錯誤: 找不到運行 {run_id}")
+            return None
+        df = pd.read_parquet(self._part_path('equity', row['part']), filters=[('run_id', '==', run_id)])
+        equity = pd.DataFrame({'Equity': df['equity'].to_numpy()},
+                              index=pd.DatetimeIndex(pd.to_datetime(df['timestamp'].to_numpy(), unit='ms')))
+        equity['DrawdownPct'] = 1 - equity['Equity'] / equity['Equity'].cummax()
+        return equity
+
+    def load_trades(self, run_id):
+        """讀取一次運行的交易列表 (與 stats['_trades'] 的列相同)；找不到時返回 None。"""
+        row = self._run_row(run_id)
+        if row is None:
+            print(f"錯誤: 找不到運行 {run_id}")
+            return None
+        trades = pd.read_parquet(self._part_path('trades', row['part']), filters=[('run_id', '==', run_id)])
+        # 同一分片中其他策略的指標列對本次運行全為空
+        indicator_columns = [col for col in trades.columns if col.startswith(('Entry_', 'Exit_'))]
+        empty = [col for col in indicator_columns if trades[col].isna().all()]
+        return trades.drop(columns=empty + ['run_id']).reset_index(drop=True)
+
+    def plot(self, run_id, data_df, filename=None, open_browser=False):
+        """
+        按需為選中的一次運行繪製 Bokeh 圖表：用存儲的策略和參數在 data_df 上重新回測並繪圖。
+
+        參數:
+        - run_id (str): 要繪製的運行。
+        - data_df (pd.DataFrame): 回測時使用的數據 (指紋不一致時會打印警告)。
+        - filename (str, optional): 輸出 HTML 路徑。預設為 <root>/plots/<run_id>.html。
+        - open_browser (bool): 是否在瀏覽器中打開。
+
+        返回:
+        - str: HTML 檔案路徑；出錯時返回 None。
+        """
+        from backtesting import Backtest
+
+        row = self._run_row(run_id)
+        if row is None:
+            print(f"錯誤: 找不到運行 {run_id}")
+            return None
+        if data_fingerprint(data_df) != row['data_fingerprint']:
+            print(f"警告: 傳入的數據與運行 {run_id} 使用的數據不同，圖表可能與存儲的統計量不一致。")
+        module_name, qualname = row['strategy_path'].split(':')
+        try:
+            strategy_class = importlib.import_module(module_name)
+            for attr in qualname.split('.'):
+                strategy_class = getattr(strategy_class, attr)
+        except (ImportError, AttributeError) as e:
+            print(f"錯誤: 無法導入策略 {row['strategy_path']}: {e}")
+            return None
+        filename = filename or os.path.join(self.root, 'plots', f'{run_id}.html')
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        try:
+            bt = Backtest(data_df, strategy_class, cash=row['cash'], commission=row['commission'], exclusive_orders=True)
+            bt.run(**json.loads(row['params']))
+            bt.plot(filename=filename, open_browser=open_browser)
+        except Exception as e:
+            print(f"繪製圖表時發生錯誤: {e}")
+            return None
+        return filename
+
+    def compact(self):
+        """把所有分片合併成一組，並丟棄被覆蓋的舊結果。返回保留的運行數。"""
+        self.flush()
+        parts = self._list_parts()
+        if len(parts) <= 1:
+            return len(self.runs())
+        runs = self.runs()
+        keep = set(zip(runs['run_id'], runs['part']))
+        name = f'part-{time.time_ns():020d}-{os.getpid()}.parquet'
+        for sub in ('equity', 'trades'):
+            frames = []
+            for part in parts:
+                df = pd.read_parquet(self._part_path(sub, part))
+                frames.append(df[[(run_id, part) in keep for run_id in df['run_id']]])
+            self._write_part(sub, name, pd.concat(frames, ignore_index=True))
+        self._write_part('runs', name, runs.drop(columns=['part'] + [c for c in runs.columns if c.startswith('param_')]))
+        for part in parts:
+            for sub in ('runs', 'equity', 'trades'):
+                try:
+                    os.remove(self._part_path(sub, part))
+                except FileNotFoundError:
+                    pass
+        self._runs_cache.clear()
+        return len(runs)
+
+if __name__ == '__main__':
+    # 批量回測寫入存儲，查詢前幾名，並只為選中的一次運行繪圖
+    import shutil
+    import tempfile
+    import warnings
+    from backtester import run_backtest
+    from strategies.simple_ma_strategy import MaCrossStrategy
+    from strategies.simple_rsi_strategy import RsiStrategy
+    from synthetic_data import generate_ohlcv
+
+    warnings.filterwarnings('ignore')
+    datasets = {symbol: generate_ohlcv(5000, 'h', start='2023-01-01', seed=seed, start_price=1000.0, volatility=0.01)
+                for seed, symbol in enumerate(['BTC/USDT', 'ETH/USDT'], start=3)}
+
+    root = tempfile.mkdtemp(prefix='result_store_')
+    try:
+        start = time.perf_counter()
+        with ResultStore(root) as store:
+            for symbol, df in datasets.items():
+                for n1, n2 in [(5, 20), (10, 30), (10, 50), (20, 60)]:
+                    run_backtest(df, MaCrossStrategy, result_store=store, symbol=symbol, timeframe='1h', n1=n1, n2=n2)
+                for period in (7, 14, 21):
+                    run_backtest(df, RsiStrategy, result_store=store, symbol=symbol, timeframe='1h', rsi_period=period)
+        print(f"14 次回測並寫入存儲，耗時 {time.perf_counter() - start:.2f} 秒")
+
+        # 重複寫入同一組合會覆蓋舊結果
+        with ResultStore(root) as store:
+            run_backtest(datasets['BTC/USDT'], MaCrossStrategy, result_store=store, symbol='BTC/USDT', timeframe='1h',
+                         n1=5, n2=20)
+        store = ResultStore(root)
+        print(f"運行數 (去重後): {len(store.runs())}")
+        top = store.query('BTC/USDT', '1h', sort_by='Sharpe Ratio', top=3)
+        print(top[['run_id', 'strategy', 'params', 'Sharpe Ratio', 'Return [%]']])
+
+        best = top.iloc[0]
+        equity = store.load_equity(best['run_id'])
+        trades = store.load_trades(best['run_id'])
+        print(f"最優運行權益曲線 {len(equity)} 點，最終權益 {equity['Equity'].iloc[-1]:.2f} "
+              f"(統計量 {best['Equity Final [$]']:.2f})，交易 {len(trades)} 筆")
+        print(f"壓縮後保留 {store.compact()} 次運行，查詢結果不變 = "
+              f"{store.query('BTC/USDT', '1h', top=3)['run_id'].tolist() == top['run_id'].tolist()}")
+        print(f"圖表: {store.plot(best['run_id'], datasets['BTC/USDT'])}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
@@ -0,0 +1,197 @@
+# robustness.py
+# 回測結果的蒙地卡羅穩健性分析。run_backtest 的統計量只是一條歷史路徑上的點估計，
+# 這裡對同一次運行的收益重新抽樣成數千條路徑，給出收益、夏普比率和最大回撤的置信區間以及破產概率：
+# - bootstrap: 有放回地獨立抽取日收益；
+# - block: 循環移動區塊自助法，整段抽取連續的日收益，保留波動聚集等短期相關性；
+# - shuffle: 打亂已平倉交易的順序 (總收益不變，只改變回撤路徑)。
+# 所有路徑按批以二維數組一次計算，不逐條路徑循環。
+import numpy as np
+import pandas as pd
+
+from config import MONTE_CARLO_CONFIG
+
+METHODS = ('bootstrap', 'block', 'shuffle')
+METRICS = ['Return [%]', 'Sharpe Ratio', 'Max. Drawdown [%]']
+RUIN_METRIC = 'Probability of Ruin [%]'
+# 每批抽樣矩陣的元素數上限 (float64 約 32 MB)，決定峰值內存
+BATCH_ELEMENTS = 4000000
+
+def period_returns(equity: pd.Series):
+    """
+    把權益曲線轉為與 backtesting.py 計算夏普比率時相同的週期收益。
+
+    返回:
+    - tuple: (收益數組, 每年週期數)。日內與日線數據按日取最後值 (有週末數據時一年 365 日，否則 252 日)，
+             週線/月線數據按週/月。
+    """
+    index = equity.index
+    freq_days = pd.Series(index[-100:]).diff().dropna().median().days
+    have_weekends = index.dayofweek.to_series().between(5, 6).mean() > 2 / 7 * .6
+    annual_periods = (52 if freq_days == 7 else 12 if freq_days == 31 else 1 if freq_days == 365 else
+                      (365 if have_weekends else 252))
+    freq = {7: 'W', 31: 'ME', 365: 'YE'}.get(freq_days, 'D')
+    returns = equity.resample(freq).last().dropna().pct_change().dropna()
+    return returns.to_numpy(dtype=float), annual_periods
+
+def trade_returns(trades: pd.DataFrame, initial_equity):
+    """
+    每筆已平倉交易相對於進場前權益的收益率，按平倉順序複利後等於已平倉交易的總收益。
+    (假設交易依次進行；內建策略每次只持有一個倉位。)
+    """
+    pnl = trades.sort_values('ExitBar')['PnL'].to_numpy(dtype=float)
+    equity_before = initial_equity + np.r_[0.0, np.cumsum(pnl)[:-1]]
+    return pnl / equity_before
+
+def _path_metrics(returns, annual_periods, ruin_fraction):
+    """
+    對每行一條的收益路徑 (形狀 [路徑數, 週期數]) 計算收益、夏普比率、最大回撤和是否破產。
+    夏普比率的公式與 backtesting.py 相同 (幾何平均的年化收益除以年化波動率)；annual_periods 為 None 時不計算。
+    """
+    growth = np.cumprod(1 + returns, axis=1)
+    peak = np.maximum(np.maximum.accumulate(growth, axis=1), 1.0) # 初始資金也是一個高點
+    max_drawdown = -(1 - growth / peak).max(axis=1) * 100
+    total_return = (growth[:, -1] - 1) * 100
+    ruined = growth.min(axis=1) <= ruin_fraction
+    if annual_periods is None:
+        return total_return, np.full(len(returns), np.nan), max_drawdown, ruined
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        wiped_out = (returns <= -1).any(axis=1)
+        gmean = np.where(wiped_out, 0.0, np.expm1(np.log1p(np.maximum(returns, -1 + 1e-12)).mean(axis=1)))
+        annual_return = (1 + gmean) ** annual_periods - 1
+        variance = returns.var(axis=1, ddof=1)
+        volatility = np.sqrt((variance + (1 + gmean) ** 2) ** annual_periods - (1 + gmean) ** (2 * annual_periods))
+        sharpe = np.where(volatility > 0, annual_return / volatility, np.nan)
+    return total_return, sharpe, max_drawdown, ruined
+
+def _resample_indices(rng, n_paths, length, method, block_size):
+    """生成 [n_paths, length] 的抽樣位置矩陣。"""
+    if method == 'bootstrap':
+        return rng.integers(0, length, size=(n_paths, length))
+    if method == 'block':
+        n_blocks = -(-length // block_size)
+        starts = rng.integers(0, length, size=(n_paths, n_blocks, 1))
+        return ((starts + np.arange(block_size)) % length).reshape(n_paths, -1)[:, :length]
+    return np.argsort(rng.random((n_paths, length)), axis=1) # shuffle: 每行是一個隨機排列
+
+def _simulate(returns, method, n_sims, annual_periods, ruin_fraction, block_size, rng):
+    """按批生成 n_sims 條抽樣路徑，返回各指標的樣本數組。"""
+    batch_size = max(1, BATCH_ELEMENTS // max(len(returns), 1))
+    parts = []
+    for start in range(0, n_sims, batch_size):
+        n_paths = min(batch_size, n_sims - start)
+        indices = _resample_indices(rng, n_paths, len(returns), method, block_size)
+        parts.append(_path_metrics(returns[indices], annual_periods, ruin_fraction))
+    return [np.concatenate(values) for values in zip(*parts)]
+
+def monte_carlo(stats=None, equity=None, trades=None, n_sims=None, methods=None, confidence=None,
+                ruin_fraction=None, block_size=None, seed=None, return_samples=False):
+    """
+    對一次回測的收益重新抽樣，估計統計量的分佈。
+
+    參數:
+    - stats (pd.Series, optional): run_backtest / run_fast_backtest 的結果，使用其中的 _equity_curve 和 _trades。
+    - equity (pd.Series 或 pd.DataFrame, optional): 權益曲線 (DataFrame 時取 'Equity' 列)，
+                                                  例如 ResultStore.load_equity 的結果；提供時覆蓋 stats 中的曲線。
+    - trades (pd.DataFrame, optional): 交易列表，例如 ResultStore.load_trades 的結果。
+    - n_sims (int): 每種方法的抽樣路徑數。
+    - methods (list[str]): METHODS 的子集。
+    - confidence (float): 置信區間的置信水準，例如 0.95 給出 2.5% 與 97.5% 分位數。
+    - ruin_fraction (float): 權益在任一時刻跌到初始資金的這個比例 (含) 以下即視為破產。
+    - block_size (int, optional): block 方法的區塊長度 (週期數)；None 表示週期數的立方根。
+    - seed (int, optional): 隨機數種子。
+    - return_samples (bool): 是否同時返回每條路徑的指標樣本。
+    未給出的參數使用 config.MONTE_CARLO_CONFIG。
+
+    返回:
+    - pd.DataFrame: 每種方法、每個指標一行，列為 method、metric、actual (原路徑在同樣定義下的值)、
+                    mean、lower、median、upper；破產概率的 mean 為百分比，actual 為原路徑是否破產 (100 或 0)。
+                    收益與回撤按週期 (通常為日) 收益計算，shuffle 按逐筆交易計算且沒有夏普比率。
+                    return_samples 為 True 時返回 (報告, {方法: {指標: 樣本數組}})。出錯時返回 None。
+    """
+    config = MONTE_CARLO_CONFIG
+    n_sims = n_sims or config['n_sims']
+    methods = list(methods or config['methods'])
+    confidence = confidence or config['confidence']
+    ruin_fraction = ruin_fraction if ruin_fraction is not None else config['ruin_fraction']
+    block_size = block_size or config['block_size']
+    unknown = [method for method in methods if method not in METHODS]
+    if unknown:
+        print(f"錯誤: 未知的抽樣方法 {unknown}，可選: {', '.join(METHODS)}")
+        return None
+
+    if equity is None and stats is not None:
+        equity = stats['_equity_curve']
+    if trades is None and stats is not None:
+        trades = stats['_trades']
+    if isinstance(equity, pd.DataFrame):
+        equity = equity['Equity']
+    if equity is None or len(equity) < 2:
+        print("錯誤: 需要至少兩個點的權益曲線 (stats 或 equity 參數)。")
+        return None
+
+    rng = np.random.default_rng(seed)
+    tail = (1 - confidence) / 2 * 100
+    rows, samples = [], {}
+    for method in methods:
+        if method == 'shuffle':
+            if trades is None or len(trades) < 2:
+                print("警告: 已平倉交易少於兩筆，跳過 shuffle。")
+                continue
+            returns, annual_periods = trade_returns(trades, float(equity.iloc[0])), None
+        else:
+            returns, annual_periods = period_returns(equity)
+            if len(returns) < 2:
+                print(f"警告: 權益曲線的週期收益少於兩個，跳過 {method}。")
+                continue
+        size = block_size or max(1, int(round(len(returns) ** (1 / 3))))
+        actual = [values[0] for values in _path_metrics(returns[None], annual_periods, ruin_fraction)]
+        simulated = _simulate(returns, method, n_sims, annual_periods, ruin_fraction, size, rng)
+        samples[method] = dict(zip(METRICS + [RUIN_METRIC], simulated))
+        for metric, value, values in zip(METRICS, actual, simulated):
+            if annual_periods is None and metric == 'Sharpe Ratio':
+                continue # 交易順序打亂不改變收益分佈，也沒有按時間的週期收益
+            finite = values[np.isfinite(values)]
+            if finite.size:
+                lower, median, upper = np.percentile(finite, [tail, 50, 100 - tail])
+                mean = finite.mean()
+            else:
+                lower = median = upper = mean = np.nan
+            rows.append({'method': method, 'metric': metric, 'actual': value, 'mean': mean,
+                         'lower': lower, 'median': median, 'upper': upper})
+        rows.append({'method': method, 'metric': RUIN_METRIC, 'actual': float(actual[3]) * 100,
+                     'mean': simulated[3].mean() * 100, 'lower': np.nan, 'median': np.nan, 'upper': np.nan})
+    report = pd.DataFrame(rows, columns=['method', 'metric', 'actual', 'mean', 'lower', 'median', 'upper'])
+    return (report, samples) if return_samples else report
+
+def print_monte_carlo_report(report, confidence=None):
+    """以易讀的格式打印 monte_carlo 的報告。"""
+    confidence = confidence or MONTE_CARLO_CONFIG['confidence']
+    print(f"蒙地卡羅穩健性分析 ({confidence:.0%} 置信區間):")
+    for method, rows in report.groupby('method', sort=False):
+        print(f"  {method}:")
+        for row in rows.itertuples(index=False):
+            if row.metric == RUIN_METRIC:
+                print(f"    {row.metric:<24} {row.mean:10.2f}")
+            else:
+                print(f"    {row.metric:<24} 實際 {row.actual:10.2f}   區間 [{row.lower:10.2f}, {row.upper:10.2f}]"
+                      f"   中位數 {row.median:10.2f}")
+
+if __name__ == '__main__':
+    # 對隨機遊走上的 MA 交叉回測做 10,000 次抽樣，並確認原路徑的夏普比率與 run_backtest 的統計量相同
+    import time
+    from fast_backtest import run_fast_backtest
+    from strategies.simple_ma_strategy import MaCrossStrategy
+    from synthetic_data import generate_ohlcv
+
+    for freq, n_bars in [('D', 4 * 365), ('h', 3 * 365 * 24)]:
+        data_df = generate_ohlcv(n_bars, freq, start='2020-01-01', seed=11, drift=0.0002,
+                                 volatility=0.01 if freq == 'D' else 0.002)
+        stats = run_fast_backtest(data_df, MaCrossStrategy, n1=10, n2=40)
+        start = time.perf_counter()
+        report = monte_carlo(stats, n_sims=10000, seed=1)
+        seconds = time.perf_counter() - start
+        actual_sharpe = report.query("method == 'bootstrap' and metric == 'Sharpe Ratio'")['actual'].iloc[0]
+        print(f"\n{freq} {n_bars} 根 K 線，{stats['# Trades']} 筆交易，3 x 10,000 條路徑耗時 {seconds:.2f} 秒；"
+              f"原路徑夏普 {actual_sharpe:.6f}，run_backtest {stats['Sharpe Ratio']:.6f}")
+        print_monte_carlo_report(report)
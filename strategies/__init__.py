@@ -1,7 +1,41 @@
 # strategies/__init__.py
-# 這個檔案的存在是為了讓 Python 將 'strategies' 資料夾視為一個套件 (package)。
-# 它可以是空的。
+# 策略註冊表：名稱 (與 config.STRATEGY_PARAMS 的鍵相同) -> 'module:ClassName'。
+# 策略模組依賴 backtesting (及 Bokeh)，只在 get_strategy() 真正需要某個策略時才導入，
+# 因此列出策略或讀取結果等輕量操作不會付出這部分啟動時間。
+import importlib
 
-# 您也可以在這裡選擇性地導入策略類，以便更容易地從外部訪問它們，例如：
-# from.simple_ma_strategy import MaCrossStrategy
-# from.simple_rsi_strategy import RsiStrategy
\ No newline at end of file
+STRATEGY_REGISTRY = {
+    'MA_Cross': 'strategies.simple_ma_strategy:MaCrossStrategy',
+    'RSI': 'strategies.simple_rsi_strategy:RsiStrategy',
+}
+
+def register_strategy(name, strategy):
+    """
+    註冊一個策略。
+
+    參數:
+    - name (str): 策略名稱，例如 'MA_Cross'。
+    - strategy (str | type): 'module:ClassName' 形式的路徑 (延遲導入)，或已導入的策略類。
+    """
+    STRATEGY_REGISTRY[name] = strategy
+
+def list_strategies():
+    """返回所有已註冊的策略名稱 (不導入任何策略模組)。"""
+    return list(STRATEGY_REGISTRY)
+
+def get_strategy(name):
+    """
+    按名稱返回策略類，首次使用時才導入其模組。
+
+    參數:
+    - name (str): 已註冊的策略名稱。
+
+    返回:
+    - type: 策略類。名稱未註冊時拋出 KeyError。
+    """
+    strategy = STRATEGY_REGISTRY[name]
+    if isinstance(strategy, str):
+        module_name, class_name = strategy.split(':')
+        strategy = getattr(importlib.import_module(module_name), class_name)
+        STRATEGY_REGISTRY[name] = strategy
+    return strategy
@@ -1,12 +1,147 @@
 # strategies/base_strategy.py
+import functools
+import time
+import numpy as np
 from backtesting import Strategy
+from backtesting.lib import crossover
+
+import indicator_cache
+
+# next() 延遲直方圖的分箱邊界 (微秒)，1-2-5 序列
+LATENCY_BIN_EDGES_US = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 100000, float('inf')]
+
+class StrategyProfiler:
+    """
+    策略運行時的計時器。由 BaseStrategy 在 profile=True 時建立，
+    以實例屬性包裝 init/next、broker.next、下單方法和 crossover，不修改任何類。
+    """
+
+    def __init__(self, strategy):
+        self.phase_ns = {'init': 0, 'next': 0, 'broker': 0}
+        self.next_latencies_ns = []
+        self.indicator_ns = {}
+        self.calls = {}
+        self._wrapped = []
+        self._wrap(strategy, 'init', self._timed_phase('init', strategy.init))
+        self._wrap(strategy, 'next', self._timed_next(strategy.next))
+        self._wrap(strategy._broker, 'next', self._timed_phase('broker', strategy._broker.next))
+        for name in ('buy', 'sell', 'crossover'):
+            self._wrap(strategy, name, self._timed_call(name, getattr(strategy, name)))
+        self._wrap(strategy.position, 'close', self._timed_call('close', strategy.position.close))
+
+    def _wrap(self, obj, name, wrapper):
+        setattr(obj, name, wrapper)
+        self._wrapped.append((obj, name))
+
+    def _timed_phase(self, phase, func):
+        perf_counter_ns = time.perf_counter_ns
+        def timed(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.phase_ns[phase] += perf_counter_ns() - start
+        return timed
+
+    def _timed_next(self, func):
+        perf_counter_ns = time.perf_counter_ns
+        latencies = self.next_latencies_ns
+        def timed():
+            start = perf_counter_ns()
+            func()
+            latencies.append(perf_counter_ns() - start)
+        return timed
+
+    def _timed_call(self, name, func):
+        perf_counter_ns = time.perf_counter_ns
+        counter = self.calls.setdefault(name, [0, 0])
+        def timed(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                counter[0] += 1
+                counter[1] += perf_counter_ns() - start
+        return timed
+
+    def timed_indicator(self, func, args):
+        """包裝指標函數以記錄計算耗時，名稱形如 SMA(10)。"""
+        params = ','.join(str(arg) for arg in args if np.ndim(arg) == 0)
+        label = f'{func.__name__}({params})'
+        @functools.wraps(func)
+        def timed(*call_args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return func(*call_args, **kwargs)
+            finally:
+                self.indicator_ns[label] = self.indicator_ns.get(label, 0) + time.perf_counter_ns() - start
+        return timed
+
+    def detach(self):
+        """移除所有包裝，使策略實例恢復原狀 (例如可以再被 pickle)。"""
+        for obj, name in self._wrapped:
+            obj.__dict__.pop(name, None)
+        self._wrapped = []
+
+    def report(self):
+        """
+        返回結構化的計時報告 (只含基本類型，可 JSON 序列化)。
+
+        返回:
+        - dict: phases_seconds (init/next/broker 總耗時)、next_latency_us (次數與 mean/p50/p90/p99/max)、
+                next_latency_histogram (分箱邊界與計數)、indicators_seconds、
+                calls (crossover 與下單方法的次數和耗時)、orders (buy/sell/close 的調用次數)。
+        """
+        latencies_us = np.asarray(self.next_latencies_ns, dtype=float) / 1e3
+        if len(latencies_us):
+            p50, p90, p99 = np.percentile(latencies_us, [50, 90, 99])
+            latency = {'count': len(latencies_us), 'mean': float(latencies_us.mean()), 'p50': float(p50),
+                       'p90': float(p90), 'p99': float(p99), 'max': float(latencies_us.max())}
+        else:
+            latency = {'count': 0}
+        counts, _ = np.histogram(latencies_us, bins=LATENCY_BIN_EDGES_US)
+        self.phase_ns['next'] = sum(self.next_latencies_ns)
+        return {
+            'phases_seconds': {phase: ns / 1e9 for phase, ns in self.phase_ns.items()},
+            'next_latency_us': latency,
+            'next_latency_histogram': {'bin_edges_us': LATENCY_BIN_EDGES_US, 'counts': counts.tolist()},
+            'indicators_seconds': {label: ns / 1e9 for label, ns in self.indicator_ns.items()},
+            'calls': {name: {'count': count, 'seconds': ns / 1e9} for name, (count, ns) in self.calls.items()},
+            'orders': {name: self.calls[name][0] for name in ('buy', 'sell', 'close')},
+        }
+
+def crossover_signals(series1, series2):
+    """
+    backtesting.lib.crossover 的整序列版本：返回布林數組，第 i 個元素表示 series1 在第 i 根 K 線上穿 series2
+    (series2 可以是常數)，與在第 i 根 K 線的 next() 中調用 crossover(series1, series2) 的結果相同。
+    """
+    series1, series2 = np.broadcast_arrays(np.asarray(series1, dtype=float), np.asarray(series2, dtype=float))
+    out = np.zeros(series1.shape, dtype=bool)
+    with np.errstate(invalid='ignore'):
+        out[1:] = (series1[:-1] < series2[:-1]) & (series1[1:] > series2[1:])
+    return out
 
 class BaseStrategy(Strategy):
     """
     一個可選的策略基類，用於定義所有策略共有的通用接口或輔助方法。
-    目前，它直接繼承自 backtesting.Strategy，沒有添加額外功能。
+    通過 self.I() 計算的指標會經過 indicator_cache 緩存，相同數據與參數的重複回測直接復用結果；
+    子類可設 use_indicator_cache = False 關閉。
+    設 profile = True (例如 run_backtest(..., profile=True)) 時記錄各階段耗時、next() 延遲分佈、指標計算時間和下單次數，
+    報告附加在統計結果的 '_profile' 項；關閉時不安裝任何包裝，沒有額外開銷。
+    信號只依賴指標的策略可以在 init() 中用 set_signals() 聲明向量化的進出場信號，由基類的 next() 查表下單。
     您可以根據需要擴展它。
     """
+    use_indicator_cache = True
+    profile = False
+    # 子類在 next() 中調用 self.crossover()，開啟 profile 時可統計其次數與耗時
+    crossover = staticmethod(crossover)
+
+    def __init__(self, broker, data, params):
+        super().__init__(broker, data, params)
+        self._profiler = StrategyProfiler(self) if self.profile else None
+        self._entries = None
+        self._exits = None
+
     def init(self):
         super().init()
         # 可以在這裡添加所有策略都需要的通用初始化代碼
@@ -14,10 +149,69 @@ class BaseStrategy(Strategy):
 
     def next(self):
         super().next()
-        # 可以在這裡添加所有策略在每個時間步都可能執行的通用邏輯
-        # 但通常具體的交易邏輯會在子類中實現
+        # 在 init() 中用 set_signals() 聲明了信號的策略，每根 K 線只需查表並下單
+        if self._entries is not None:
+            i = len(self.data) - 1
+            if self._entries[i]:
+                if not self.position:
+                    self.buy()
+            elif self._exits[i]:
+                if self.position.is_long:
+                    self.position.close()
+
+    def set_signals(self, entries, exits):
+        """
+        在 init() 中聲明整條序列的進出場信號。信號在 init() 之後就完全確定，
+        因此 next() 不再逐根調用 crossover()，只查表：第 i 根 K 線的進場信號在空倉時買入，
+        否則出場信號在持多倉時平倉 (與逐根判斷 if crossover(...) / elif crossover(...) 的行為相同)。
+
+        參數:
+        - entries, exits (array-like): 長度與數據相同的布林數組，例如 crossover_signals(self.sma1, self.sma2)。
+        """
+        entries = np.asarray(entries, dtype=bool)
+        exits = np.asarray(exits, dtype=bool)
+        if entries.shape != (len(self.data),) or exits.shape != (len(self.data),):
+            raise ValueError(f"信號長度必須與數據相同 ({len(self.data)})")
+        # 轉為 list：逐根讀取 Python 列表比索引 numpy 數組快
+        self._entries = entries.tolist()
+        self._exits = exits.tolist()
+
+    @classmethod
+    def streaming_signals(cls, params):
+        """
+        返回逐根 K 線增量計算 set_signals() 信號的對象，供 paper_trader 使用：
+        對象的 update(close) 以新收盤價 O(1) 更新指標並返回 (進場信號, 出場信號)，
+        不必每根 K 線重新建立策略並在整個歷史窗口上運行 init()。不支持增量計算的策略返回 None。
+
+        參數:
+        - params (dict): 策略參數 (覆蓋類屬性)。
+        """
+        return None
+
+    @classmethod
+    def _redefines_logic(cls, owner):
+        """cls 是否在 owner 之後又改寫了 init() 或 next()；此時 owner 的 streaming_signals() 不再適用。"""
+        return cls.init is not owner.init or cls.next is not owner.next
+
+    def I(self, func, *args, **kwargs):
+        """與 Strategy.I 相同，但指標值經過 indicator_cache.default_cache 記憶化。"""
+        cache = indicator_cache.default_cache
+        if self.use_indicator_cache and cache is not None:
+            func = cache.wrap(func)
+        if self._profiler is not None:
+            func = self._profiler.timed_indicator(func, args)
+        return super().I(func, *args, **kwargs)
+
+    def profile_report(self):
+        """返回計時報告並移除計時包裝；未開啟 profile 時返回 None。"""
+        if self._profiler is None:
+            return None
+        report = self._profiler.report()
+        self._profiler.detach()
+        self._profiler = None
+        return report
 
     def log(self, message):
         """一個簡單的日誌記錄輔助函數範例"""
         # 實際應用中，您可能會使用更完善的日誌庫 (如 logging)
-        print(f"{self.data.index[-1]}: {message}")
\ No newline at end of file
+        print(f"{self.data.index[-1]}: {message}")
@@ -1,14 +1,26 @@
 # strategies/simple_ma_strategy.py
-from backtesting import Strategy
-from backtesting.lib import crossover
 from backtesting.test import SMA # backtesting.py 提供的 SMA 指標範例
 # 或者，如果您想使用 TA-Lib 或 pandas-ta:
 # import talib
 # import pandas_ta as ta
 # from config import STRATEGY_PARAMS # 如果參數在config中定義
 
+from indicators import SMA as StreamingSMA, Crossover
+
 # 從基類繼承 (可選)
-from.base_strategy import BaseStrategy
+from.base_strategy import BaseStrategy, crossover_signals
+
+class _MaCrossStream:
+    """MaCrossStrategy 信號的增量版本：兩條 SMA 和一個交叉檢測，每根 K 線 O(1) 更新。"""
+
+    def __init__(self, n1, n2):
+        self.sma1 = StreamingSMA(n1)
+        self.sma2 = StreamingSMA(n2)
+        self.cross = Crossover()
+
+    def update(self, close):
+        signal = self.cross.update((self.sma1.update(close), self.sma2.update(close)))
+        return signal == 1, signal == -1
 
 class MaCrossStrategy(BaseStrategy): # 或直接 class MaCrossStrategy(Strategy):
     # 從 config.py 或直接定義策略參數
@@ -45,23 +57,15 @@ class MaCrossStrategy(BaseStrategy): # 或直接 class MaCrossStrategy(Strategy)
         # self.sma1 = self.I(sma_indicator, close, self.n1)
         # self.sma2 = self.I(sma_indicator, close, self.n2)
 
+        # 交叉信號在 init() 之後就完全確定，一次算出整條序列，
+        # 基類的 next() 每根 K 線只查表下單 (不再逐根調用 crossover)：
+        # 短期MA上穿長期MA -> 沒有持倉時買入；短期MA下穿長期MA -> 持有多頭倉位時平倉
+        # 如果需要反轉或做空等更複雜的邏輯，可以像以前一樣覆蓋 next() 並調用 self.crossover()
+        self.set_signals(entries=crossover_signals(self.sma1, self.sma2),
+                         exits=crossover_signals(self.sma2, self.sma1))
 
-    def next(self):
-        super().next() # 如果繼承自 BaseStrategy
-        # 如果短期MA上穿長期MA
-        if crossover(self.sma1, self.sma2):
-            if not self.position:  # 如果沒有持倉，則買入
-                self.buy()
-            # 如果已有空頭倉位，則平倉後買入 (可選，取決於策略是否允許反轉)
-            # elif self.position.is_short:
-            #     self.position.close()
-            #     self.buy()
-
-        # 如果短期MA下穿長期MA
-        elif crossover(self.sma2, self.sma1):
-            if self.position.is_long:  # 如果持有多頭倉位，則賣出
-                self.position.close() # 先平多倉
-                # self.sell() # 然後開空倉 (如果策略允許做空)
-            # 如果沒有持倉且允許做空，則直接開空倉 (可選)
-            # elif not self.position and self.allow_shorting: # 假設有個 allow_shorting 參數
-            #     self.sell()
\ No newline at end of file
+    @classmethod
+    def streaming_signals(cls, params):
+        if cls._redefines_logic(MaCrossStrategy):
+            return None
+        return _MaCrossStream(params.get('n1', cls.n1), params.get('n2', cls.n2))
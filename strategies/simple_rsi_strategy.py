@@ -1,11 +1,26 @@
 # strategies/simple_rsi_strategy.py
-from backtesting import Strategy
-from backtesting.lib import crossover
 # from config import STRATEGY_PARAMS # 如果參數在config中定義
 from utils import rsi_indicator # 從 utils.py 導入RSI計算函數
 
+from indicators import RSI, Crossover
+
 # 從基類繼承 (可選)
-from.base_strategy import BaseStrategy
+from.base_strategy import BaseStrategy, crossover_signals
+
+class _RsiStream:
+    """RsiStrategy 信號的增量版本：RSI 與兩條閾值線的交叉，每根 K 線 O(1) 更新。"""
+
+    def __init__(self, rsi_period, oversold_threshold, overbought_threshold):
+        self.rsi = RSI(rsi_period)
+        self.oversold_threshold = oversold_threshold
+        self.overbought_threshold = overbought_threshold
+        self.entry_cross = Crossover()
+        self.exit_cross = Crossover()
+
+    def update(self, close):
+        rsi = self.rsi.update(close)
+        return (self.entry_cross.update((rsi, self.oversold_threshold)) == 1,
+                self.exit_cross.update((self.overbought_threshold, rsi)) == 1)
 
 class RsiStrategy(BaseStrategy): # 或直接 class RsiStrategy(Strategy):
     # params = STRATEGY_PARAMS
@@ -24,31 +39,23 @@ class RsiStrategy(BaseStrategy): # 或直接 class RsiStrategy(Strategy):
         # 使用 self.I 註冊自定義的RSI指標 (rsi_indicator 來自 utils.py)
         self.rsi = self.I(rsi_indicator, close, self.rsi_period)
 
-    def next(self):
-        super().next() # 如果繼承自 BaseStrategy
-        # 當前RSI值
-        current_rsi = self.rsi[-1]
-
-        # RSI 從下方上穿超賣線 - 買入信號
-        if crossover(self.rsi, self.oversold_threshold):
-            if not self.position: # 如果沒有持倉
-                self.buy()
-            # elif self.position.is_short: # 如果持有空倉，則平倉後買入 (反轉)
-            #     self.position.close()
-            #     self.buy()
-        
-        # RSI 從上方下穿超買線 - 賣出信號
-        elif crossover(self.overbought_threshold, self.rsi): # 注意 crossover 的參數順序
-            if self.position.is_long: # 如果持有多倉
-                self.position.close() # 平多倉
-                # self.sell() # 開空倉 (如果策略允許做空)
-            # elif not self.position and self.allow_shorting: # 如果沒有持倉且允許做空
-            #     self.sell()
-
-        # 另一種常見的RSI邏輯：
+        # RSI 從下方上穿超賣線 -> 沒有持倉時買入；RSI 從上方下穿超買線 -> 持有多倉時平倉
+        # 信號一次算出整條序列，由基類的 next() 逐根查表下單 (注意第二個交叉的參數順序)
+        self.set_signals(entries=crossover_signals(self.rsi, self.oversold_threshold),
+                         exits=crossover_signals(self.overbought_threshold, self.rsi))
+
+        # 另一種常見的RSI邏輯 (需要覆蓋 next() 逐根判斷)：
         # 在超賣區 (RSI < 30) 且 RSI 開始回升時買入
         # if not self.position and current_rsi < self.oversold_threshold and self.rsi[-2] < current_rsi :
         #     self.buy()
         # 在超買區 (RSI > 70) 且 RSI 開始回落時賣出
         # elif self.position.is_long and current_rsi > self.overbought_threshold and self.rsi[-2] > current_rsi:
-        #     self.position.close()
\ No newline at end of file
+        #     self.position.close()
+
+    @classmethod
+    def streaming_signals(cls, params):
+        if cls._redefines_logic(RsiStrategy):
+            return None
+        return _RsiStream(params.get('rsi_period', cls.rsi_period),
+                          params.get('oversold_threshold', cls.oversold_threshold),
+                          params.get('overbought_threshold', cls.overbought_threshold))
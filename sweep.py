@@ -0,0 +1,483 @@
+# sweep.py
+import sys
+from bisect import bisect_left
+import numpy as np
+import pandas as pd
+
+# 與 backtesting.py 的 Strategy.buy() 預設倉位 (幾乎全部權益) 一致
+_FULL_EQUITY = 1 - sys.float_info.epsilon
+
+STATS_COLUMNS = ['Return [%]', 'Equity Final [$]', 'Max. Drawdown [%]', 'Sharpe Ratio',
+                 '# Trades', 'Win Rate [%]', 'Exposure Time [%]', 'SQN']
+
+def sma_matrix(close, windows) -> np.ndarray:
+    """
+    由同一個累積和一次算出多個週期的簡單移動平均。
+
+    參數:
+    - close (array-like): 收盤價序列，長度為 T。
+    - windows (list[int]): SMA 週期列表，長度為 W。
+
+    返回:
+    - np.ndarray: 形狀為 (W, T) 的矩陣，前 n-1 個值為 NaN (與 backtesting.test.SMA 相同)。
+    """
+    close = np.asarray(close, dtype=float)
+    csum = np.concatenate(([0.0], np.cumsum(close)))
+    out = np.full((len(windows), len(close)), np.nan)
+    for row, n in enumerate(windows):
+        if n <= len(close):
+            out[row, n - 1:] = (csum[n:] - csum[:-n]) / n
+    return out
+
+def _rolling_mean_nonneg(csum, n, length):
+    """由非負序列的累積和計算滾動平均，並像 pandas 一樣把浮點誤差造成的負值截為 0。"""
+    out = np.full(length, np.nan)
+    if n <= length:
+        out[n - 1:] = np.maximum((csum[n:] - csum[:-n]) / n, 0.0)
+    return out
+
+def rsi_matrix(close, periods) -> np.ndarray:
+    """
+    一次批量計算多個週期的 RSI，數值與 utils.rsi_indicator 相同。
+
+    參數:
+    - close (array-like): 收盤價序列，長度為 T。
+    - periods (list[int]): RSI 週期列表，長度為 P。
+
+    返回:
+    - np.ndarray: 形狀為 (P, T) 的 RSI 矩陣。
+    """
+    close = np.asarray(close, dtype=float)
+    delta = np.diff(close, prepend=np.nan)
+    # 與 rsi_indicator 中的 delta.where(...) 一致：第一個 NaN 差值視為 0
+    gain_csum = np.concatenate(([0.0], np.cumsum(np.where(delta > 0, delta, 0.0))))
+    loss_csum = np.concatenate(([0.0], np.cumsum(np.where(delta < 0, -delta, 0.0))))
+    out = np.empty((len(periods), len(close)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for row, n in enumerate(periods):
+            gain = _rolling_mean_nonneg(gain_csum, n, len(close))
+            loss = _rolling_mean_nonneg(loss_csum, n, len(close))
+            rs = gain / loss
+            rs[np.isinf(rs)] = 1000
+            rs[np.isnan(rs)] = 1
+            out[row] = 100 - (100 / (1 + rs))
+    return out
+
+def _crossover(series1, series2):
+    """
+    向量化的 backtesting.lib.crossover：series1 在第 t 根 K 線上穿 series2。
+    輸入形狀為 (C, T) (或可廣播)，返回 (C, T) 布林矩陣，第 0 列為 False。
+    """
+    series1, series2 = np.broadcast_arrays(series1, series2)
+    out = np.zeros(series1.shape, dtype=bool)
+    with np.errstate(invalid='ignore'):
+        out[..., 1:] = (series1[..., :-1] < series2[..., :-1]) & (series1[..., 1:] > series2[..., 1:])
+    return out
+
+def _next_true(mask):
+    """對 (C, T) 布林矩陣，返回每個位置起 (含) 下一個 True 的列號，沒有則為 T。"""
+    n_bars = mask.shape[1]
+    idx = np.where(mask, np.arange(n_bars, dtype=np.int32), np.int32(n_bars))
+    return np.ascontiguousarray(np.minimum.accumulate(idx[:, ::-1], axis=1)[:, ::-1])
+
+def _attempts_matrix(open_, next_entry, next_exit, cash, commission):
+    """
+    對所有參數組合同時逐筆推進開倉嘗試。每個元素為 (entry_bar, exit_bar, size, entry_price, exit_price,
+    cash_in_trade, cash_after_exit)，各項為長度 C 的數組；未成交的嘗試 entry_bar 為 -1，未平倉的 exit_bar 為 -1。
+    """
+    n_combos, n_bars = next_entry.shape
+    combos = np.arange(n_combos)
+    cursor = np.zeros(n_combos, dtype=int) # 從這根 K 線起尋找下一個進場信號
+    current_cash = np.full(n_combos, float(cash))
+    attempts = []
+    while True:
+        signal_bar = np.where(cursor < n_bars, next_entry[combos, np.minimum(cursor, n_bars - 1)], n_bars)
+        active = signal_bar < n_bars
+        if not active.any():
+            break
+        entry_bar = np.where(active, signal_bar + 1, -1)
+        price = open_[np.maximum(entry_bar, 0)]
+        units = np.where(active, (current_cash * _FULL_EQUITY) // (price + price * commission), 0.0)
+        filled = units > 0
+        current_cash = current_cash - units * price * commission
+        cash_in_trade = current_cash
+        # 持倉後從成交的那根 K 線起尋找出場信號
+        exit_signal = np.where(filled, next_exit[combos, np.minimum(signal_bar + 1, n_bars - 1)], n_bars)
+        closed = filled & (exit_signal < n_bars)
+        exit_bar = np.where(closed, exit_signal + 1, -1)
+        exit_price = open_[np.maximum(exit_bar, 0)]
+        current_cash = np.where(closed, current_cash + units * (exit_price - price) - units * exit_price * commission,
+                                current_cash)
+        cursor = np.where(~active | (filled & ~closed), n_bars,
+                          np.where(closed, exit_signal + 1, signal_bar + 1))
+        attempts.append((np.where(filled, entry_bar, -1), exit_bar, units, price, exit_price,
+                         cash_in_trade, current_cash.copy()))
+    return attempts
+
+def _attempts_single(open_, entries, exits, cash, commission):
+    """
+    _attempts_matrix 的單組版本：各項為 Python 標量，用二分查找在進出場信號的位置列表中推進，
+    不需要逐根 K 線的 _next_true 數組，也避免對長度為 1 的數組反復調用 NumPy，算術完全相同。
+    資金不足而被取消的開倉嘗試不改變任何狀態，這裡直接跳過，不記入返回的列表。
+    """
+    entry_signals, exit_signals = np.flatnonzero(entries), np.flatnonzero(exits)
+    # 最後一根 K 線上沒有信號，所以下一根的開盤價總是存在
+    entry_prices, exit_prices = open_[entry_signals + 1].tolist(), open_[exit_signals + 1].tolist()
+    entry_signals, exit_signals = entry_signals.tolist(), exit_signals.tolist()
+    n_entries, n_exits = len(entry_signals), len(exit_signals)
+    first_open = float(open_[0])
+    i = 0
+    current_cash = float(cash)
+    attempts = []
+    while i < n_entries:
+        budget = current_cash * _FULL_EQUITY
+        price = entry_prices[i]
+        units = budget // (price + price * commission)
+        if not units > 0:
+            i += 1
+            continue
+        entry_bar = entry_signals[i] + 1
+        current_cash = current_cash - units * price * commission
+        cash_in_trade = current_cash
+        j = bisect_left(exit_signals, entry_bar)
+        if j == n_exits:
+            attempts.append((entry_bar, -1, units, price, first_open, cash_in_trade, current_cash))
+            break
+        exit_bar, exit_price = exit_signals[j] + 1, exit_prices[j]
+        current_cash = current_cash + units * (exit_price - price) - units * exit_price * commission
+        attempts.append((entry_bar, exit_bar, units, price, exit_price, cash_in_trade, current_cash))
+        i = bisect_left(entry_signals, exit_bar, i + 1)
+    return attempts
+
+def _simulate_long_only(open_, close, entries, exits, cash, commission):
+    """
+    以矩陣運算模擬多組只做多的進出場信號，語義與 run_backtest (exclusive_orders=True) 相同：
+    第 t 根 K 線收盤前產生的信號在第 t+1 根的開盤價成交，空倉時才開倉，持多倉時才平倉，
+    每次開倉以幾乎全部權益買入整數單位，開倉與平倉各收一次手續費。
+    權益不足以買入一個單位時訂單被取消，之後的進場信號會重新嘗試開倉。
+
+    參數:
+    - open_, close (np.ndarray): 長度為 T 的開盤價與收盤價。
+    - entries, exits (np.ndarray): 形狀為 (C, T) 的布林信號矩陣 (每組參數一行)，已排除指標預熱期。
+    - cash (float): 初始資金。
+    - commission (float): 手續費率。
+
+    返回:
+    - dict: 'equity' (C, T) 權益曲線，以及每次開倉嘗試的 'pnl'、'return_pct'、'entry_bar'、'exit_bar'、
+            'size'、'entry_price'、'exit_price'、'commissions' (C, A) 矩陣與已平倉交易的遮罩 'closed'。
+    """
+    n_combos, n_bars = entries.shape
+    # 最後一根 K 線上的信號不會成交
+    entries = entries.copy()
+    exits = exits.copy()
+    entries[:, -1] = exits[:, -1] = False
+
+    # 整數倉位依賴前一筆交易後的資金，只能按開倉嘗試逐筆推進 (對所有參數組合同時計算)
+    if n_combos == 1:
+        attempts = _attempts_single(open_, entries[0], exits[0], cash, commission)
+    else:
+        attempts = _attempts_matrix(open_, _next_true(entries), _next_true(exits), cash, commission)
+
+    if attempts:
+        entry_bar, exit_bar, size, entry_price, exit_price, cash_in_trade, cash_after_exit = \
+            (np.array(values).reshape(len(values), n_combos).T for values in zip(*attempts))
+    else:
+        entry_bar = exit_bar = np.full((n_combos, 1), -1)
+        size = entry_price = exit_price = np.zeros((n_combos, 1))
+        cash_in_trade = cash_after_exit = np.full((n_combos, 1), float(cash))
+    closed = exit_bar >= 0
+
+    # 權益曲線：持倉時為開倉後現金加上未實現盈虧，空倉時為最近一次平倉後的現金
+    latest = np.full((n_combos, n_bars), -1, dtype=np.int32)
+    combo_idx, attempt_idx = np.nonzero(entry_bar >= 0)
+    latest[combo_idx, entry_bar[combo_idx, attempt_idx]] = attempt_idx
+    latest = np.maximum.accumulate(latest, axis=1)
+    # 以展平後的下標取每根 K 線所屬的嘗試 (比 take_along_axis 快)
+    flat_idx = np.maximum(latest, 0) + (np.arange(n_combos) * entry_bar.shape[1])[:, None]
+    held_exit = exit_bar.take(flat_idx)
+    position = (latest >= 0) & ((held_exit < 0) | (np.arange(n_bars) < held_exit))
+    held_size = size.take(flat_idx)
+    held_entry = entry_price.take(flat_idx)
+    equity = np.where(
+        position,
+        cash_in_trade.take(flat_idx) + (close * held_size - held_size * held_entry),
+        np.where(latest >= 0, cash_after_exit.take(flat_idx), float(cash)))
+
+    commissions = size * entry_price * commission + size * exit_price * commission
+    pnl = np.where(closed, size * (exit_price - entry_price) - commissions, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return_pct = np.where(closed, exit_price / entry_price - 1 - commissions / (size * entry_price), np.nan)
+    return {'equity': equity, 'pnl': pnl, 'return_pct': return_pct,
+            'entry_bar': entry_bar, 'exit_bar': exit_bar, 'closed': closed,
+            'size': size, 'entry_price': entry_price, 'exit_price': exit_price, 'commissions': commissions}
+
+def _period_sampling(index):
+    """
+    返回計算年化收益與夏普比率時用到的取樣位置 (每個自然日/週/月/年的最後一根 K 線)
+    以及每年交易期數，規則與 backtesting.py 的 compute_stats 相同。
+    """
+    if not isinstance(index, pd.DatetimeIndex):
+        return None, np.nan
+    period = pd.Series(index[-100:]).diff().dropna().median()
+    freq_days = period.days
+    # 無時區的索引直接以 NumPy 日期計算星期和日期變化 (1970-01-01 是星期四)，比 pandas 的字段訪問和 resample 快得多
+    if index.tz is None:
+        days = index.values.astype('datetime64[D]').astype('int64')
+        weekend_share = ((days + 3) % 7 >= 5).mean()
+    else:
+        days = None
+        weekend_share = index.dayofweek.to_series().between(5, 6).mean()
+    have_weekends = weekend_share > 2 / 7 * .6
+    annual_trading_days = (52 if freq_days == 7 else 12 if freq_days == 31 else
+                           1 if freq_days == 365 else (365 if have_weekends else 252))
+    freq = {7: 'W', 31: 'ME', 365: 'YE'}.get(freq_days, 'D')
+    if freq == 'D' and days is not None:
+        return np.append(np.flatnonzero(days[1:] != days[:-1]), len(index) - 1), annual_trading_days
+    positions = pd.Series(np.arange(len(index)), index=index).resample(freq).last().dropna()
+    return positions.values.astype(int), annual_trading_days
+
+def _summarize(sim, n_bars, sample_positions, annual_trading_days):
+    """由模擬結果計算每組參數的關鍵統計量，返回 {列名: (C,) 數組}。"""
+    equity = sim['equity']
+    pnl, closed = sim['pnl'], sim['closed']
+    stats = {}
+    stats['Equity Final [$]'] = equity[:, -1]
+    stats['Return [%]'] = (equity[:, -1] - equity[:, 0]) / equity[:, 0] * 100
+    drawdown = 1 - equity / np.maximum.accumulate(equity, axis=1)
+    stats['Max. Drawdown [%]'] = -np.nan_to_num(drawdown.max(axis=1)) * 100
+
+    n_trades = closed.sum(axis=1)
+    stats['# Trades'] = n_trades
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stats['Win Rate [%]'] = np.where(n_trades > 0, (np.nan_to_num(pnl) > 0).sum(axis=1) / n_trades, np.nan) * 100
+        held_bars = np.where(closed, sim['exit_bar'] - sim['entry_bar'] + 1, 0).sum(axis=1)
+        stats['Exposure Time [%]'] = held_bars / n_bars * 100
+        pnl_mean = np.where(closed, pnl, 0).sum(axis=1) / n_trades
+        pnl_std = np.sqrt(np.nansum(np.where(closed, (pnl - pnl_mean[:, None]) ** 2, 0), axis=1) / (n_trades - 1))
+        pnl_std = np.where(pnl_std == 0, np.nan, pnl_std)
+        stats['SQN'] = np.sqrt(n_trades) * pnl_mean / pnl_std
+
+        # 年化收益與波動率：以每期最後一根 K 線的權益計算幾何平均收益
+        if sample_positions is not None and len(sample_positions) > 2:
+            sampled = equity[:, sample_positions]
+            returns = sampled[:, 1:] / sampled[:, :-1] - 1
+            growth = returns + 1
+            gmean = np.where((growth <= 0).any(axis=1), 0,
+                             np.exp(np.log(np.where(growth > 0, growth, 1)).sum(axis=1) / returns.shape[1]) - 1)
+            annual_return = (1 + gmean) ** annual_trading_days - 1
+            volatility = np.sqrt((returns.var(axis=1, ddof=1) + (1 + gmean) ** 2) ** annual_trading_days
+                                 - (1 + gmean) ** (2 * annual_trading_days))
+            volatility = np.where(volatility == 0, np.nan, volatility)
+            stats['Sharpe Ratio'] = (annual_return * 100) / (volatility * 100)
+        else:
+            stats['Sharpe Ratio'] = np.full(equity.shape[0], np.nan)
+    return stats
+
+class MaCrossSignals:
+    """
+    MaCrossStrategy 的向量化信號：參數網格 -> 全序列 SMA 矩陣 -> 任意 K 線區間的進出場信號。
+    指標只在完整序列上算一次，區間信號由切片得到 (walk_forward 用它在各折之間復用指標)。
+    """
+    param_columns = ['n1', 'n2']
+
+    def __init__(self, n1_values, n2_values):
+        self.params = pd.DataFrame([(n1, n2) for n1 in n1_values for n2 in n2_values if n1 < n2],
+                                   columns=self.param_columns)
+        self.windows = sorted(set(n1_values) | set(n2_values))
+        self.row_of = {n: i for i, n in enumerate(self.windows)}
+
+    @classmethod
+    def from_param_grid(cls, param_grid):
+        """由 {'n1': [...], 'n2': [...]} 形式的參數網格建立。"""
+        return cls(param_grid['n1'], param_grid['n2'])
+
+    def indicators(self, close):
+        """返回形狀為 (W, T) 的 SMA 矩陣。"""
+        return sma_matrix(close, self.windows)
+
+    def signals(self, sma, chunk, start=0, stop=None):
+        """
+        返回 chunk 中每組參數在 [start, stop) 區間內的 (entries, exits) 布林矩陣。
+        區間前一根 K 線參與交叉判斷，所以結果與在完整序列上計算後再切片相同。
+        """
+        stop = sma.shape[1] if stop is None else stop
+        lead = 1 if start > 0 else 0
+        window = sma[:, start - lead:stop]
+        fast = window[[self.row_of[n] for n in chunk['n1']]]
+        slow = window[[self.row_of[n] for n in chunk['n2']]]
+        # backtesting.py 從最慢指標的預熱期結束後一根才開始調用 next()
+        tradable = np.arange(start - lead, stop) >= np.maximum(chunk['n1'], chunk['n2']).to_numpy()[:, None]
+        entries = _crossover(fast, slow) & tradable
+        exits = _crossover(slow, fast) & tradable
+        return entries[:, lead:], exits[:, lead:]
+
+class RsiSignals:
+    """RsiStrategy 的向量化信號，接口同 MaCrossSignals。所有週期的 RSI 由 rsi_matrix 一次批量算出。"""
+    param_columns = ['rsi_period', 'oversold_threshold', 'overbought_threshold']
+
+    def __init__(self, rsi_periods, oversold_values=(30,), overbought_values=(70,)):
+        self.params = pd.DataFrame([(n, lo, hi) for n in rsi_periods for lo in oversold_values
+                                    for hi in overbought_values if lo < hi],
+                                   columns=self.param_columns)
+        self.periods = sorted(set(rsi_periods))
+        self.row_of = {n: i for i, n in enumerate(self.periods)}
+
+    @classmethod
+    def from_param_grid(cls, param_grid):
+        """由參數網格建立，未給出的閾值使用 RsiStrategy 的預設值。"""
+        return cls(param_grid['rsi_period'], param_grid.get('oversold_threshold', (30,)),
+                   param_grid.get('overbought_threshold', (70,)))
+
+    def indicators(self, close):
+        """返回形狀為 (P, T) 的 RSI 矩陣。"""
+        return rsi_matrix(close, self.periods)
+
+    def signals(self, rsi, chunk, start=0, stop=None):
+        """返回 chunk 中每組參數在 [start, stop) 區間內的 (entries, exits) 布林矩陣。"""
+        stop = rsi.shape[1] if stop is None else stop
+        lead = 1 if start > 0 else 0
+        values = rsi[[self.row_of[n] for n in chunk['rsi_period']], start - lead:stop]
+        oversold = chunk['oversold_threshold'].to_numpy(dtype=float)[:, None]
+        overbought = chunk['overbought_threshold'].to_numpy(dtype=float)[:, None]
+        # RSI 沒有 NaN 預熱期，backtesting.py 從第二根 K 線開始調用 next()
+        return _crossover(values, oversold)[:, lead:], _crossover(overbought, values)[:, lead:]
+
+# 策略名稱 (strategies.STRATEGY_REGISTRY 的鍵) -> 向量化信號模型
+SIGNAL_MODELS = {'MA_Cross': MaCrossSignals, 'RSI': RsiSignals}
+
+def _evaluate_range(open_, close, index, model, matrix, params, start, stop, cash, commission, chunk_size):
+    """
+    在 [start, stop) 區間內按參數塊模擬 model 的所有參數組合 (從 cash 開始、空倉起步)，
+    返回未排序的 params + STATS_COLUMNS 表。
+    """
+    sample_positions, annual_trading_days = _period_sampling(index[start:stop])
+    frames = []
+    for begin in range(0, len(params), chunk_size):
+        chunk = params.iloc[begin:begin + chunk_size]
+        entries, exits = model.signals(matrix, chunk, start, stop)
+        sim = _simulate_long_only(open_[start:stop], close[start:stop], entries, exits, cash, commission)
+        stats = _summarize(sim, stop - start, sample_positions, annual_trading_days)
+        frames.append(chunk.assign(**{col: stats[col] for col in STATS_COLUMNS}))
+    if not frames:
+        return params.reindex(columns=list(params.columns) + STATS_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+def run_sweep(data_df: pd.DataFrame, model, cash=100000, commission=0.001, maximize='Sharpe Ratio',
+              chunk_size=128) -> pd.DataFrame:
+    """
+    在完整數據上模擬信號模型 (MaCrossSignals、RsiSignals) 的全部參數組合。
+
+    參數:
+    - data_df (pd.DataFrame): 與 run_backtest 相同格式的 OHLCV 數據。
+    - model (MaCrossSignals | RsiSignals): 帶參數網格的信號模型。
+    - cash, commission, maximize, chunk_size: 同 sweep_ma_cross。
+
+    返回:
+    - pd.DataFrame: 每組參數一行，包含參數列和 STATS_COLUMNS，按 maximize 降序排列。
+    """
+    open_ = data_df['Open'].to_numpy(dtype=float)
+    close = data_df['Close'].to_numpy(dtype=float)
+    matrix = model.indicators(close)
+    results = _evaluate_range(open_, close, data_df.index, model, matrix, model.params, 0, len(close),
+                              cash, commission, chunk_size)
+    return results.sort_values(maximize, ascending=False, na_position='last').reset_index(drop=True)
+
+def sweep_ma_cross(data_df: pd.DataFrame, n1_values, n2_values, cash=100000, commission=0.001,
+                   maximize='Sharpe Ratio', chunk_size=128) -> pd.DataFrame:
+    """
+    向量化地掃描 MaCrossStrategy 的 n1/n2 參數網格 (只保留 n1 < n2 的組合)。
+
+    參數:
+    - data_df (pd.DataFrame): 與 run_backtest 相同格式的 OHLCV 數據。
+    - n1_values, n2_values (list[int]): 短期與長期 MA 週期的候選值。
+    - cash (float): 初始資金。
+    - commission (float): 手續費率。
+    - maximize (str): 排序依據的統計列名。
+    - chunk_size (int): 每次同時模擬的參數組合數，用於限制內存。
+
+    返回:
+    - pd.DataFrame: 每組參數一行，包含 n1、n2 和 STATS_COLUMNS 中的統計量，按 maximize 降序排列。
+    """
+    return run_sweep(data_df, MaCrossSignals(n1_values, n2_values), cash, commission, maximize, chunk_size)
+
+def sweep_rsi(data_df: pd.DataFrame, rsi_periods, oversold_values=(30,), overbought_values=(70,),
+              cash=100000, commission=0.001, maximize='Sharpe Ratio', chunk_size=128) -> pd.DataFrame:
+    """
+    向量化地掃描 RsiStrategy 的 rsi_period 與超買/超賣閾值 (只保留 oversold < overbought 的組合)。
+    所有週期的 RSI 由 rsi_matrix 一次批量算出。
+
+    參數:
+    - data_df (pd.DataFrame): 與 run_backtest 相同格式的 OHLCV 數據。
+    - rsi_periods (list[int]): RSI 週期候選值。
+    - oversold_values, overbought_values (list[float]): 超賣與超買閾值候選值。
+    - cash, commission, maximize, chunk_size: 同 sweep_ma_cross。
+
+    返回:
+    - pd.DataFrame: 每組參數一行，包含 rsi_period、oversold_threshold、overbought_threshold
+                    和 STATS_COLUMNS 中的統計量，按 maximize 降序排列。
+    """
+    model = RsiSignals(rsi_periods, oversold_values, overbought_values)
+    return run_sweep(data_df, model, cash, commission, maximize, chunk_size)
+
+def verify_sweep(data_df: pd.DataFrame, results: pd.DataFrame, strategy_class, n_samples=3,
+                 cash=100000, commission=0.001, rtol=1e-6, random_state=0) -> pd.DataFrame:
+    """
+    隨機抽取幾組掃描結果，用 run_backtest 重新回測並比較統計量。
+
+    參數:
+    - data_df (pd.DataFrame): 掃描時使用的數據。
+    - results (pd.DataFrame): sweep_ma_cross 或 sweep_rsi 的返回值。
+    - strategy_class (Strategy): 對應的策略類 (MaCrossStrategy 或 RsiStrategy)。
+    - n_samples (int): 抽樣的參數組合數。
+    - cash, commission: 必須與掃描時相同。
+    - rtol (float): 允許的相對誤差。
+    - random_state (int): 抽樣隨機種子。
+
+    返回:
+    - pd.DataFrame: 每組抽樣參數一行，包含兩邊的統計量與 'Match' 列。
+    """
+    from backtester import run_backtest
+
+    param_columns = [col for col in results.columns if col not in STATS_COLUMNS]
+    sample = results.sample(min(n_samples, len(results)), random_state=random_state)
+    rows = []
+    for params, (_, row) in zip(sample[param_columns].to_dict('records'), sample.iterrows()):
+        stats = run_backtest(data_df, strategy_class, cash=cash, commission=commission,
+                             plot_results=False, **params)
+        record = dict(params)
+        match = stats is not None
+        for col in STATS_COLUMNS:
+            expected = float(stats[col]) if stats is not None else np.nan
+            record[f'{col} (sweep)'] = row[col]
+            record[f'{col} (backtest)'] = expected
+            match = match and bool(np.isclose(row[col], expected, rtol=rtol, equal_nan=True))
+        record['Match'] = match
+        rows.append(record)
+    report = pd.DataFrame(rows)
+    if not report.empty and not report['Match'].all():
+        print("警告: 部分掃描結果與 run_backtest 不一致:")
+        print(report[~report['Match']][param_columns])
+    return report
+
+if __name__ == '__main__':
+    # 用隨機遊走價格測試掃描引擎，並與 run_backtest 對照
+    import time
+    from strategies.simple_ma_strategy import MaCrossStrategy
+    from strategies.simple_rsi_strategy import RsiStrategy
+    from synthetic_data import generate_ohlcv
+
+    test_df = generate_ohlcv(5 * 365 * 24, 'h', start='2019-01-01', seed=42, volatility=0.01)
+
+    start = time.perf_counter()
+    ma_results = sweep_ma_cross(test_df, range(2, 52), range(2, 52))
+    print(f"MA 掃描 {len(ma_results)} 組參數，耗時 {time.perf_counter() - start:.2f} 秒")
+    print(ma_results.head(10))
+
+    start = time.perf_counter()
+    rsi_results = sweep_rsi(test_df, range(5, 31), range(20, 41, 5), range(60, 81, 5))
+    print(f"RSI 掃描 {len(rsi_results)} 組參數，耗時 {time.perf_counter() - start:.2f} 秒")
+    print(rsi_results.head(10))
+
+    print("\n與 run_backtest 對照:")
+    print(verify_sweep(test_df, ma_results, MaCrossStrategy)[['n1', 'n2', 'Match']])
+    print(verify_sweep(test_df, rsi_results, RsiStrategy)[['rsi_period', 'oversold_threshold', 'overbought_threshold', 'Match']])
@@ -0,0 +1,34 @@
+# synthetic_data.py
+# 合成的 OHLCV 數據，供基準測試、測試和各模組的 __main__ 示例使用。只依賴 numpy 和 pandas，
+# 導入它不會帶入 backtesting、ccxt 或其他項目模組。
+import numpy as np
+import pandas as pd
+
+def generate_ohlcv(n_bars, freq='1min', start='2000-01-01', seed=0, start_price=30000.0, volatility=0.001,
+                   drift=0.0):
+    """
+    生成合成的 OHLCV 數據 (幾何隨機遊走)。1000 萬根 K 線約需 1 秒、400 MB 內存。
+
+    參數:
+    - n_bars (int): K 線數量。
+    - freq (str): K 線間隔，預設為 1 分鐘 (對應 '1m' 週期)。
+    - start (str): 第一根 K 線的時間。
+    - seed (int): 隨機種子，相同參數生成的數據完全相同。
+    - start_price (float): 起始價格。
+    - volatility (float): 每根 K 線對數收益率的標準差。
+    - drift (float): 每根 K 線對數收益率的均值。
+
+    返回:
+    - pd.DataFrame: 與 fetch_ohlcv_data 相同格式的 DataFrame。
+    """
+    rng = np.random.default_rng(seed)
+    close = start_price * np.exp(np.cumsum(rng.normal(drift, volatility, n_bars)))
+    open_ = np.empty_like(close)
+    open_[0] = start_price
+    open_[1:] = close[:-1]
+    wick = np.abs(rng.normal(0, volatility, n_bars)) * close
+    df = pd.DataFrame({'Open': open_, 'High': np.maximum(open_, close) + wick,
+                       'Low': np.minimum(open_, close) - wick, 'Close': close,
+                       'Volume': rng.gamma(2.0, 5.0, n_bars)},
+                      index=pd.date_range(start, periods=n_bars, freq=freq, name='timestamp'))
+    return df
@@ -0,0 +1,16 @@
+# tests/test_cli_startup.py
+# main.py 輕量命令的冷啟動預算：每個命令在全新進程中運行，耗時不得超過 benchmark.STARTUP_BUDGET_SECONDS，
+# 且不得導入 ccxt、backtesting、Bokeh 或 pandas。
+import pytest
+
+from benchmark import STARTUP_BUDGET_SECONDS, check_cli_startup
+
+@pytest.fixture(scope='module')
+def startup_report():
+    return check_cli_startup(STARTUP_BUDGET_SECONDS, repeat=3).set_index('command')
+
+@pytest.mark.parametrize('command', ['--help', 'strategies', 'report'])
+def test_light_command_startup(startup_report, command):
+    row = startup_report[startup_report.index.str.startswith(command)].iloc[0]
+    assert not row['unexpected_modules'], f"{command} 導入了 {row['unexpected_modules']}"
+    assert row['seconds'] <= STARTUP_BUDGET_SECONDS, f"{command} 啟動耗時 {row['seconds']:.3f} 秒"
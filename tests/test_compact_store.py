@@ -0,0 +1,48 @@
+# tests/test_compact_store.py
+# 緊湊存儲：等間隔的分區共用日曆時間戳，出現缺口、不對齊或更早的數據時仍返回正確的索引。
+import os
+
+import numpy as np
+
+from compact_store import (append_compact, get_compact_partition, load_compact, load_compact_arrays,
+                           partition_nbytes, write_compact)
+from synthetic_data import generate_ohlcv
+
+def _has_timestamp_file(root, symbol):
+    return os.path.exists(os.path.join(get_compact_partition(symbol, '1m', str(root)), 'timestamp.i8'))
+
+def test_regular_partitions_share_the_calendar(tmp_path):
+    data_df = generate_ohlcv(5000, 'min', start='2024-01-01', seed=1)
+    append_compact(data_df.iloc[:3000], 'BTC/USDT', '1m', str(tmp_path))
+    append_compact(data_df, 'BTC/USDT', '1m', str(tmp_path))
+    write_compact(data_df.iloc[-2000:], 'ETH/USDT', '1m', str(tmp_path))
+    assert not _has_timestamp_file(tmp_path, 'BTC/USDT') and not _has_timestamp_file(tmp_path, 'ETH/USDT')
+    assert partition_nbytes('BTC/USDT', '1m', str(tmp_path)) == 20 * 5000
+    assert load_compact('BTC/USDT', '1m', str(tmp_path)).index.equals(data_df.index)
+    assert load_compact('ETH/USDT', '1m', str(tmp_path)).index.equals(data_df.index[-2000:])
+    btc = load_compact_arrays('BTC/USDT', '1m', str(tmp_path))['timestamp']
+    eth = load_compact_arrays('ETH/USDT', '1m', str(tmp_path))['timestamp']
+    assert btc.filename == eth.filename # 兩個交易對的索引映射同一個日曆檔案
+
+def test_earlier_symbol_extends_calendar_backwards(tmp_path):
+    data_df = generate_ohlcv(3000, 'min', start='2024-01-01', seed=2)
+    append_compact(data_df.iloc[2000:], 'BTC/USDT', '1m', str(tmp_path))
+    append_compact(data_df, 'ETH/USDT', '1m', str(tmp_path))
+    assert load_compact('BTC/USDT', '1m', str(tmp_path)).index.equals(data_df.index[2000:])
+    assert load_compact('ETH/USDT', '1m', str(tmp_path)).index.equals(data_df.index)
+
+def test_gap_or_misaligned_bars_fall_back_to_timestamp_file(tmp_path):
+    data_df = generate_ohlcv(3000, 'min', start='2024-01-01', seed=3)
+    append_compact(data_df.iloc[:1000], 'BTC/USDT', '1m', str(tmp_path))
+    append_compact(data_df.iloc[1010:], 'BTC/USDT', '1m', str(tmp_path)) # 缺了 10 根
+    assert _has_timestamp_file(tmp_path, 'BTC/USDT')
+    expected = data_df.index[:1000].append(data_df.index[1010:])
+    loaded = load_compact('BTC/USDT', '1m', str(tmp_path))
+    assert loaded.index.equals(expected)
+    assert np.array_equal(loaded.to_numpy(), data_df.loc[expected].to_numpy(dtype=np.float32))
+
+    shifted = data_df.copy()
+    shifted.index = shifted.index + np.timedelta64(30, 's')
+    append_compact(shifted, 'ETH/USDT', '1m', str(tmp_path))
+    assert _has_timestamp_file(tmp_path, 'ETH/USDT')
+    assert load_compact('ETH/USDT', '1m', str(tmp_path)).index.equals(shifted.index)
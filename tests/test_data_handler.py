@@ -0,0 +1,53 @@
+# tests/test_data_handler.py
+# 增量同步：月線長度不固定，續傳游標和收盤判斷必須按日曆月份計算，不能漏掉任何一根 K 線；存儲中只保存真實 K 線。
+import pandas as pd
+
+from data_handler import load_ohlcv_from_store, sync_ohlcv_data, timeframe_bar_ends
+
+class _FakeExchange:
+    has = {'fetchOHLCV': True}
+
+    def __init__(self, candles):
+        self.candles = candles
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        rows = [c for c in self.candles if since is None or c[0] >= since]
+        return rows[:limit]
+
+def _monthly_candles(start, periods):
+    index = pd.date_range(start, periods=periods, freq='MS')
+    return [[int(ts.value // 10**6), 100.0 + i, 102.0 + i, 99.0 + i, 101.0 + i, 10.0] for i, ts in enumerate(index)]
+
+def test_monthly_sync_is_incremental_without_gaps(tmp_path):
+    candles = _monthly_candles('2020-01-01', 36)
+    exchange = _FakeExchange(candles[:2]) # 先只有 2020 年 1–2 月
+    assert sync_ohlcv_data('BTC/USDT', '1M', exchange=exchange, store_dir=str(tmp_path)) == 2
+    exchange.candles = candles
+    assert sync_ohlcv_data('BTC/USDT', '1M', exchange=exchange, batch_limit=5, store_dir=str(tmp_path)) == 34
+    stored = load_ohlcv_from_store('BTC/USDT', '1M', store_dir=str(tmp_path))
+    assert len(stored) == 36
+    assert list(stored.index) == list(pd.date_range('2020-01-01', periods=36, freq='MS'))
+    assert sync_ohlcv_data('BTC/USDT', '1M', exchange=exchange, store_dir=str(tmp_path)) == 0
+
+def test_unclosed_month_is_not_stored(tmp_path):
+    this_month = pd.Timestamp.now(tz='UTC').tz_localize(None).normalize().replace(day=1)
+    candles = _monthly_candles(this_month - pd.DateOffset(months=3), 4)
+    assert sync_ohlcv_data('BTC/USDT', '1M', exchange=_FakeExchange(candles), store_dir=str(tmp_path)) == 3
+
+def test_calendar_bar_ends():
+    starts = [pd.Timestamp(day).value // 10**6 for day in ('2020-02-01', '2020-12-01')]
+    assert list(pd.to_datetime(timeframe_bar_ends(starts, '1M'), unit='ms')) == [pd.Timestamp('2020-03-01'),
+                                                                                 pd.Timestamp('2021-01-01')]
+    assert pd.Timestamp(int(timeframe_bar_ends(starts[:1], '1y')[0]), unit='ms') == pd.Timestamp('2021-01-01')
+    assert timeframe_bar_ends(starts[:1], '4h')[0] == starts[0] + 4 * 3600 * 1000
+
+def test_gaps_are_filled_on_load_not_in_store(tmp_path):
+    index = pd.date_range('2020-01-01', periods=10, freq='D').delete([3, 4, 7])
+    candles = [[int(ts.value // 10**6), 100.0 + i, 102.0 + i, 99.0 + i, 101.0 + i, 10.0] for i, ts in enumerate(index)]
+    assert sync_ohlcv_data('BTC/USDT', '1d', exchange=_FakeExchange(candles), store_dir=str(tmp_path)) == 7
+    stored = load_ohlcv_from_store('BTC/USDT', '1d', store_dir=str(tmp_path), fill_gaps=False)
+    assert list(stored.index) == list(index)
+    filled = load_ohlcv_from_store('BTC/USDT', '1d', store_dir=str(tmp_path))
+    assert list(filled.index) == list(pd.date_range('2020-01-01', periods=10, freq='D'))
+    assert (filled.loc['2020-01-04':'2020-01-05', 'Volume'] == 0).all()
+    assert (filled.loc['2020-01-04':'2020-01-05', 'Close'] == stored.loc['2020-01-03', 'Close']).all()
@@ -0,0 +1,55 @@
+# tests/test_fast_backtest.py
+# fast_backtest.py 的等價性測試：兩個內建策略在不同參數和 K 線週期上，
+# 向量化回測的統計量、交易列表和權益曲線必須與 run_backtest 完全一致。
+import numpy as np
+import pytest
+
+from synthetic_data import generate_ohlcv
+from fast_backtest import run_fast_backtest, verify_fast_backtest
+from sweep import STATS_COLUMNS, _simulate_long_only
+from strategies.simple_ma_strategy import MaCrossStrategy
+from strategies.simple_rsi_strategy import RsiStrategy
+
+# (週期, K 線數, 每根 K 線的波動率)：日線波動較大，小時線數據較長
+FREQUENCIES = [('D', 1500, 0.02), ('h', 20000, 0.005)]
+CASES = [
+    (MaCrossStrategy, {}),
+    (MaCrossStrategy, {'n1': 5, 'n2': 60}),
+    (RsiStrategy, {}),
+    (RsiStrategy, {'rsi_period': 7, 'oversold_threshold': 25, 'overbought_threshold': 75}),
+]
+
+@pytest.fixture(scope='module', params=FREQUENCIES, ids=[freq for freq, _, _ in FREQUENCIES])
+def data_df(request):
+    freq, n_bars, volatility = request.param
+    return generate_ohlcv(n_bars, freq=freq, start='2019-01-01', seed=7, volatility=volatility)
+
+@pytest.mark.parametrize('strategy_class, params', CASES,
+                         ids=[f'{cls.__name__}-{params or "default"}' for cls, params in CASES])
+def test_matches_run_backtest(data_df, strategy_class, params):
+    report = verify_fast_backtest(data_df, strategy_class, **params)
+    assert report['Match'].all(), report[~report['Match']].to_string(index=False)
+    assert report.set_index('stat').loc['_trades', 'backtest'] > 0 # 確保比較的不是空交易列表
+
+@pytest.mark.parametrize('strategy_class, params', CASES[::2], ids=['MaCrossStrategy', 'RsiStrategy'])
+def test_key_stats_match_full_stats(data_df, strategy_class, params):
+    full = run_fast_backtest(data_df, strategy_class, **params)
+    key = run_fast_backtest(data_df, strategy_class, full_stats=False, **params)
+    for col in STATS_COLUMNS:
+        assert np.isclose(float(key[col]), float(full[col]), rtol=1e-9, equal_nan=True), col
+    assert np.array_equal(key['_equity_curve']['Equity'].to_numpy(), full['_equity_curve']['Equity'].to_numpy())
+
+@pytest.mark.parametrize('cash', [100000, 40000], ids=['cash', 'short-of-cash'])
+def test_single_combo_path_matches_matrix_path(cash):
+    # 單組信號走二分查找的快速路徑；隨機信號包含同一根 K 線上的進出場和資金不足被取消的開倉
+    data_df = generate_ohlcv(5000, 'h', start='2019-01-01', seed=11, volatility=0.01)
+    rng = np.random.default_rng(0)
+    entries, exits = rng.random((2, len(data_df))) < 0.05
+    open_, close = data_df['Open'].to_numpy(), data_df['Close'].to_numpy()
+    single = _simulate_long_only(open_, close, entries[None], exits[None], cash, 0.001)
+    matrix = _simulate_long_only(open_, close, np.stack([entries] * 2), np.stack([exits] * 2), cash, 0.001)
+    assert np.array_equal(single['equity'][0], matrix['equity'][0])
+    for key in ['entry_bar', 'exit_bar', 'size', 'entry_price', 'exit_price', 'pnl']:
+        filled = matrix['entry_bar'][0] >= 0
+        assert np.array_equal(single[key][0], matrix[key][0][filled], equal_nan=True), key
+    assert (matrix['entry_bar'][0] < 0).any() == (cash < 100000) # 第二組確實出現了被取消的開倉
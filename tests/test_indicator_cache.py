@@ -0,0 +1,41 @@
+# tests/test_indicator_cache.py
+# 緩存鍵必須包含閉包捕獲的值、預設參數和綁定的實例，否則不同參數的指標會互相覆蓋。
+import functools
+
+import numpy as np
+import pandas as pd
+
+from indicator_cache import IndicatorCache
+
+CLOSE = np.cumsum(np.random.default_rng(0).normal(0, 1, 500)) + 100
+
+def _sma_of(n):
+    return lambda s: pd.Series(s).rolling(n).mean()
+
+def test_closures_differing_only_in_captured_value():
+    cache = IndicatorCache()
+    fast = cache.call(_sma_of(5), CLOSE)
+    slow = cache.call(_sma_of(30), CLOSE)
+    assert cache.misses == 2 and cache.hits == 0
+    assert np.allclose(slow[29:], pd.Series(CLOSE).rolling(30).mean().to_numpy()[29:])
+    assert not np.allclose(fast[29:], slow[29:])
+    cache.call(_sma_of(5), CLOSE)
+    assert cache.hits == 1
+
+def test_defaults_and_partials_are_part_of_the_key():
+    cache = IndicatorCache()
+    def sma(s, n=5):
+        return pd.Series(s).rolling(n).mean()
+    first = cache.call(sma, CLOSE)
+    sma.__defaults__ = (30,)
+    assert cache.misses == 1 and not np.allclose(first[29:], cache.call(sma, CLOSE)[29:])
+    assert cache.misses == 2
+    cache.call(functools.partial(sma, n=10), CLOSE)
+    cache.call(functools.partial(sma, n=20), CLOSE)
+    assert cache.misses == 4
+
+def test_unfingerprintable_closure_bypasses_cache():
+    cache = IndicatorCache()
+    state = {'n': 5}
+    cache.call(lambda s: pd.Series(s).rolling(state['n']).mean(), CLOSE)
+    assert cache.bypassed == 1 and cache.misses == 0
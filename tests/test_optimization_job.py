@@ -0,0 +1,53 @@
+# tests/test_optimization_job.py
+# 工作單元認領：同一單元同一時刻只能有一個持有者，過期認領只能被一個進程接手。
+import json
+import os
+import time
+
+import pytest
+
+from optimization_job import _claim_path, _try_claim, _unit_claims
+
+LEASE = 60
+
+@pytest.fixture
+def job_dir(tmp_path):
+    for sub in ('claims', 'results'):
+        os.makedirs(tmp_path / sub)
+    return str(tmp_path)
+
+def _abandon(job_dir, unit, generation=0):
+    path = _claim_path(job_dir, unit, generation)
+    with open(path, 'w') as f:
+        json.dump({'worker': 'crashed'}, f)
+    os.utime(path, (time.time() - 2 * LEASE, time.time() - 2 * LEASE))
+    return path
+
+def test_fresh_claim_is_exclusive(job_dir):
+    assert _try_claim(job_dir, 0, 'a', LEASE) == _claim_path(job_dir, 0, 0)
+    assert _try_claim(job_dir, 0, 'b', LEASE) is None
+
+def test_stale_claim_is_taken_over_once(job_dir):
+    stale = _abandon(job_dir, 1)
+    claim = _try_claim(job_dir, 1, 'a', LEASE)
+    assert claim == _claim_path(job_dir, 1, 1)
+    assert not os.path.exists(stale)
+    # 另一個進程稍後才處理同一個過期認領：只能看到 a 的新認領，不能刪除或接手它
+    assert _try_claim(job_dir, 1, 'b', LEASE) is None
+    assert [path for _, path in _unit_claims(job_dir, 1)] == [claim]
+
+def test_concurrent_takeover_of_same_generation(job_dir, monkeypatch):
+    # a 和 b 都在對方動作前判定第 0 代已過期：只有先建立第 1 代的 a 成功，b 不會刪除 a 的認領
+    _abandon(job_dir, 2)
+    listing = _unit_claims(job_dir, 2)
+    monkeypatch.setattr('optimization_job._unit_claims', lambda *args: list(listing))
+    claim = _try_claim(job_dir, 2, 'a', LEASE)
+    assert claim == _claim_path(job_dir, 2, 1)
+    assert _try_claim(job_dir, 2, 'b', LEASE) is None
+    with open(claim) as f:
+        assert json.load(f)['worker'] == 'a'
+
+def test_completed_unit_is_not_claimed(job_dir):
+    open(os.path.join(job_dir, 'results', 'unit-000003.parquet'), 'w').close()
+    assert _try_claim(job_dir, 3, 'a', LEASE) is None
+    assert _unit_claims(job_dir, 3) == []
@@ -0,0 +1,44 @@
+# tests/test_paper_trader.py
+# 模擬交易的回放結果應與離線回測一致：增量信號路徑 (indicators.py) 和每根 K 線重建策略的路徑
+# (依賴 backtesting 的私有接口 _util._Data、Strategy._indicators) 都要對照。
+import asyncio
+
+import pytest
+
+from backtester import run_backtest
+from paper_trader import ReplayExchange, run_paper_trading
+from strategies.simple_ma_strategy import MaCrossStrategy
+from strategies.simple_rsi_strategy import RsiStrategy
+from synthetic_data import generate_ohlcv
+
+N_BARS = 200
+CASES = [(MaCrossStrategy, {'n1': 10, 'n2': 20}), (RsiStrategy, {'rsi_period': 7})]
+
+@pytest.fixture(scope='module')
+def replay():
+    return {'BTC/USDT': generate_ohlcv(N_BARS, seed=1, start='2024-01-01', volatility=0.005)}
+
+def test_replay_matches_backtest(replay):
+    async def run_all():
+        return await asyncio.gather(*[
+            run_paper_trading(list(replay), strategy_class, timeframe='1m', exchange=ReplayExchange(replay, speed=6000),
+                              max_bars=N_BARS - 1, strategy_params=params, history_bars=100, warmup_bars=0,
+                              poll_interval=0.01, streaming=streaming, verbose=False)
+            for strategy_class, params in CASES for streaming in (True, False)])
+
+    summaries = iter(asyncio.run(run_all()))
+    for strategy_class, params in CASES:
+        stats = run_backtest(replay['BTC/USDT'].iloc[:-1], strategy_class, plot_results=False, **params)
+        assert stats['# Trades'] > 0
+        for _ in (True, False):
+            summary = next(summaries).loc['BTC/USDT']
+            assert summary['closed_trades'] == stats['# Trades']
+            assert summary['equity'] == pytest.approx(stats['Equity Final [$]'], rel=1e-9)
+
+def test_subclass_with_own_logic_falls_back_to_rebuild():
+    class Custom(MaCrossStrategy):
+        def next(self):
+            pass
+
+    assert MaCrossStrategy.streaming_signals({}) is not None
+    assert Custom.streaming_signals({}) is None
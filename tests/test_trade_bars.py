@@ -0,0 +1,55 @@
+# tests/test_trade_bars.py
+# 成交 K 線增量緩存：追加寫入時續傳，檔案被替換或改寫時重新聚合。
+import os
+
+import numpy as np
+import pandas as pd
+
+from trade_bars import bars_from_trade_csv, update_trade_bars
+
+def _trades(seed, n_trades=20000):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'id': np.arange(n_trades),
+        'price': np.round(30000 * np.exp(np.cumsum(rng.normal(0, 2e-5, n_trades))), 2),
+        'qty': np.round(rng.exponential(0.05, n_trades), 3) + 0.001,
+        'time': 1700000000000 + np.cumsum(rng.integers(1, 100, n_trades)),
+    })
+
+def _assert_same_bars(bars, trades_path):
+    full, _ = bars_from_trade_csv(trades_path, 'volume', 25.0)
+    assert bars.index.equals(full.index)
+    assert np.allclose(bars.to_numpy(), full.to_numpy())
+
+def test_append_resumes(tmp_path):
+    trades_path = os.path.join(tmp_path, 'trades.csv')
+    frame = _trades(1)
+    frame.iloc[:10000].to_csv(trades_path, index=False)
+    update_trade_bars(trades_path, 'volume', 25.0, cache_dir=tmp_path, chunksize=3000)
+    frame.iloc[10000:].to_csv(trades_path, mode='a', header=False, index=False)
+    _assert_same_bars(update_trade_bars(trades_path, 'volume', 25.0, cache_dir=tmp_path, chunksize=3000),
+                      trades_path)
+
+def test_replaced_file_is_reaggregated(tmp_path):
+    trades_path = os.path.join(tmp_path, 'trades.csv')
+    _trades(1).to_csv(trades_path, index=False)
+    update_trade_bars(trades_path, 'volume', 25.0, cache_dir=tmp_path)
+    # 換成另一份更大的成交記錄：只比較大小會把它當作追加
+    _trades(2, 25000).to_csv(trades_path, index=False)
+    _assert_same_bars(update_trade_bars(trades_path, 'volume', 25.0, cache_dir=tmp_path), trades_path)
+
+def test_same_size_rewrite_is_reaggregated(tmp_path):
+    trades_path = os.path.join(tmp_path, 'trades.csv')
+    _trades(1).to_csv(trades_path, index=False)
+    update_trade_bars(trades_path, 'volume', 25.0, cache_dir=tmp_path)
+    size, mtime = os.path.getsize(trades_path), os.path.getmtime(trades_path)
+    # 原地改寫中間一筆成交的數量：大小和首尾內容都不變
+    with open(trades_path, 'rb') as f:
+        data = bytearray(f.read())
+    pos = data.index(b',0.', size // 2) + 1
+    data[pos] = ord('9')
+    with open(trades_path, 'wb') as f:
+        f.write(data)
+    os.utime(trades_path, (mtime + 5, mtime + 5))
+    assert os.path.getsize(trades_path) == size
+    _assert_same_bars(update_trade_bars(trades_path, 'volume', 25.0, cache_dir=tmp_path), trades_path)
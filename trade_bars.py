@@ -0,0 +1,494 @@
+# trade_bars.py
+# 由逐筆成交聚合出信息驅動的 K 線：tick (固定成交筆數)、volume (固定成交量)、dollar (固定成交額)
+# 以及秒級的時間 K 線。成交數據可以來自 ccxt 的 fetch_trades 或交易所的成交 CSV 檔案；
+# 檔案按塊流式讀取，內存只與塊大小和輸出的 K 線數量有關，可以處理遠大於內存的成交檔案。
+# 輸出與 run_backtest 需要的格式相同 (索引為 DatetimeIndex，列為 Open/High/Low/Close/Volume)。
+# TradeBarAggregator 保存最後一根未完成的 K 線，to_dict() / from_dict() 用於保存狀態並在之後從斷點繼續。
+import csv
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from config import TRADE_BARS_CONFIG
+from data_handler import OHLCV_COLUMNS, _parse_time_column, timeframe_to_ms
+
+BAR_TYPES = ('tick', 'volume', 'dollar', 'time')
+# 成交量累計到門檻的 (1 - 此值) 倍即視為達到，避免 0.1 這樣的批量成交因浮點累加誤差多等一筆
+THRESHOLD_RTOL = 1e-9
+
+# 成交 CSV 的欄位名稱 (小寫)，按優先順序排列
+TRADE_TIME_COLUMNS = ['timestamp', 'time', 'transact_time', 'trade_time', 'datetime', 'date']
+TRADE_PRICE_COLUMNS = ['price', 'px']
+TRADE_AMOUNT_COLUMNS = ['amount', 'qty', 'quantity', 'size', 'volume', 'base_volume']
+TRADE_ID_COLUMNS = ['id', 'trade_id', 'agg_trade_id', 'tradeid']
+# Binance 公開數據 (data.binance.vision) 的成交檔案沒有表頭，以欄位位置指定
+BINANCE_TRADES_COLUMNS = {'id': 0, 'price': 1, 'amount': 2, 'timestamp': 4}
+BINANCE_AGG_TRADES_COLUMNS = {'id': 0, 'price': 1, 'amount': 2, 'timestamp': 5}
+
+def parse_bar_spec(spec):
+    """
+    解析 'volume:100'、'dollar:5e6'、'tick:500'、'time:5s' 這樣的 K 線規格。
+
+    返回:
+    - tuple: (bar_type, threshold)。tick 的門檻為整數，volume/dollar 為浮點數，time 為週期字串。
+
+    異常:
+    - ValueError: 規格無效。
+    """
+    bar_type, _, threshold = str(spec).partition(':')
+    bar_type = bar_type.strip().lower()
+    if bar_type not in BAR_TYPES or not threshold:
+        raise ValueError(f"無效的 K 線規格 '{spec}'，格式為 <{'|'.join(BAR_TYPES)}>:<門檻>，例如 'volume:100'")
+    if bar_type == 'time':
+        return bar_type, threshold.strip()
+    return bar_type, int(float(threshold)) if bar_type == 'tick' else float(threshold)
+
+def _bars_frame(times_ms, values):
+    """由開盤時間 (毫秒) 和 OHLCV 數組構造與 run_backtest 輸入相同格式的 DataFrame。"""
+    index = pd.DatetimeIndex(np.asarray(times_ms, dtype='int64').astype('datetime64[ms]'), name='timestamp')
+    return pd.DataFrame(np.asarray(values, dtype=float).reshape(-1, len(OHLCV_COLUMNS)), index=index,
+                        columns=OHLCV_COLUMNS)
+
+class TradeBarAggregator:
+    """
+    把按時間排序的成交流增量聚合為 K 線，每次 update() 返回這一批成交中完成的 K 線。
+
+    - tick: 每 threshold 筆成交一根。
+    - volume / dollar: 成交量 (或成交額 = 價格 x 數量) 自上一根收盤起累計達到 threshold 時收盤，
+      達到門檻的那一筆成交計入當前 K 線 (不拆分成交)。
+    - time: threshold 為週期字串 (例如 '1s'、'5s'、'1m')，桶邊界按 UTC 紀元對齊；沒有成交的時段不產生 K 線。
+
+    time K 線的時間索引為桶的開始時間，其他類型為第一筆成交的時間 (同一毫秒內可能完成多根 K 線，索引會重複)。
+    向量化計算：每塊成交只在 Python 中對每根完成的 K 線循環一次 (volume/dollar 用 searchsorted 找收盤位置)，
+    不逐筆循環；按任意方式分塊輸入，得到的 K 線都相同。
+    """
+    def __init__(self, bar_type='volume', threshold=100.0):
+        if bar_type not in BAR_TYPES:
+            raise ValueError(f"不支持的 K 線類型 '{bar_type}'，可選: {', '.join(BAR_TYPES)}")
+        if bar_type == 'time':
+            self.step_ms = timeframe_to_ms(threshold)
+        elif not threshold > 0:
+            raise ValueError(f"K 線門檻必須為正數: {threshold}")
+        else:
+            self.step_ms = None
+        self.bar_type = bar_type
+        self.threshold = int(threshold) if bar_type == 'tick' else threshold
+        self.partial = None  # 未完成的 K 線: {'start', 'open', 'high', 'low', 'close', 'volume', 'measure', 'ticks'}
+        self.last_timestamp = None  # 已處理的最新成交時間 (毫秒)
+        self.last_ids = []  # 時間等於 last_timestamp 的成交編號，用於續傳時去除重疊的成交
+        self.rows_consumed = 0  # 傳入過的成交行數 (含被丟棄的無效行)，用於在同一個檔案中續讀
+        self.n_bars = 0  # 已完成的 K 線數量
+
+    def update(self, timestamps, prices, amounts, ids=None):
+        """
+        輸入一批成交，返回其中完成的 K 線。
+
+        參數:
+        - timestamps (array-like): 成交時間 (毫秒)。
+        - prices, amounts (array-like): 成交價格與數量。價格非正、數量為負或為 NaN 的成交會被丟棄。
+        - ids (array-like, optional): 成交編號。提供時，與上一批最後一毫秒重疊的重複成交會被去除；
+                                     否則只丟棄早於已處理時間的成交。
+
+        返回:
+        - pd.DataFrame: 已完成的 K 線 (可能為空)。
+        """
+        timestamps = np.asarray(timestamps, dtype='int64')
+        prices = np.asarray(prices, dtype=float)
+        amounts = np.asarray(amounts, dtype=float)
+        ids = None if ids is None else np.asarray(ids)
+        self.rows_consumed += len(timestamps)
+
+        keep = (prices > 0) & (amounts >= 0) & np.isfinite(prices) & np.isfinite(amounts)
+        if self.last_timestamp is not None:
+            keep &= timestamps >= self.last_timestamp
+            if ids is not None and self.last_ids:
+                # 編號以字串比較 (JSON 狀態中的編號為字串)，只轉換與上次最後一毫秒相同的少數成交
+                overlap = np.flatnonzero(timestamps == self.last_timestamp)
+                keep[overlap[np.isin(ids[overlap].astype(str), self.last_ids)]] = False
+        if not keep.all():
+            timestamps, prices, amounts = timestamps[keep], prices[keep], amounts[keep]
+            ids = None if ids is None else ids[keep]
+        if len(timestamps) > 1 and (np.diff(timestamps) < 0).any():
+            order = np.argsort(timestamps, kind='stable')
+            timestamps, prices, amounts = timestamps[order], prices[order], amounts[order]
+            ids = None if ids is None else ids[order]
+        if not len(timestamps):
+            return _bars_frame([], [])
+
+        last_ts = int(timestamps[-1])
+        same_ms = timestamps == last_ts
+        previous_ids = self.last_ids if last_ts == self.last_timestamp else []
+        self.last_ids = previous_ids + ids[same_ms].astype(str).tolist() if ids is not None else []
+        self.last_timestamp = last_ts
+        return self._aggregate(timestamps, prices, amounts)
+
+    def _bar_ends(self, timestamps, measure):
+        """返回這一批成交中各根完成的 K 線最後一筆成交的位置，以及 time K 線的桶開始時間。"""
+        n = len(timestamps)
+        if self.bar_type == 'time':
+            buckets = timestamps // self.step_ms * self.step_ms
+            # 時間 K 線在下一個桶的第一筆成交到達時才收盤，最後一個桶總是未完成
+            return np.flatnonzero(buckets[1:] != buckets[:-1]), buckets
+        if self.bar_type == 'tick':
+            first = self.threshold - (self.partial['ticks'] if self.partial else 0)
+            return np.arange(first - 1, n, self.threshold), None
+        cumulative = np.cumsum(measure)
+        target = self.threshold * (1 - THRESHOLD_RTOL)
+        base = -self.partial['measure'] if self.partial else 0.0
+        ends = []
+        while True:
+            end = int(np.searchsorted(cumulative, base + target, side='left'))
+            if end >= n:
+                break
+            ends.append(end)
+            base = cumulative[end]
+        return np.array(ends, dtype='int64'), None
+
+    def _aggregate(self, timestamps, prices, amounts):
+        n = len(timestamps)
+        if self.bar_type == 'dollar':
+            measure = prices * amounts
+        elif self.bar_type == 'volume':
+            measure = amounts
+        else:
+            measure = np.ones(n)
+        ends, buckets = self._bar_ends(timestamps, measure)
+        starts = np.r_[0, ends + 1]
+        if starts[-1] >= n:
+            starts = starts[:-1]
+        group_ends = np.r_[starts[1:], n] - 1
+        times = (buckets if buckets is not None else timestamps)[starts]
+        values = np.empty((len(starts), len(OHLCV_COLUMNS)))
+        values[:, 0] = prices[starts]
+        values[:, 1] = np.maximum.reduceat(prices, starts)
+        values[:, 2] = np.minimum.reduceat(prices, starts)
+        values[:, 3] = prices[group_ends]
+        values[:, 4] = np.add.reduceat(amounts, starts)
+        group_measure = np.add.reduceat(measure, starts)
+        group_ticks = group_ends - starts + 1
+
+        closed_times, closed_values = [], []
+        partial = self.partial
+        if partial is not None:
+            if self.bar_type == 'time' and partial['start'] != times[0]:
+                # 新成交已進入下一個時間桶，上一批留下的 K 線收盤
+                closed_times.append(partial['start'])
+                closed_values.append([partial[key] for key in ('open', 'high', 'low', 'close', 'volume')])
+            else:
+                times[0] = partial['start']
+                values[0, 0] = partial['open']
+                values[0, 1] = max(values[0, 1], partial['high'])
+                values[0, 2] = min(values[0, 2], partial['low'])
+                values[0, 4] += partial['volume']
+                group_measure[0] += partial['measure']
+                group_ticks[0] += partial['ticks']
+
+        n_closed = len(ends)
+        if n_closed < len(starts):
+            last = len(starts) - 1
+            self.partial = {'start': int(times[last]), 'open': float(values[last, 0]),
+                            'high': float(values[last, 1]), 'low': float(values[last, 2]),
+                            'close': float(values[last, 3]), 'volume': float(values[last, 4]),
+                            'measure': float(group_measure[last]), 'ticks': int(group_ticks[last])}
+        else:
+            self.partial = None
+        times = np.r_[np.asarray(closed_times, dtype='int64'), times[:n_closed]]
+        values = np.vstack([np.asarray(closed_values, dtype=float).reshape(-1, len(OHLCV_COLUMNS)), values[:n_closed]])
+        self.n_bars += len(times)
+        return _bars_frame(times, values)
+
+    def partial_bar(self):
+        """返回未完成的最後一根 K 線 (0 或 1 行的 DataFrame)，不改變狀態。"""
+        if self.partial is None:
+            return _bars_frame([], [])
+        return _bars_frame([self.partial['start']],
+                           [[self.partial[key] for key in ('open', 'high', 'low', 'close', 'volume')]])
+
+    def flush(self):
+        """把未完成的 K 線當作已收盤返回並清除 (例如成交數據已經結束時)。"""
+        bar = self.partial_bar()
+        self.partial = None
+        self.n_bars += len(bar)
+        return bar
+
+    def to_dict(self):
+        """返回可 JSON 序列化的狀態字典。"""
+        state = {name: getattr(self, name) for name in ('bar_type', 'threshold', 'partial', 'last_timestamp',
+                                                          'last_ids', 'rows_consumed', 'n_bars')}
+        return {'type': type(self).__name__, 'state': state}
+
+    @classmethod
+    def from_dict(cls, data):
+        """由 to_dict() 的結果恢復聚合器。"""
+        state = data['state']
+        obj = cls(state['bar_type'], state['threshold'])
+        for name, value in state.items():
+            setattr(obj, name, value)
+        return obj
+
+def _sniff_trade_header(file_path, max_lines=5):
+    """找出成交 CSV 的表頭行並對應欄位，返回 (表頭前需跳過的行數, {角色: 原欄位名})。找不到表頭時返回 (0, None)。"""
+    with open(file_path, newline='') as f:
+        lines = [line for _, line in zip(range(max_lines), csv.reader(f))]
+    for skiprows, header in enumerate(lines):
+        lower = {col.strip().lower(): col for col in header}
+        columns = {}
+        for role, candidates in (('timestamp', TRADE_TIME_COLUMNS), ('price', TRADE_PRICE_COLUMNS),
+                                 ('amount', TRADE_AMOUNT_COLUMNS), ('id', TRADE_ID_COLUMNS)):
+            original = next((lower[name] for name in candidates if name in lower), None)
+            if original is not None:
+                columns[role] = original
+        if all(role in columns for role in ('timestamp', 'price', 'amount')):
+            return skiprows, columns
+    return 0, None
+
+def iter_trade_csv_chunks(file_path, chunksize=1000000, columns=None, skip_rows=0):
+    """
+    分塊讀取成交 CSV 檔案，每塊只讀時間、價格、數量和成交編號四列。
+
+    參數:
+    - file_path (str): 成交 CSV 檔案路徑。
+    - chunksize (int): 每塊的行數。
+    - columns (dict, optional): {'timestamp', 'price', 'amount', 'id'(可選)} 到欄位名或欄位位置的對應。
+                                為 None 時從表頭識別；沒有表頭的檔案必須指定，
+                                例如 BINANCE_TRADES_COLUMNS 或 BINANCE_AGG_TRADES_COLUMNS。
+    - skip_rows (int): 跳過表頭之後的前若干行數據 (續讀時傳入 TradeBarAggregator.rows_consumed)。
+
+    返回:
+    - generator: 逐塊產生 (毫秒時間戳, 價格, 數量, 成交編號或 None) 四個 numpy 數組。
+                 無法轉換為數字的價格/數量為 NaN，由 TradeBarAggregator 丟棄 (行數仍計入 rows_consumed)。
+
+    異常:
+    - ValueError: 找不到必要的欄位。
+    """
+    if columns is None:
+        header_row, columns = _sniff_trade_header(file_path)
+        if columns is None:
+            raise ValueError("成交 CSV 缺少表頭或必要的欄位 (時間、價格、數量)，請用 columns 參數指定欄位位置。")
+        header = 0
+        skiprows = ((lambda i: i < header_row or header_row < i <= header_row + skip_rows) if skip_rows
+                    else header_row)
+    else:
+        missing = [role for role in ('timestamp', 'price', 'amount') if role not in columns]
+        if missing:
+            raise ValueError(f"columns 缺少必要的欄位: {missing}")
+        header = None if all(isinstance(col, int) for col in columns.values()) else 0
+        skiprows = (lambda i: 0 < i <= skip_rows) if header == 0 and skip_rows else skip_rows
+    reader = pd.read_csv(file_path, header=header, skiprows=skiprows, usecols=list(columns.values()),
+                         chunksize=chunksize)
+    for chunk in reader:
+        timestamps = _parse_time_column(chunk[columns['timestamp']])
+        yield (timestamps.values.astype('datetime64[ms]').astype('int64'),
+               pd.to_numeric(chunk[columns['price']], errors='coerce').to_numpy(dtype=float),
+               pd.to_numeric(chunk[columns['amount']], errors='coerce').to_numpy(dtype=float),
+               chunk[columns['id']].to_numpy() if 'id' in columns else None)
+
+def bars_from_trade_csv(file_path, bar_type='volume', threshold=100.0, chunksize=1000000, columns=None,
+                        aggregator=None, include_partial=True):
+    """
+    流式讀取成交 CSV 檔案並聚合為 K 線。
+
+    參數:
+    - file_path (str): 成交 CSV 檔案路徑。
+    - bar_type (str): 'tick'、'volume'、'dollar' 或 'time'。
+    - threshold: 每根 K 線的成交筆數、成交量、成交額或週期字串 (例如 '5s')。
+    - chunksize (int): 每塊讀取的成交行數。
+    - columns (dict, optional): 欄位對應，見 iter_trade_csv_chunks。
+    - aggregator (TradeBarAggregator, optional): 上次處理同一檔案後保存的聚合器。提供時跳過已處理的行，
+                                                從未完成的 K 線繼續 (bar_type 和 threshold 以聚合器為準)。
+    - include_partial (bool): 結果是否包含最後一根未完成的 K 線 (聚合器仍保留它，之後可以繼續)。
+
+    返回:
+    - tuple: (K 線 DataFrame, 聚合器)。如果出錯則返回 None。
+    """
+    try:
+        if aggregator is None:
+            aggregator = TradeBarAggregator(bar_type, threshold)
+        parts = [aggregator.update(*chunk) for chunk in
+                 iter_trade_csv_chunks(file_path, chunksize, columns, skip_rows=aggregator.rows_consumed)]
+    except FileNotFoundError:
+        print(f"錯誤: 找不到檔案 {file_path}")
+        return None
+    except ValueError as e:
+        print(f"錯誤: 無法從 {file_path} 聚合成交數據。({e})")
+        return None
+    if include_partial:
+        parts.append(aggregator.partial_bar())
+    bars = pd.concat(parts) if parts else _bars_frame([], [])
+    return bars, aggregator
+
+def _trade_bars_paths(file_path, bar_type, threshold, cache_dir):
+    """以檔案路徑和 K 線規格生成緩存檔名 (K 線 Parquet 和聚合器狀態 JSON)。"""
+    key = f"{os.path.abspath(file_path)}|{bar_type}:{threshold}"
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    base = os.path.join(cache_dir, f"{os.path.splitext(os.path.basename(file_path))[0]}-{bar_type}-{digest}")
+    return base + '.parquet', base + '.json'
+
+def _file_fingerprint(file_path, size, block_size=65536):
+    """
+    計算檔案前 size 個字節的指紋：首尾各 block_size 字節的雜湊。
+
+    只追加寫入的檔案，已處理部分的首尾內容不變；被替換的檔案即使大小不變或變大，
+    首尾內容通常也會不同。
+    """
+    digest = hashlib.blake2b(str(size).encode('utf-8'), digest_size=16)
+    with open(file_path, 'rb') as f:
+        digest.update(f.read(min(block_size, size)))
+        if size > block_size:
+            f.seek(max(block_size, size - block_size))
+            digest.update(f.read(size - f.tell()))
+    return digest.hexdigest()
+
+def update_trade_bars(file_path, bar_type='volume', threshold=100.0, cache_dir=None, chunksize=1000000,
+                      columns=None, include_partial=True):
+    """
+    增量地把成交 CSV 檔案聚合為 K 線並緩存。檔案只被追加時 (例如持續寫入的成交記錄)，
+    再次調用只讀取新增的行，從上次未完成的 K 線繼續；檔案變小或被替換時重新聚合。
+    狀態中記錄已處理部分的大小、修改時間和首尾內容指紋：指紋不符 (檔案被替換)、
+    或大小不變但修改時間改變 (原地改寫) 時都會重新聚合。
+
+    參數:
+    - file_path, bar_type, threshold, chunksize, columns, include_partial: 同 bars_from_trade_csv。
+    - cache_dir (str, optional): 緩存目錄，預設為 config.TRADE_BARS_CONFIG['cache_dir']。
+
+    返回:
+    - pd.DataFrame: 全部 K 線。如果出錯則返回 None。
+    """
+    cache_dir = cache_dir or TRADE_BARS_CONFIG['cache_dir']
+    bars_path, state_path = _trade_bars_paths(file_path, bar_type, threshold, cache_dir)
+    if not os.path.exists(file_path):
+        print(f"錯誤: 找不到檔案 {file_path}")
+        return None
+    file_size, file_mtime = os.path.getsize(file_path), os.path.getmtime(file_path)
+
+    aggregator, cached = None, None
+    if os.path.exists(state_path) and os.path.exists(bars_path):
+        with open(state_path) as f:
+            saved = json.load(f)
+        if ('fingerprint' in saved and saved['file_size'] <= file_size
+                and not (saved['file_size'] == file_size and saved['file_mtime'] != file_mtime)
+                and _file_fingerprint(file_path, saved['file_size']) == saved['fingerprint']):
+            aggregator = TradeBarAggregator.from_dict(saved['aggregator'])
+            cached = pd.read_parquet(bars_path)
+        else:
+            print(f"{file_path} 已被替換或改寫，重新聚合。")
+    if aggregator is not None and saved['file_size'] == file_size:
+        new_bars = _bars_frame([], [])
+    else:
+        result = bars_from_trade_csv(file_path, bar_type, threshold, chunksize, columns, aggregator,
+                                     include_partial=False)
+        if result is None:
+            return None
+        new_bars, aggregator = result
+        print(f"從 {file_path} 聚合了 {len(new_bars)} 根新的 {bar_type} K 線 (累計 {aggregator.rows_consumed} 筆成交)。")
+
+    bars = pd.concat([cached, new_bars]) if cached is not None and len(new_bars) else (
+        cached if cached is not None else new_bars)
+    if len(new_bars) or cached is None:
+        os.makedirs(cache_dir, exist_ok=True)
+        bars.to_parquet(bars_path + '.tmp')
+        os.replace(bars_path + '.tmp', bars_path)
+    with open(state_path + '.tmp', 'w') as f: # 狀態最後寫入，與已寫入的 K 線一致
+        json.dump({'file_size': file_size, 'file_mtime': file_mtime,
+                   'fingerprint': _file_fingerprint(file_path, file_size), 'aggregator': aggregator.to_dict()}, f)
+    os.replace(state_path + '.tmp', state_path)
+    if include_partial:
+        bars = pd.concat([bars, aggregator.partial_bar()])
+    return bars
+
+def fetch_trade_bars(symbol='BTC/USDT', bar_type='volume', threshold=100.0, exchange=None, exchange_id='binance',
+                     api_key=None, secret_key=None, since=None, aggregator=None, batch_limit=1000, max_requests=100):
+    """
+    以 `since` 游標分頁拉取 ccxt 的 fetch_trades 成交並聚合為 K 線。
+
+    參數:
+    - symbol (str): 交易對。
+    - bar_type, threshold: K 線類型與門檻，見 TradeBarAggregator。
+    - exchange (ccxt.Exchange, optional): 已建立的交易所實例；為 None 時使用共用客戶端。
+    - exchange_id, api_key, secret_key: 建立共用客戶端所需的參數。
+    - since (int, optional): 起始時間戳 (毫秒)。提供 aggregator 時從它處理過的最新成交繼續。
+    - aggregator (TradeBarAggregator, optional): 上次保存的聚合器，用於增量繼續。
+    - batch_limit (int): 每次請求的成交數量上限。
+    - max_requests (int): 最多請求次數 (交易所通常只提供近期的成交)。
+
+    返回:
+    - tuple: (已完成的 K 線 DataFrame, 聚合器)。請求出錯時返回出錯前已完成的 K 線，聚合器可用於下次繼續。
+    """
+    import ccxt
+    from exchange_client import get_exchange_client
+
+    if aggregator is None:
+        aggregator = TradeBarAggregator(bar_type, threshold)
+    cursor = aggregator.last_timestamp if aggregator.last_timestamp is not None else since
+    parts = []
+    try:
+        if exchange is None:
+            exchange = get_exchange_client(exchange_id, api_key, secret_key)
+        if not exchange.has['fetchTrades']:
+            print(f"交易所 {exchange_id} 不支援 fetchTrades 功能。")
+            return _bars_frame([], []), aggregator
+        for _ in range(max_requests):
+            trades = exchange.fetch_trades(symbol, since=cursor, limit=batch_limit)
+            if not trades:
+                break
+            rows_before, last_before = aggregator.rows_consumed, (aggregator.last_timestamp, len(aggregator.last_ids))
+            parts.append(aggregator.update([t['timestamp'] for t in trades], [t['price'] for t in trades],
+                                           [t['amount'] for t in trades], [t['id'] for t in trades]))
+            if (aggregator.last_timestamp, len(aggregator.last_ids)) == last_before:
+                break # 這一批全是已處理過的成交，沒有更新的數據了
+            cursor = aggregator.last_timestamp
+            if aggregator.rows_consumed - rows_before < batch_limit:
+                break
+    except ccxt.NetworkError as e:
+        print(f"CCXT 網路錯誤: {e}")
+    except ccxt.ExchangeError as e:
+        print(f"CCXT 交易所錯誤: {e}")
+    except Exception as e:
+        print(f"獲取成交數據時發生未知錯誤: {e}")
+    bars = pd.concat(parts) if parts else _bars_frame([], [])
+    return bars, aggregator
+
+if __name__ == '__main__':
+    # 隨機成交流：分塊聚合與一次性聚合的結果一致，續傳 (保存/恢復狀態) 的結果也一致
+    import tempfile
+    import time
+
+    rng = np.random.default_rng(3)
+    n_trades = 2000000
+    timestamps = 1700000000000 + np.cumsum(rng.exponential(50, n_trades)).astype('int64')
+    prices = 30000 * np.exp(np.cumsum(rng.normal(0, 2e-5, n_trades)))
+    amounts = np.round(rng.exponential(0.05, n_trades), 3) + 0.001
+    ids = np.arange(n_trades)
+
+    for bar_type, threshold in [('tick', 500), ('volume', 25.0), ('dollar', 1e6), ('time', '5s')]:
+        start = time.perf_counter()
+        whole = TradeBarAggregator(bar_type, threshold)
+        expected = pd.concat([whole.update(timestamps, prices, amounts, ids), whole.flush()])
+        seconds = time.perf_counter() - start
+
+        restored, parts = TradeBarAggregator(bar_type, threshold), []
+        bounds = np.sort(rng.choice(n_trades, 30, replace=False))
+        for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, n_trades]):
+            # 每塊之後把狀態寫成 JSON 再恢復，並故意重送上一塊的最後 10 筆成交
+            restored = TradeBarAggregator.from_dict(json.loads(json.dumps(restored.to_dict())))
+            lo = max(lo - 10, 0)
+            parts.append(restored.update(timestamps[lo:hi], prices[lo:hi], amounts[lo:hi], ids[lo:hi]))
+        chunked = pd.concat(parts + [restored.flush()])
+        same = chunked.index.equals(expected.index) and np.allclose(chunked.to_numpy(), expected.to_numpy(), rtol=1e-12)
+        print(f"{bar_type:>6}:{threshold!s:<9} {len(expected):>6} 根 K 線，{seconds:.3f} 秒，"
+              f"分塊續傳與一次性聚合{'一致' if same else '不一致'}，總成交量 "
+              f"{'一致' if np.isclose(expected['Volume'].sum(), amounts.sum()) else '不一致'}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        trades_path = os.path.join(tmp, 'trades.csv')
+        frame = pd.DataFrame({'id': ids, 'price': prices, 'qty': amounts, 'time': timestamps})
+        half = n_trades // 2
+        frame.iloc[:half].to_csv(trades_path, index=False)
+        update_trade_bars(trades_path, 'volume', 25.0, cache_dir=tmp, chunksize=300000)
+        frame.iloc[half:].to_csv(trades_path, mode='a', header=False, index=False)
+        incremental = update_trade_bars(trades_path, 'volume', 25.0, cache_dir=tmp, chunksize=300000)
+        full, _ = bars_from_trade_csv(trades_path, 'volume', 25.0, chunksize=700000)
+        print(f"追加寫入後增量聚合 {len(incremental)} 根 K 線，與重新聚合"
+              f"{'一致' if np.allclose(incremental.to_numpy(), full.to_numpy()) else '不一致'}")
@@ -38,6 +38,47 @@ def rsi_indicator(series: pd.Series, n: int = 14) -> pd.Series:
     rsi = 100 - (100 / (1 + rs))
     return rsi
 
+def ema_indicator(series: pd.Series, n: int = 20) -> pd.Series:
+    """
+    計算指數移動平均 (EMA)，平滑係數為 2 / (n + 1)，第一個值即為起始值。
+
+    參數:
+    - series (pd.Series): 收盤價序列。
+    - n (int): EMA 週期 (span)，預設為20。
+
+    返回:
+    - pd.Series: EMA 值序列。
+    """
+    if not isinstance(series, pd.Series):
+        series = pd.Series(series)
+    return series.ewm(span=n, adjust=False).mean()
+
+def rsi_wilder_indicator(series: pd.Series, n: int = 14) -> pd.Series:
+    """
+    以 Wilder 平滑 (alpha = 1/n 的指數平均) 計算 RSI。
+    前 n-1 個值與 rsi_indicator 一樣以 RSI=50 填充。
+
+    參數:
+    - series (pd.Series): 收盤價序列。
+    - n (int): RSI的計算週期，預設為14。
+
+    返回:
+    - pd.Series: RSI 值序列。
+    """
+    if not isinstance(series, pd.Series):
+        series = pd.Series(series)
+
+    delta = series.diff()
+    gain = (delta.where(delta > 0, 0)).ewm(alpha=1 / n, adjust=False, min_periods=n).mean()
+    loss = (-delta.where(delta < 0, 0)).ewm(alpha=1 / n, adjust=False, min_periods=n).mean()
+
+    rs = gain / loss
+    rs = rs.replace([float('inf'), -float('inf')], 1000)
+    rs = rs.fillna(1)
+
+    rsi = 100 - (100 / (1 + rs))
+    return rsi
+
 if __name__ == '__main__':
     # 測試 RSI 指標函數
     data = {'Close': [10, 12, 11, 13, 15, 14, 16, 17, 18, 15, 14, 13, 15, 17, 19, 20, 18, 17]}
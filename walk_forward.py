@@ -0,0 +1,187 @@
+# walk_forward.py
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from sweep import STATS_COLUMNS, _evaluate_range, _period_sampling, _simulate_long_only, _summarize
+
+# 工作進程中已映射的數組: 名稱 -> 只讀 memmap (open/close/index/indicators)
+_WORKER_ARRAYS = {}
+
+def make_folds(n_bars, n_folds=5, train_size=None, test_size=None, anchored=False):
+    """
+    把 n_bars 根 K 線切分為連續的訓練/測試折，測試區間首尾相接、互不重疊。
+
+    參數:
+    - n_bars (int): 數據長度。
+    - n_folds (int): 折數 (僅在 train_size 或 test_size 未指定時用於推算區間長度)。
+    - train_size (int, optional): 訓練區間長度 (K 線數)。預設為剩餘長度，未指定 test_size 時約為測試區間的 4 倍。
+    - test_size (int, optional): 測試區間長度。預設由 n_folds 推算。
+    - anchored (bool): True 時訓練區間總是從第 0 根開始並逐折擴大；False 時為固定長度的滾動窗口。
+
+    返回:
+    - list[tuple]: 每折的 (train_start, train_stop, test_start, test_stop)，均為左閉右開的位置。
+    """
+    if test_size is None:
+        test_size = (n_bars - train_size) // n_folds if train_size is not None else n_bars // (n_folds + 4)
+    if train_size is None:
+        train_size = n_bars - n_folds * test_size
+    if train_size <= 0 or test_size <= 0:
+        print(f"錯誤: 數據長度 {n_bars} 不足以切分訓練/測試區間 (train_size={train_size}, test_size={test_size})")
+        return []
+    folds = []
+    for test_start in range(train_size, n_bars, test_size):
+        test_stop = min(test_start + test_size, n_bars)
+        if test_stop - test_start < 2:
+            break
+        train_start = 0 if anchored else test_start - train_size
+        folds.append((train_start, test_start, test_start, test_stop))
+    return folds
+
+def _publish_arrays(arrays, directory):
+    """把數組寫成 .npy 檔案一次，供所有工作進程以 memmap 共享。"""
+    paths = {}
+    for name, array in arrays.items():
+        paths[name] = os.path.join(directory, f'{name}.npy')
+        np.save(paths[name], np.ascontiguousarray(array))
+    return paths
+
+def _attach_arrays(paths):
+    """工作進程初始化：以只讀 memmap 方式映射所有數組。"""
+    for name, path in paths.items():
+        _WORKER_ARRAYS[name] = np.load(path, mmap_mode='r')
+
+def _run_fold(model, fold, cash, commission, maximize, chunk_size, arrays=None):
+    """
+    在訓練區間上評估 model 的全部參數組合，選出 maximize 最高的一組並在測試區間上模擬。
+    指標矩陣是完整序列上預先算好的，這裡只做切片。
+    """
+    arrays = _WORKER_ARRAYS if arrays is None else arrays
+    open_, close, matrix = arrays['open'], arrays['close'], arrays['indicators']
+    index = pd.DatetimeIndex(arrays['index'])
+    train_start, train_stop, test_start, test_stop = fold
+
+    train = _evaluate_range(open_, close, index, model, matrix, model.params, train_start, train_stop,
+                            cash, commission, chunk_size)
+    train = train.sort_values(maximize, ascending=False, na_position='last')
+    best = model.params.iloc[[train.index[0]]]
+
+    entries, exits = model.signals(matrix, best, test_start, test_stop)
+    sim = _simulate_long_only(open_[test_start:test_stop], close[test_start:test_stop], entries, exits,
+                              cash, commission)
+    sample_positions, annual_trading_days = _period_sampling(index[test_start:test_stop])
+    stats = _summarize(sim, test_stop - test_start, sample_positions, annual_trading_days)
+    return {
+        'fold': fold,
+        'params': best.to_dict('records')[0],
+        'train_score': train[maximize].iloc[0],
+        'stats': {col: stats[col][0] for col in STATS_COLUMNS},
+        'sim': {key: value[0] for key, value in sim.items()},
+    }
+
+def _stitch(results, index, cash):
+    """
+    把各測試折的權益曲線按複利首尾相接：每折都從 cash 開始模擬，
+    拼接時乘上之前所有折的累計增長倍數 (相當於上一折結束時按收盤價結算後全部轉入下一折)。
+    """
+    equity, pnl, return_pct, entry_bar, exit_bar, closed = [], [], [], [], [], []
+    growth = 1.0
+    offset = 0
+    for result in results:
+        sim = result['sim']
+        equity.append(sim['equity'] * growth)
+        pnl.append(sim['pnl'] * growth)
+        return_pct.append(sim['return_pct'])
+        entry_bar.append(np.where(sim['entry_bar'] >= 0, sim['entry_bar'] + offset, -1))
+        exit_bar.append(np.where(sim['exit_bar'] >= 0, sim['exit_bar'] + offset, -1))
+        closed.append(sim['closed'])
+        growth *= sim['equity'][-1] / cash
+        offset += len(sim['equity'])
+    stitched = {'equity': np.concatenate(equity), 'pnl': np.concatenate(pnl),
+                'return_pct': np.concatenate(return_pct), 'entry_bar': np.concatenate(entry_bar),
+                'exit_bar': np.concatenate(exit_bar), 'closed': np.concatenate(closed)}
+    sample_positions, annual_trading_days = _period_sampling(index)
+    stats = _summarize({key: value[None, :] for key, value in stitched.items()}, len(index),
+                       sample_positions, annual_trading_days)
+    return (pd.Series(stitched['equity'], index=index, name='Equity'),
+            pd.Series({col: stats[col][0] for col in STATS_COLUMNS}))
+
+def walk_forward(data_df: pd.DataFrame, model, n_folds=5, train_size=None, test_size=None, anchored=False,
+                 maximize='Sharpe Ratio', cash=100000, commission=0.001, n_workers=None, chunk_size=128):
+    """
+    向量化的滾動 (或錨定) 前推分析：在每個訓練區間上掃描 model 的全部參數，
+    用最優參數交易緊接著的測試區間，並把所有測試區間拼接成樣本外權益曲線。
+    指標只在完整序列上計算一次，各折直接切片 (測試區間開頭因此不需要重新預熱)；
+    各折在進程池中並行，價格與指標矩陣以 memmap 檔案共享給工作進程。
+
+    參數:
+    - data_df (pd.DataFrame): 與 run_backtest 相同格式的 OHLCV 數據。
+    - model (sweep.MaCrossSignals | sweep.RsiSignals): 帶參數網格的信號模型。
+    - n_folds, train_size, test_size, anchored: 折的切分方式，見 make_folds。
+    - maximize (str): 在訓練區間上選擇參數的統計列名。
+    - cash (float): 初始資金 (每個測試折都從這個金額開始模擬，拼接時按複利換算)。
+    - commission (float): 手續費率。
+    - n_workers (int, optional): 工作進程數。預設為 CPU 核心數與折數的較小值；1 表示在當前進程中順序執行。
+    - chunk_size (int): 每次同時模擬的參數組合數。
+
+    返回:
+    - dict: 'folds' (每折一行：區間起止時間、所選參數、訓練區間的 maximize 值與測試區間的 STATS_COLUMNS)、
+            'equity' (樣本外權益曲線 pd.Series)、'stats' (樣本外整體統計 pd.Series)；
+            數據不足以切分時返回 None。
+    """
+    folds = make_folds(len(data_df), n_folds, train_size, test_size, anchored)
+    if not folds:
+        return None
+    close = data_df['Close'].to_numpy(dtype=float)
+    arrays = {'open': data_df['Open'].to_numpy(dtype=float), 'close': close,
+              'index': data_df.index.values, 'indicators': model.indicators(close)}
+
+    n_workers = min(n_workers or os.cpu_count() or 1, len(folds))
+    if n_workers == 1:
+        results = [_run_fold(model, fold, cash, commission, maximize, chunk_size, arrays) for fold in folds]
+    else:
+        directory = tempfile.mkdtemp(prefix='walk_forward_')
+        try:
+            paths = _publish_arrays(arrays, directory)
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=_attach_arrays, initargs=(paths,)) as executor:
+                results = list(executor.map(_run_fold, [model] * len(folds), folds, [cash] * len(folds),
+                                            [commission] * len(folds), [maximize] * len(folds),
+                                            [chunk_size] * len(folds)))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    index = data_df.index
+    rows = []
+    for number, result in enumerate(results):
+        train_start, train_stop, test_start, test_stop = result['fold']
+        rows.append({'fold': number, 'train_start': index[train_start], 'train_end': index[train_stop - 1],
+                     'test_start': index[test_start], 'test_end': index[test_stop - 1],
+                     **result['params'], f'Train {maximize}': result['train_score'], **result['stats']})
+    equity, stats = _stitch(results, index[folds[0][2]:folds[-1][3]], cash)
+    return {'folds': pd.DataFrame(rows), 'equity': equity, 'stats': stats}
+
+if __name__ == '__main__':
+    # 用隨機遊走價格測試前推分析，並確認並行與順序執行的結果相同
+    import time
+    from sweep import MaCrossSignals, RsiSignals
+    from synthetic_data import generate_ohlcv
+
+    test_df = generate_ohlcv(3 * 365 * 24, 'h', start='2021-01-01', seed=7, volatility=0.01)
+
+    ma_model = MaCrossSignals(range(5, 51, 5), range(10, 201, 10))
+    for n_workers in (1, None):
+        start = time.perf_counter()
+        report = walk_forward(test_df, ma_model, n_folds=8, n_workers=n_workers)
+        print(f"MA 前推分析 (n_workers={n_workers})，耗時 {time.perf_counter() - start:.2f} 秒")
+    print(report['folds'][['fold', 'test_start', 'n1', 'n2', 'Train Sharpe Ratio', 'Return [%]', '# Trades']])
+    print(report['stats'])
+
+    sequential = walk_forward(test_df, ma_model, n_folds=8, n_workers=1)
+    print(f"並行與順序結果一致 = {sequential['equity'].equals(report['equity'])}")
+
+    rsi_report = walk_forward(test_df, RsiSignals(range(7, 29, 7), (20, 30), (70, 80)), n_folds=8, anchored=True)
+    print(rsi_report['folds'][['fold', 'train_start', 'test_start', 'rsi_period', 'oversold_threshold',
+                               'overbought_threshold', 'Return [%]']])